@@ -1,23 +1,146 @@
 import os
 import logging
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from typing import TYPE_CHECKING, Dict, Tuple
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+from ..utils.structured_logging import configure_logging
+from ..utils.supabase_pool import SupabaseClientRegistry, LazySupabaseClient
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 # Load environment variables
 env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.env"))
 load_dotenv(env_path)
 
+def parse_float_map(value: str) -> Dict[str, float]:
+    """Parse a setting like "a=0.1,b=2" into {"a": 0.1, "b": 2.0}."""
+    return {
+        key.strip(): float(number)
+        for key, _, number in (item.rpartition("=") for item in value.split(",") if item.strip())
+    }
+
+def parse_rate_limits(value: str) -> Dict[str, Tuple[float, float]]:
+    """Parse a setting like "/a=10:5,/b=2:1" into {"/a": (10.0, 5.0), "/b": (2.0, 1.0)}."""
+    limits = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        key, _, numbers = item.rpartition("=")
+        per_minute, _, burst = numbers.partition(":")
+        limits[key.strip()] = (float(per_minute), float(burst or per_minute))
+    return limits
+
+# Logging settings
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
+# Fraction of INFO/DEBUG records to keep per logger, e.g. "app.routes.reminder=0.1"
+LOG_SAMPLE_RATES = parse_float_map(os.getenv("LOG_SAMPLE_RATES", ""))
+# Maximum records per second per logger
+LOG_RATE_LIMITS = parse_float_map(os.getenv("LOG_RATE_LIMITS", "app.routes.reminder=20"))
+# Fraction of request/response payload dumps to log
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 0))
+
+# Configure logging: records are queued and written by a background thread
+log_listener = configure_logging(
+    level=LOG_LEVEL,
+    json_format=LOG_FORMAT == "json",
+    sample_rates=LOG_SAMPLE_RATES,
+    rate_limits=LOG_RATE_LIMITS,
+    payload_sample_rate=LOG_PAYLOAD_SAMPLE_RATE,
+)
+logger = logging.getLogger(__name__)
+
 # Clerk settings
 CLERK_SECRET_KEY = os.getenv("CLERK_SECRET_KEY")
 if not CLERK_SECRET_KEY:
     logger.warning("CLERK_SECRET_KEY not found in environment variables")
+CLERK_WEBHOOK_SECRET = os.getenv("CLERK_WEBHOOK_SECRET")
+CLERK_API_URL = os.getenv("CLERK_API_URL", "https://api.clerk.com/v1")
+# Session token verification
+CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL", "https://api.clerk.com/v1/jwks")
+CLERK_ISSUER = os.getenv("CLERK_ISSUER")  # e.g. https://your-app.clerk.accounts.dev
+CLERK_AUTHORIZED_PARTIES = [origin.strip() for origin in os.getenv("CLERK_AUTHORIZED_PARTIES", "").split(",") if origin.strip()]
 # Supabase settings
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+# Fast startup: defer every external connection until first use or the readiness probe
+FAST_STARTUP = os.getenv("FAST_STARTUP", "false").lower() in ("1", "true", "yes")
+
+# Shared connection pool for Supabase table and storage calls
+SUPABASE_POOL_MAX_CONNECTIONS = int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", 50))
+SUPABASE_POOL_MAX_KEEPALIVE = int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", 20))
+SUPABASE_POOL_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY", 30))
+SUPABASE_HEALTH_CHECK_INTERVAL = float(os.getenv("SUPABASE_HEALTH_CHECK_INTERVAL", 60))
+
+# Local data directory for queues and indexes
+DATA_DIR = os.getenv("DATA_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data")))
+
+# Webhook queue settings
+WEBHOOK_QUEUE_PATH = os.getenv("WEBHOOK_QUEUE_PATH", os.path.join(DATA_DIR, "webhook_events.db"))
+
+# Storage quota per user in bytes, across all recordings; 0 for no quota
+STORAGE_QUOTA_BYTES = int(os.getenv("STORAGE_QUOTA_BYTES", 0))
+
+# Purges of deleted users' recordings: paths per storage list and remove request, and remove requests in flight
+STORAGE_PURGE_BATCH_SIZE = int(os.getenv("STORAGE_PURGE_BATCH_SIZE", 1000))
+STORAGE_PURGE_CONCURRENCY = int(os.getenv("STORAGE_PURGE_CONCURRENCY", 8))
+
+# Full-text index of recording notes and tags
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", os.path.join(DATA_DIR, "search_index.db"))
+
+# Rate limits per client (user, or IP address without a session token): requests per minute and burst, by path
+RATE_LIMITS = parse_rate_limits(os.getenv(
+    "RATE_LIMITS",
+    "/prompts/generate=10:5,/prompts/generate/stream=10:5,/prompts/batch=4:2,/recordings/upload=30:10,/recordings/upload/sign=30:10",
+))
+# Requests in progress per client, by path
+RATE_LIMIT_CONCURRENCY = {path: int(limit) for path, limit in parse_float_map(os.getenv("RATE_LIMIT_CONCURRENCY", "/recordings/upload=2")).items()}
+
+# Cached recording list, calendar and tag responses
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Responses smaller than this are sent uncompressed
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", 1024))
+
+# Recording export settings
+# Files fetched from storage ahead of the one being streamed, and the chunk size of each fetch
+EXPORT_PREFETCH = int(os.getenv("EXPORT_PREFETCH", 2))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 256 * 1024))
+EXPORT_CHECKSUM_PATH = os.getenv("EXPORT_CHECKSUM_PATH", os.path.join(DATA_DIR, "export_checksums.db"))
+
+# Background job settings
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(DATA_DIR, "jobs.db"))
+# "embedded" runs a job worker in each API process, "external" leaves jobs to `python run.py worker`
+JOB_WORKER_MODE = os.getenv("JOB_WORKER_MODE", "embedded")
+# "thread" or "process"; a process pool keeps CPU-heavy jobs off the worker's interpreter lock
+JOB_WORKER_POOL = os.getenv("JOB_WORKER_POOL", "thread")
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", 4))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1))
+# A running job whose lease went this long without being renewed is assumed lost and run again
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 300))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+
+# Scheduler settings
+# "embedded" runs the scheduler in the API workers, "external" leaves it to `python run.py scheduler`
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "embedded")
+# How processes agree on which one runs the jobs: "file" (one host), "database" (any number of hosts) or "none"
+SCHEDULER_ELECTION = os.getenv("SCHEDULER_ELECTION", "file")
+SCHEDULER_LOCK_PATH = os.getenv("SCHEDULER_LOCK_PATH", os.path.join(DATA_DIR, "scheduler.lock"))
+SCHEDULER_LEASE_TTL = float(os.getenv("SCHEDULER_LEASE_TTL", 30))
+SCHEDULER_ELECTION_INTERVAL = float(os.getenv("SCHEDULER_ELECTION_INTERVAL", 10))
+# Where scheduled jobs reach the API
+API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+
+# Admin token for POST /import-users; the endpoint is off unless it is set
+USER_IMPORT_TOKEN = os.getenv("USER_IMPORT_TOKEN")
+
+# Profiling settings; profiling is off unless a token or a sample rate is set
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+# Per-route sample rates, e.g. "/prompts/generate=0.01,/recordings/upload=0.1"
+PROFILE_SAMPLE_RATES = parse_float_map(os.getenv("PROFILE_SAMPLE_RATES", ""))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+PROFILE_MAX_REPORTS = int(os.getenv("PROFILE_MAX_REPORTS", 100))
 
 # CORS settings
 CORS_ORIGINS = [
@@ -26,18 +149,26 @@ CORS_ORIGINS = [
     # Add more origins as needed
 ]
 
-# Initialize Supabase client
-def get_supabase_client() -> Client:
-    """Initialize and return the Supabase client."""
+# Shared Supabase client, created on first use
+supabase_registry = SupabaseClientRegistry(
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    max_connections=SUPABASE_POOL_MAX_CONNECTIONS,
+    max_keepalive_connections=SUPABASE_POOL_MAX_KEEPALIVE,
+    keepalive_expiry=SUPABASE_POOL_KEEPALIVE_EXPIRY,
+)
+
+def get_supabase_client() -> "Client":
+    """
+    Return the process-wide Supabase client.
+    
+    The client is created lazily on first use, so holding the returned
+    object at import time opens no connections.
+    """
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise ValueError("Missing Supabase configuration. Check your .env file.")
     
-    try:
-        client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        return client
-    except Exception as e:
-        logger.error(f"Failed to initialize Supabase client: {str(e)}")
-        raise
+    return LazySupabaseClient(supabase_registry)
 
 # Validate configuration
 def validate_config():
@@ -45,7 +176,15 @@ def validate_config():
     if not all([SUPABASE_URL, SUPABASE_KEY, CLERK_SECRET_KEY]):
         raise ValueError("Missing required environment variables. Check your .env file.")
     
-    # Test Supabase connection
-    get_supabase_client()
+    # In fast startup mode the client is built on first use or by the readiness probe
+    if FAST_STARTUP:
+        return True
+    
+    # Build the shared Supabase client
+    try:
+        supabase_registry.get()
+    except Exception as e:
+        logger.error(f"Failed to initialize Supabase client: {str(e)}")
+        raise
     
     return True 
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+Background jobs and the worker that runs them.
+
+API endpoints only queue jobs (a single SQLite insert), so they return right
+away; the work itself runs in a job worker, either inside each API process
+("embedded" mode) or in processes started with `python run.py worker`. The
+queue is a file in DATA_DIR, shared by every process on the host, and jobs
+survive restarts.
+"""
+
+import asyncio
+import importlib
+import inspect
+import signal
+from typing import Dict, Iterable
+
+from .config.settings import (
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_POLL_INTERVAL,
+    JOB_QUEUE_PATH,
+    JOB_WORKER_CONCURRENCY,
+    JOB_WORKER_POOL,
+    logger,
+    supabase_registry,
+    validate_config,
+)
+from .utils.event_queue import EventQueue
+from .utils.job_queue import JobQueue, JobWorker
+from .utils.metrics import job_duration_seconds
+
+# Job name -> handler, as "module:function" so route modules can queue jobs
+# without an import cycle, and process pool workers import only what they run
+JOB_HANDLERS = {
+    "sync_users": f"{__package__}.routes.sync:perform_user_sync",
+    "check_reminders": f"{__package__}.routes.reminder:queue_reminder_emails",
+    "send_reminder_email": f"{__package__}.routes.reminder:send_reminder_email",
+    "reconcile_storage_usage": f"{__package__}.routes.recordings:reconcile_storage_usage",
+    "rebuild_search_index": f"{__package__}.routes.recordings:rebuild_search_index",
+    "purge_user_recordings": f"{__package__}.routes.recordings:purge_user_recordings",
+    "sweep_orphaned_recordings": f"{__package__}.routes.recordings:sweep_orphaned_recordings",
+    "sweep_expired_uploads": f"{__package__}.routes.recordings:sweep_expired_uploads",
+}
+
+# Jobs doing the work of a scheduled job -> the scheduled job's name. The
+# scheduler only queues them, so their runs here are what the
+# scheduler_job_duration_seconds metric times and arm_job() profiles.
+SCHEDULED_JOBS = {
+    "sync_users": "sync_users_job",
+    "reconcile_storage_usage": "reconcile_storage_usage_job",
+    "rebuild_search_index": "rebuild_search_index_job",
+    "sweep_orphaned_recordings": "sweep_orphaned_recordings_job",
+    "sweep_expired_uploads": "sweep_expired_uploads_job",
+    "check_reminders": "check_reminders",
+}
+
+job_queue = JobQueue(EventQueue(JOB_QUEUE_PATH, max_attempts=JOB_MAX_ATTEMPTS, lease_seconds=JOB_LEASE_SECONDS))
+
+def queue_recording_purges(user_ids: Iterable[str]) -> int:
+    """Queue the removal of the recordings of deleted users, one job per user."""
+    return job_queue.enqueue_many(
+        ("purge_user_recordings", {"user_id": user_id}, f"purge_user_recordings:{user_id}")
+        for user_id in user_ids
+        if user_id
+    )
+
+def execute_job(name: str, payload: Dict, profile: bool = False):
+    """
+    Run one job in the calling thread. Used as the pool function of the worker.
+
+    Coroutine handlers get an event loop of their own. Raising marks the job
+    as failed so it is retried. With `profile`, the run is saved as a profile
+    of its scheduled job.
+    """
+    target = JOB_HANDLERS.get(name)
+    if target is None:
+        raise ValueError(f"Unknown job: {name}")
+    module_name, function_name = target.split(":")
+    handler = getattr(importlib.import_module(module_name), function_name)
+
+    def run():
+        if inspect.iscoroutinefunction(handler):
+            return asyncio.run(handler(**payload))
+        return handler(**payload)
+
+    if profile:
+        # Imported here, as route modules import this module
+        from .routes.profiling import profiler
+        return profiler.profile_call(SCHEDULED_JOBS.get(name, name), run)
+    return run()
+
+def observe_scheduled_job(name: str, outcome: str, seconds: float):
+    """Record a run of a scheduled job's work under the scheduled job's name."""
+    scheduled = SCHEDULED_JOBS.get(name)
+    if scheduled is not None:
+        job_duration_seconds.observe(seconds, job=scheduled, outcome=outcome)
+
+def should_profile_job(name: str) -> bool:
+    """Whether a job does the work of a scheduled job armed for profiling."""
+    scheduled = SCHEDULED_JOBS.get(name)
+    if scheduled is None:
+        return False
+    from .routes.profiling import profiler
+    return profiler.take_armed_job(scheduled)
+
+def create_worker(pool: str = JOB_WORKER_POOL, concurrency: int = JOB_WORKER_CONCURRENCY) -> JobWorker:
+    """Create a worker for the shared job queue."""
+    return JobWorker(
+        job_queue,
+        execute_job,
+        concurrency=concurrency,
+        pool=pool,
+        poll_interval=JOB_POLL_INTERVAL,
+        observe=observe_scheduled_job,
+        should_profile=should_profile_job,
+    )
+
+async def run_worker_process():
+    """Run a job worker as its own process until SIGINT or SIGTERM."""
+    validate_config()
+
+    worker = create_worker()
+    worker.start()
+    logger.info(f"Worker process started (queue: {JOB_QUEUE_PATH})")
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopped.set)
+
+    await stopped.wait()
+
+    logger.info("Worker process shutting down")
+    await worker.stop()
+    supabase_registry.close()
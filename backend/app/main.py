@@ -1,26 +1,70 @@
+import time
+
+# Record how long each startup phase takes
+startup_started = time.perf_counter()
+startup_timings = {}
+_phase_started = startup_started
+
+def record_startup_phase(name: str):
+    """Record the time since the previous phase ended as the duration of `name`."""
+    global _phase_started
+    now = time.perf_counter()
+    startup_timings[f"{name}_ms"] = (now - _phase_started) * 1000
+    _phase_started = now
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
 import asyncio
-import aiohttp
 import os
 
-from .config.settings import CORS_ORIGINS, validate_config, logger
+record_startup_phase("framework_import")
+
+from .config.settings import (
+    CORS_ORIGINS,
+    FAST_STARTUP,
+    JOB_WORKER_MODE,
+    RATE_LIMIT_CONCURRENCY,
+    RATE_LIMITS,
+    SCHEDULER_MODE,
+    SUPABASE_HEALTH_CHECK_INTERVAL,
+    supabase_registry,
+    validate_config,
+    logger,
+)
+
+record_startup_phase("config_import")
+
 from .routes import (
     users_router,
     test_router,
     sync_router,
     prompts_router,
     recordings_router,
+    webhooks_router,
+    health_router,
+    profiling_router,
+    export_router,
+    profiling,
     recordings,
-    reminder
+    reminder,
+    webhooks,
+    users
 )
-from .routes.sync import perform_user_sync
+from .jobs import create_worker, job_queue
+from .scheduler import SchedulerService
+from .utils.auth import verified_user_id
+from .utils.metrics import MetricsMiddleware, registry as metrics_registry
+from .utils.profiling import ProfilingMiddleware
+from .utils.rate_limit import RateLimitMiddleware, RouteLimit
+
+record_startup_phase("routes_import")
 
-# Validate configuration
+# Validate configuration (in fast startup mode this makes no connections)
 validate_config()
 
+record_startup_phase("validate_config")
+
 # Initialize FastAPI app
 app = FastAPI(
     title="MyCorner API",
@@ -28,6 +72,18 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Refuse clients over the limits of expensive routes with 429, before their request body is read.
+# Added first so it runs inside CORS (browsers can read the 429) and the metrics middleware (429s are counted)
+if RATE_LIMITS or RATE_LIMIT_CONCURRENCY:
+    app.add_middleware(
+        RateLimitMiddleware,
+        limits={
+            path: RouteLimit(*RATE_LIMITS.get(path, (0, 0)), concurrency=RATE_LIMIT_CONCURRENCY.get(path, 0))
+            for path in set(RATE_LIMITS) | set(RATE_LIMIT_CONCURRENCY)
+        },
+        identify=verified_user_id,
+    )
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -35,10 +91,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
-# Initialize scheduler
-scheduler = AsyncIOScheduler()
+# Record per-route latency, status codes and in-flight requests
+app.add_middleware(MetricsMiddleware)
+
+# Profile requests on demand; not installed at all unless a profiling token or sample rate is set
+if profiling.profiler.requests_enabled:
+    app.add_middleware(ProfilingMiddleware, profiler=profiling.profiler)
+
+# Scheduler for the cron jobs; in the embedded mode every worker joins the election and only the leader runs them
+scheduler_service = SchedulerService() if SCHEDULER_MODE == "embedded" else None
+
+# Worker for queued background jobs; in the external mode they run in `python run.py worker` instead
+job_worker = create_worker() if JOB_WORKER_MODE == "embedded" else None
 
 # Include routers
 app.include_router(users_router)
@@ -46,60 +113,64 @@ app.include_router(test_router)
 app.include_router(sync_router)
 app.include_router(prompts_router)
 app.include_router(recordings_router, prefix="/recordings", tags=["recordings"])
-app.include_router(recordings.router)
 app.include_router(reminder.router)
+app.include_router(webhooks_router)
+app.include_router(health_router)
+app.include_router(profiling_router)
+app.include_router(export_router)
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Expose request, upstream and scheduler job metrics in Prometheus text format."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
-async def check_reminders():
-    """Check for reminders that need to be sent."""
-    try:
-        logger.info("Running reminder check...")
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "http://localhost:8000/reminder/check-reminders",
-                headers={"Content-Type": "application/json"}
-            ) as response:
-                if response.status != 200:
-                    logger.error(f"Error checking reminders: {await response.text()}")
-                else:
-                    result = await response.json()
-                    logger.info(f"Reminder check completed successfully: {result}")
-    except Exception as e:
-        logger.error(f"Error in check_reminders scheduler: {str(e)}")
+record_startup_phase("app_setup")
 
 # Log application startup
 @app.on_event("startup")
 async def startup_event():
-    logger.info("Application started")
+    startup_timings["total_ms"] = (time.perf_counter() - startup_started) * 1000
+    logger.info(f"Application started (fast startup: {FAST_STARTUP}), timings: " + ", ".join(f"{name}={value:.1f}" for name, value in startup_timings.items()))
     
-    # Schedule the user synchronization task to run daily at 3:00 AM
-    scheduler.add_job(
-        perform_user_sync,
-        CronTrigger(hour=22, minute=7),  # Run at 3:00 AM every day
-        id="sync_users_job",
-        name="Sync users between Clerk and Supabase",
-        replace_existing=True,
-    )
+    # Start processing queued webhook events
+    webhooks.start_webhook_worker()
     
-    # Add job to check reminders every minute
-    scheduler.add_job(
-        check_reminders,
-        trigger=CronTrigger(minute="*"),
-        id="check_reminders",
-        name="Check and send reminders",
-        replace_existing=True
-    )
+    # Start running queued background jobs
+    if job_worker is not None:
+        job_worker.start()
+    
+    # Build the search index on a fresh host; workers starting together queue it once
+    if recordings.search_index.count() == 0:
+        job_queue.enqueue("rebuild_search_index", job_id=f"rebuild_search_index:{time.strftime('%Y%m%d')}")
     
-    # Start the scheduler
-    scheduler.start()
-    logger.info("Scheduler started")
+    # Start flushing debounced user profile writes
+    users.user_writes.start()
     
-    # Log all scheduled jobs
-    for job in scheduler.get_jobs():
-        logger.info(f"Scheduled job: {job.name} (next run: {job.next_run_time})")
+    # Periodically check the shared Supabase connection pool
+    supabase_registry.start_health_checks(SUPABASE_HEALTH_CHECK_INTERVAL)
+    
+    # Run the cron jobs if this worker wins the scheduler election
+    if scheduler_service is not None:
+        scheduler_service.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Application shutting down")
     
-    # Shut down the scheduler
-    scheduler.shutdown() 
\ No newline at end of file
+    # Shut down the scheduler, handing leadership to another worker
+    if scheduler_service is not None:
+        await scheduler_service.stop()
+    
+    # Stop the webhook worker; unprocessed events stay in the queue
+    await webhooks.stop_webhook_worker()
+    
+    # Stop the job worker; queued jobs wait for the next start or another worker
+    if job_worker is not None:
+        await job_worker.stop()
+    
+    # Write out any buffered user profile updates
+    await users.user_writes.stop()
+    
+    # Close the shared Supabase connections last, after the final writes
+    await supabase_registry.stop_health_checks()
+    supabase_registry.close() 
\ No newline at end of file
@@ -7,6 +7,10 @@ from .users import router as users_router
 from .test import router as test_router
 from .sync import router as sync_router
 from .prompts import router as prompts_router
+from .webhooks import router as webhooks_router
+from .health import router as health_router
+from .profiling import router as profiling_router
+from .export import router as export_router
 
 __all__ = [
     "recordings_router",
@@ -14,4 +18,8 @@ __all__ = [
     "test_router",
     "sync_router",
     "prompts_router",
+    "webhooks_router",
+    "health_router",
+    "profiling_router",
+    "export_router",
 ] 
\ No newline at end of file
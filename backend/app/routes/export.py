@@ -0,0 +1,217 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import json
+import os
+
+import httpx
+
+from ..config.settings import (
+    EXPORT_CHECKSUM_PATH,
+    EXPORT_CHUNK_SIZE,
+    EXPORT_PREFETCH,
+    get_supabase_client,
+    logger,
+)
+from ..utils.auth import get_current_user
+from ..utils.metrics import track_upstream
+from ..utils.zip_stream import ChecksumCache, ZipEntry, ZipStream
+from .recordings import parse_created_at, storage_path
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+supabase = get_supabase_client()
+
+# CRCs of exported objects, so resumed downloads don't fetch earlier files again
+checksums = ChecksumCache(EXPORT_CHECKSUM_PATH)
+
+PAGE_SIZE = 1000
+
+
+def get_user_recordings(user_id: str) -> List[Dict]:
+    """All recordings rows of a user, oldest first."""
+    rows = []
+    while True:
+        # The end of postgrest's range is exclusive
+        response = supabase.table("recordings").select(
+            "id, created_at, file_url, file_type, size_bytes, note, tags"
+        ).eq("user_id", user_id).order("id").range(len(rows), len(rows) + PAGE_SIZE).execute()
+        rows.extend(response.data or [])
+        if len(response.data or []) < PAGE_SIZE:
+            return rows
+
+
+def get_object_sizes(user_id: str) -> Dict[str, int]:
+    """Sizes of the objects in a user's storage folder, for recordings saved before sizes were stored."""
+    sizes = {}
+    offset = 0
+    while True:
+        objects = supabase.storage.from_("recordings").list(user_id, {"limit": PAGE_SIZE, "offset": offset})
+        for item in objects:
+            size = (item.get("metadata") or {}).get("size")
+            if size is not None:
+                sizes[f"{user_id}/{item['name']}"] = size
+        if len(objects) < PAGE_SIZE:
+            return sizes
+        offset += PAGE_SIZE
+
+
+def build_entries(user_id: str, recordings: List[Dict]) -> List[ZipEntry]:
+    """
+    Archive entries for a user's recordings plus a manifest.
+
+    The same rows always produce the same entries (the manifest holds no
+    export time), so the archive bytes stay stable between a download and
+    its resumption.
+    """
+    paths = {recording["id"]: storage_path(recording.get("file_url") or "") for recording in recordings}
+    missing_sizes = any(recording.get("size_bytes") is None for recording in recordings)
+    listed_sizes = get_object_sizes(user_id) if missing_sizes else {}
+
+    entries = []
+    manifest = []
+    for recording in recordings:
+        path = paths[recording["id"]]
+        size = recording.get("size_bytes")
+        if size is None and path:
+            size = listed_sizes.get(path)
+        created_at = parse_created_at(recording.get("created_at"))
+
+        name = None
+        if path and size is not None:
+            extension = os.path.splitext(path)[1] or ".webm"
+            prefix = created_at.strftime("%Y-%m-%d") + "_" if created_at else ""
+            name = f"recordings/{prefix}{recording['id']}{extension}"
+            entries.append(ZipEntry(name, created_at, size=size, key=path))
+
+        manifest.append({
+            "id": recording["id"],
+            "created_at": recording.get("created_at"),
+            "file_type": recording.get("file_type"),
+            "note": recording.get("note"),
+            "tags": recording.get("tags") or [],
+            "size_bytes": size,
+            # None if the stored file could not be found
+            "file": name,
+        })
+
+    manifest_data = json.dumps({"user_id": user_id, "recordings": manifest}, indent=2, sort_keys=True, default=str).encode("utf-8")
+    latest = max(filter(None, (parse_created_at(recording.get("created_at")) for recording in recordings)), default=None)
+    entries.append(ZipEntry("manifest.json", latest, data=manifest_data))
+    return entries
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    First and last byte of a single-range "Range: bytes=..." header.
+
+    Returns None (send everything) for a missing, malformed or multi-range
+    header, and raises 416 for a range outside the archive.
+    """
+    if not header:
+        return None
+    units, _, spec = header.partition("=")
+    if units.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            # Suffix range: the last N bytes
+            start, end = max(size - int(last), 0), size - 1
+            if int(last) == 0:
+                start = size
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+async def fetch_object(client: httpx.AsyncClient, path: str, offset: int) -> AsyncIterator[bytes]:
+    """Stream a stored recording from a byte offset, in chunks of EXPORT_CHUNK_SIZE."""
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with track_upstream("supabase", "GET storage:export") as call:
+        async with client.stream("GET", f"object/recordings/{path}", headers=headers) as response:
+            if response.status_code >= 400 or (offset and response.status_code != 206):
+                call["outcome"] = "error"
+                raise IOError(f"Failed to fetch {path}: HTTP {response.status_code}")
+            async for chunk in response.aiter_bytes(EXPORT_CHUNK_SIZE):
+                yield chunk
+
+
+async def stream_archive(archive: ZipStream, client: httpx.AsyncClient, start: int, end: int, user_id: str) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in archive.stream(start, end):
+            yield chunk
+    except Exception as e:
+        # Headers are already sent; ending the body early tells the client to resume
+        logger.error(f"Export for user {user_id} aborted at a fetch error: {str(e)}")
+        raise
+    finally:
+        await client.aclose()
+
+
+@router.get("/recordings")
+async def export_recordings(
+    user: Dict = Depends(get_current_user),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+):
+    """
+    Download all of the current user's recordings, with a manifest of their notes and tags, as one ZIP.
+
+    The archive is streamed while the files are fetched from storage, so
+    memory use does not grow with its size. Interrupted downloads can be
+    resumed with a Range header (and If-Range with the ETag).
+    """
+    try:
+        user_id = user["user_id"]
+        recordings = get_user_recordings(user_id)
+        entries = build_entries(user_id, recordings)
+
+        # The client is created once the response is sure to be sent; the stream closes it
+        client: Optional[httpx.AsyncClient] = None
+        archive = ZipStream(
+            entries,
+            lambda path, offset: fetch_object(client, path, offset),
+            checksums=checksums,
+            prefetch=EXPORT_PREFETCH,
+        )
+        etag = archive.etag
+
+        # A resumed download of a changed archive starts over
+        byte_range = parse_range(range_header, archive.size) if not if_range or if_range == etag else None
+        start, end = byte_range or (0, archive.size - 1)
+
+        headers = {
+            "Content-Disposition": 'attachment; filename="mycorner-export.zip"',
+            "Content-Length": str(end - start + 1),
+            "Accept-Ranges": "bytes",
+            "ETag": etag,
+        }
+        if byte_range:
+            headers["Content-Range"] = f"bytes {start}-{end}/{archive.size}"
+
+        storage_session = supabase.storage.session
+        client = httpx.AsyncClient(
+            base_url=str(storage_session.base_url),
+            headers=dict(storage_session.headers),
+            timeout=httpx.Timeout(30.0, read=120.0),
+        )
+        logger.info(f"Exporting {len(entries) - 1} recordings ({archive.size} bytes) for user {user_id}, bytes {start}-{end}")
+
+        return StreamingResponse(
+            stream_archive(archive, client, start, end, user_id),
+            status_code=206 if byte_range else 200,
+            media_type="application/zip",
+            headers=headers,
+        )
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error exporting recordings: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,48 @@
+from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+from ..config.settings import FAST_STARTUP, supabase_registry, logger
+from ..jobs import job_queue
+from .webhooks import webhook_queue
+
+# Initialize router
+router = APIRouter(tags=["health"])
+
+@router.get("/health")
+async def health():
+    """Liveness probe. Makes no external calls."""
+    return {"status": "ok"}
+
+@router.get("/ready")
+async def ready():
+    """
+    Readiness probe.
+    
+    Connects to every external dependency that startup deferred (in fast
+    startup mode this is where the Supabase client gets built) and checks
+    that it answers. Responds with 503 until all checks pass.
+    """
+    checks = {}
+    
+    checks["supabase"] = await run_in_threadpool(supabase_registry.health_check)
+    
+    try:
+        await run_in_threadpool(webhook_queue.counts)
+        checks["webhook_queue"] = True
+    except Exception as e:
+        logger.error(f"Webhook queue not ready: {str(e)}")
+        checks["webhook_queue"] = False
+    
+    try:
+        await run_in_threadpool(job_queue.queue.counts)
+        checks["job_queue"] = True
+    except Exception as e:
+        logger.error(f"Job queue not ready: {str(e)}")
+        checks["job_queue"] = False
+    
+    status_code = 200 if all(checks.values()) else 503
+    return JSONResponse(
+        status_code=status_code,
+        content={"status": "ready" if status_code == 200 else "not ready", "fast_startup": FAST_STARTUP, "checks": checks}
+    )
@@ -0,0 +1,74 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse
+from typing import Optional
+import os
+
+from ..config.settings import (
+    JOB_QUEUE_PATH,
+    PROFILE_DIR,
+    PROFILE_MAX_REPORTS,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_SAMPLE_RATES,
+    PROFILING_TOKEN,
+    logger,
+)
+from ..jobs import SCHEDULED_JOBS
+from ..utils.profiling import ArmedJobs, ProfileStore, Profiler
+
+# Initialize router
+router = APIRouter(prefix="/admin/profiles", tags=["profiling"])
+
+# Shared profiler for requests and scheduled jobs
+profiler = Profiler(
+    ProfileStore(PROFILE_DIR, max_reports=PROFILE_MAX_REPORTS),
+    token=PROFILING_TOKEN,
+    default_sample_rate=PROFILE_SAMPLE_RATE,
+    sample_rates=PROFILE_SAMPLE_RATES,
+    # Armed jobs are kept next to the job queue, where every worker process on the host sees them
+    armed_jobs=ArmedJobs(JOB_QUEUE_PATH),
+)
+
+# Scheduled jobs only queue their work, so the job worker profiles the queued jobs under these names
+for job_name in SCHEDULED_JOBS.values():
+    profiler.register_job(job_name)
+
+def require_profiling_admin(x_profile_token: Optional[str] = Header(None)):
+    """Only allow requests carrying the admin profiling token."""
+    if not profiler.is_admin(x_profile_token):
+        # Don't reveal whether profiling is configured
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@router.get("", dependencies=[Depends(require_profiling_admin)])
+async def list_profiles():
+    """List saved profiles, newest first."""
+    return {"profiles": profiler.store.list(), "jobs": sorted(profiler.jobs)}
+
+@router.get("/{profile_id}", dependencies=[Depends(require_profiling_admin)])
+async def get_profile(profile_id: str, format: str = "text"):
+    """
+    Get a saved profile.
+
+    Args:
+        profile_id: Id from the X-Profile-Id response header or the profile list
+        format: "text" for the call tree report, "pstats" for the raw stats file
+    """
+    try:
+        if format == "pstats":
+            path = profiler.store.path(profile_id, "prof")
+            if not os.path.exists(path):
+                raise KeyError(profile_id)
+            return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+        return PlainTextResponse(profiler.store.report(profile_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+@router.post("/jobs/{job_name}", dependencies=[Depends(require_profiling_admin)])
+async def profile_next_job_run(job_name: str):
+    """Profile the next run of a scheduled job."""
+    try:
+        profiler.arm_job(job_name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_name}")
+
+    logger.info(f"Next run of job {job_name} will be profiled")
+    return {"message": f"Next run of {job_name} will be profiled"}
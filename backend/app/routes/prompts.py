@@ -1,10 +1,17 @@
 from fastapi import APIRouter, HTTPException, Depends, Body
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import Dict, List, Sequence
 import os
-import requests
+import re
+import time
+import httpx
 import json
 from dotenv import load_dotenv
 from ..config.settings import logger
+from ..utils.metrics import track_upstream
+from ..utils.structured_logging import log_payload
+from ..utils.resilience import CircuitBreaker, SingleFlight
 
 # Load environment variables
 load_dotenv()
@@ -14,6 +21,38 @@ OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 if not OPENROUTER_API_KEY:
     logger.warning("OPENROUTER_API_KEY not found in environment variables")
 
+OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+OPENROUTER_MODEL = "deepseek/deepseek-r1:free"  # DeepSeek R1 free model ID
+OPENROUTER_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", 30))
+
+# Serve fallback prompts instead of waiting on OpenRouter while it is failing or slow
+openrouter_breaker = CircuitBreaker(
+    "openrouter",
+    failure_threshold=int(os.getenv("OPENROUTER_BREAKER_FAILURES", 5)),
+    slow_call_threshold=float(os.getenv("OPENROUTER_BREAKER_SLOW_SECONDS", 10)),
+    reset_timeout=float(os.getenv("OPENROUTER_BREAKER_RESET_SECONDS", 30)),
+)
+
+# Concurrent requests for the same prompt type share one OpenRouter call
+prompt_calls = SingleFlight()
+
+# Predefined prompts used when the model response has no usable question
+fallback_prompts = {
+    "reflective questions about your day": "What moments from today made you feel most connected to your authentic self?",
+    "questions about your emotional well-being": "How have your emotions been guiding your decisions lately, and what might they be trying to tell you?",
+    "meaningful self-reflection prompts": "What parts of yourself are you still learning to accept and appreciate?",
+    "gratitude-focused questions": "What unexpected blessing has appeared in your life recently that you haven't fully acknowledged?",
+    "mindfulness and present moment awareness": "What sensations, sounds, or sights are you aware of right now that you might normally overlook?",
+    "personal growth and goals": "What small step could you take today that aligns with your deeper values and aspirations?"
+}
+DEFAULT_FALLBACK_PROMPT = "What insights about yourself have you gained today that might help you grow tomorrow?"
+
+# Upper bound on the number of prompts a single batch request may ask for
+MAX_BATCH_PROMPTS = int(os.getenv("MAX_BATCH_PROMPTS", 30))
+
+# Matches numbered list items such as "1. ...", "2) ..." or "**3.** ..."
+NUMBERED_LINE_PATTERN = re.compile(r"^\W*(\d+)\W*[.):]\**\s*(.+)$")
+
 router = APIRouter(
     prefix="/prompts",
     tags=["prompts"],
@@ -23,46 +62,168 @@ router = APIRouter(
 class PromptRequest(BaseModel):
     promptType: str
 
-@router.post("/generate")
-async def generate_prompt(request: PromptRequest = Body(...)):
+class BatchPromptItem(BaseModel):
+    promptType: str
+    count: int = 1
+
+class BatchPromptRequest(BaseModel):
+    prompts: List[BatchPromptItem]
+
+def get_fallback_prompt(prompt_type: str) -> str:
+    """Get a predefined prompt for the prompt type, or the default one."""
+    return fallback_prompts.get(prompt_type, DEFAULT_FALLBACK_PROMPT)
+
+def is_question_line(line: str) -> bool:
+    """Check whether a line of model output looks like a usable question."""
+    return "?" in line and len(line) > 10 and len(line) < 200
+
+def extract_question(text: str) -> str:
     """
-    Generate a reflective prompt using OpenRouter with DeepSeek R1 free model
+    Extract the first question from model output.
+    
+    This is a simple heuristic - we could make it more sophisticated.
+    
+    Args:
+        text: Model content or reasoning text
+        
+    Returns:
+        str: The first line that looks like a question, or "" if there is none
     """
-    try:
-        # Log the request
-        logger.info(f"Generating prompt for type: {request.promptType}")
+    for line in text.split("\n"):
+        if is_question_line(line):
+            return line.strip()
+    return ""
+
+def extract_numbered_questions(text: str) -> Dict[int, str]:
+    """
+    Extract the questions of a numbered list from model output.
+    
+    Each numbered line is checked with the same heuristic as extract_question.
+    
+    Args:
+        text: Model content or reasoning text
         
-        # Create the system message based on the prompt type
-        system_message = f"You are a helpful assistant that generates thoughtful, meaningful, and heartfelt questions about {request.promptType}. Create a single question that encourages self-reflection and mindfulness without further explanation."
-        
-        # Prepare the request to OpenRouter API
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "HTTP-Referer": "https://mycorner.app",  # Replace with your app domain
-            "X-Title": "MyCorner App"  # Name of your app
-        }
-        
-        # Using the DeepSeek R1 free model ID
-        data = {
-            "model": "deepseek/deepseek-r1:free",  # DeepSeek R1 free model ID
-            "messages": [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": f"Generate a heartfelt question about {request.promptType} that encourages self-reflection."}
-            ],
-            "max_tokens": 300,  # Increased max tokens to get more complete responses
-            "temperature": 0.7,
-        }
-        
-        # Log the request data for debugging
-        logger.debug(f"OpenRouter request data: {json.dumps(data)}")
-        
-        # Call OpenRouter API
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=data
-        )
+    Returns:
+        Dict[int, str]: The first question found for each list number
+    """
+    questions = {}
+    for line in text.split("\n"):
+        match = NUMBERED_LINE_PATTERN.match(line.strip())
+        if not match:
+            continue
+        number = int(match.group(1))
+        question = match.group(2).strip().strip('*"').strip()
+        if number not in questions and is_question_line(question):
+            questions[number] = question
+    return questions
+
+def extract_complete_question(text: str) -> str:
+    """
+    Extract the first question from partially streamed model output.
+    
+    Finished lines are matched like extract_question. The trailing, still
+    growing line only counts once it contains a "?", and is cut after the
+    last one so that text streamed after the question is not included.
+    
+    Args:
+        text: Content or reasoning text received so far
+        
+    Returns:
+        str: The first complete question, or "" if none has arrived yet
+    """
+    *complete_lines, partial_line = text.split("\n")
+    for line in complete_lines:
+        if is_question_line(line):
+            return line.strip()
+    if "?" in partial_line:
+        partial_line = partial_line[:partial_line.rindex("?") + 1]
+        if is_question_line(partial_line):
+            return partial_line.strip()
+    return ""
+
+def build_openrouter_headers() -> dict:
+    """Build the headers for OpenRouter API requests."""
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "HTTP-Referer": "https://mycorner.app",  # Replace with your app domain
+        "X-Title": "MyCorner App"  # Name of your app
+    }
+
+def build_openrouter_request(prompt_type: str, stream: bool = False) -> dict:
+    """Build the chat completion request body for a prompt type."""
+    # Create the system message based on the prompt type
+    system_message = f"You are a helpful assistant that generates thoughtful, meaningful, and heartfelt questions about {prompt_type}. Create a single question that encourages self-reflection and mindfulness without further explanation."
+    
+    data = {
+        "model": OPENROUTER_MODEL,
+        "messages": [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": f"Generate a heartfelt question about {prompt_type} that encourages self-reflection."}
+        ],
+        "max_tokens": 300,  # Increased max tokens to get more complete responses
+        "temperature": 0.7,
+    }
+    if stream:
+        data["stream"] = True
+    return data
+
+def build_openrouter_batch_request(slots: List[str]) -> dict:
+    """
+    Build a chat completion request asking for a numbered list of questions.
+    
+    Args:
+        slots: The prompt type of each question, in list order
+        
+    Returns:
+        dict: The chat completion request body
+    """
+    system_message = "You are a helpful assistant that generates thoughtful, meaningful, and heartfelt questions that encourage self-reflection and mindfulness. Answer with a numbered list of questions only, one per line, without further explanation."
+    
+    items = "\n".join(f"{number}. A question about {prompt_type}" for number, prompt_type in enumerate(slots, start=1))
+    user_message = f"Generate {len(slots)} different heartfelt questions, numbered 1 to {len(slots)}, matching this list:\n{items}"
+    
+    return {
+        "model": OPENROUTER_MODEL,
+        "messages": [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message}
+        ],
+        # The reasoning uses up tokens before the list is written
+        "max_tokens": 300 + 80 * len(slots),
+        "temperature": 0.7,
+    }
+
+def format_sse_event(event: str, data: dict) -> str:
+    """Format a server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def call_openrouter(data: dict) -> dict:
+    """
+    Send a chat completion request to OpenRouter.
+    
+    The outcome and latency of the call are recorded with the circuit breaker;
+    callers check openrouter_breaker.allow_request() before calling.
+    
+    Args:
+        data: The chat completion request body
+        
+    Returns:
+        dict: The message of the first choice
+        
+    Raises:
+        HTTPException: If OpenRouter fails or returns an unexpected response
+    """
+    # Log the request data for debugging
+    log_payload("OpenRouter request", data)
+    
+    start = time.monotonic()
+    try:
+        with track_upstream("openrouter", "chat_completion") as call:
+            async with httpx.AsyncClient(timeout=OPENROUTER_TIMEOUT) as client:
+                response = await client.post(OPENROUTER_API_URL, headers=build_openrouter_headers(), json=data)
+            if response.status_code != 200:
+                call["outcome"] = "error"
         
         # Check if request was successful
         if response.status_code != 200:
@@ -73,62 +234,262 @@ async def generate_prompt(request: PromptRequest = Body(...)):
         response_data = response.json()
         
         # Log full response for debugging 
-        logger.debug(f"OpenRouter response: {json.dumps(response_data)}")
+        log_payload("OpenRouter response", response_data)
         
-        # Extract the generated prompt
         try:
             message = response_data["choices"][0]["message"]
-            
-            # First check if content has a value
-            generated_prompt = message.get("content", "").strip()
-            
-            # If content is empty, check for reasoning
-            if not generated_prompt and "reasoning" in message:
-                reasoning = message.get("reasoning", "")
-                logger.debug(f"Found reasoning field: {reasoning}")
-                
-                # Try to parse reasoning to extract a meaningful question
-                # This is a simple heuristic - we could make it more sophisticated
-                lines = reasoning.split("\n")
-                for line in lines:
-                    if "?" in line and len(line) > 10 and len(line) < 200:
-                        generated_prompt = line.strip()
-                        logger.info(f"Extracted question from reasoning: {generated_prompt}")
-                        break
-                
-                # If we couldn't find a question in the reasoning, use a fallback approach
-                if not generated_prompt:
-                    # Choose from predefined prompts based on the prompt type
-                    fallback_prompts = {
-                        "reflective questions about your day": "What moments from today made you feel most connected to your authentic self?",
-                        "questions about your emotional well-being": "How have your emotions been guiding your decisions lately, and what might they be trying to tell you?",
-                        "meaningful self-reflection prompts": "What parts of yourself are you still learning to accept and appreciate?",
-                        "gratitude-focused questions": "What unexpected blessing has appeared in your life recently that you haven't fully acknowledged?",
-                        "mindfulness and present moment awareness": "What sensations, sounds, or sights are you aware of right now that you might normally overlook?",
-                        "personal growth and goals": "What small step could you take today that aligns with your deeper values and aspirations?"
-                    }
-                    
-                    # Get a relevant prompt or use a default
-                    generated_prompt = fallback_prompts.get(
-                        request.promptType,
-                        "What insights about yourself have you gained today that might help you grow tomorrow?"
-                    )
-                    logger.info(f"Using fallback prompt: {generated_prompt}")
-            
-            # Check if the prompt is empty
-            if not generated_prompt:
-                logger.warning("OpenRouter returned an empty prompt and fallback extraction failed")
-                raise HTTPException(status_code=500, detail="Failed to generate a prompt from the model response")
-                
-            # Log the generated prompt
-            logger.info(f"Final generated prompt: {generated_prompt}")
-            
-            return {"prompt": generated_prompt}
         except (KeyError, IndexError) as e:
             logger.error(f"Error extracting prompt from response: {e}, response: {response_data}")
             raise HTTPException(status_code=500, detail=f"Error extracting prompt from response: {str(e)}")
+    except Exception:
+        openrouter_breaker.record_failure()
+        raise
+    
+    openrouter_breaker.record_success(time.monotonic() - start)
+    return message
+
+async def fetch_prompt(prompt_type: str) -> str:
+    """
+    Fetch a prompt for a prompt type from OpenRouter.
+    
+    While the circuit breaker is open the fallback prompt is returned immediately.
+    
+    Args:
+        prompt_type: The kind of prompt to generate
+        
+    Returns:
+        str: The generated prompt
+        
+    Raises:
+        HTTPException: If OpenRouter fails or no prompt can be extracted
+    """
+    if not openrouter_breaker.allow_request():
+        logger.warning(f"OpenRouter circuit is {openrouter_breaker.state}, serving fallback prompt for: {prompt_type}")
+        return get_fallback_prompt(prompt_type)
+    
+    message = await call_openrouter(build_openrouter_request(prompt_type))
+    
+    # First check if content has a value
+    generated_prompt = (message.get("content") or "").strip()
+    
+    # If content is empty, check for reasoning
+    if not generated_prompt and "reasoning" in message:
+        reasoning = message.get("reasoning") or ""
+        logger.debug(f"Found reasoning field: {reasoning}")
+        
+        # Try to parse reasoning to extract a meaningful question
+        generated_prompt = extract_question(reasoning)
+        if generated_prompt:
+            logger.info(f"Extracted question from reasoning: {generated_prompt}")
+        
+        # If we couldn't find a question in the reasoning, use a fallback approach
+        if not generated_prompt:
+            generated_prompt = get_fallback_prompt(prompt_type)
+            logger.info(f"Using fallback prompt: {generated_prompt}")
+    
+    # Check if the prompt is empty
+    if not generated_prompt:
+        logger.warning("OpenRouter returned an empty prompt and fallback extraction failed")
+        raise HTTPException(status_code=500, detail="Failed to generate a prompt from the model response")
+    
+    return generated_prompt
+
+@router.post("/generate")
+async def generate_prompt(request: PromptRequest = Body(...)):
+    """
+    Generate a reflective prompt using OpenRouter with DeepSeek R1 free model
+    """
+    try:
+        # Log the request
+        logger.info(f"Generating prompt for type: {request.promptType}")
+        
+        # Identical concurrent requests share a single upstream call
+        generated_prompt = await prompt_calls.do(
+            request.promptType,
+            lambda: fetch_prompt(request.promptType)
+        )
+        
+        # Log the generated prompt
+        logger.info(f"Final generated prompt: {generated_prompt}")
+        
+        return {"prompt": generated_prompt}
     
     except Exception as e:
         # Log any errors
         logger.error(f"Error generating prompt: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to generate prompt: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to generate prompt: {str(e)}")
+
+async def fetch_prompt_batch(slots: Sequence[str]) -> List[str]:
+    """
+    Fetch a list of prompts with as few OpenRouter completions as possible.
+    
+    All slots are requested as one numbered list. Slots the model skipped are
+    requested once more, and any still missing get their fallback prompt.
+    
+    Args:
+        slots: The prompt type of each prompt to generate
+        
+    Returns:
+        List[str]: One prompt per slot, in the same order
+    """
+    prompts = [""] * len(slots)
+    
+    for attempt in range(2):
+        missing = [index for index, prompt in enumerate(prompts) if not prompt]
+        if not missing:
+            break
+        if not openrouter_breaker.allow_request():
+            logger.warning(f"OpenRouter circuit is {openrouter_breaker.state}, serving fallback prompts for batch")
+            break
+        
+        try:
+            message = await call_openrouter(build_openrouter_batch_request([slots[index] for index in missing]))
+        except Exception as e:
+            logger.error(f"Error generating prompt batch: {str(e)}")
+            break
+        
+        # Numbered items in the content win over drafts found in the reasoning
+        questions = extract_numbered_questions(message.get("reasoning") or "")
+        questions.update(extract_numbered_questions(message.get("content") or ""))
+        
+        filled = 0
+        for number, index in enumerate(missing, start=1):
+            if questions.get(number):
+                prompts[index] = questions[number]
+                filled += 1
+        
+        logger.info(f"Batch attempt {attempt + 1} filled {filled} of {len(missing)} prompts")
+    
+    for index, prompt in enumerate(prompts):
+        if not prompt:
+            prompts[index] = get_fallback_prompt(slots[index])
+    
+    return prompts
+
+@router.post("/batch")
+async def generate_prompt_batch(request: BatchPromptRequest = Body(...)):
+    """
+    Generate prompts for several prompt types in one round trip.
+    
+    Returns {"prompts": {promptType: [prompt, ...]}} with `count` prompts per type.
+    """
+    # Merge repeated prompt types so each type gets one run of slots
+    counts: Dict[str, int] = {}
+    for item in request.prompts:
+        if item.count < 1:
+            raise HTTPException(status_code=400, detail="count must be at least 1")
+        counts[item.promptType] = counts.get(item.promptType, 0) + item.count
+    
+    total = sum(counts.values())
+    if total == 0:
+        raise HTTPException(status_code=400, detail="No prompts requested")
+    if total > MAX_BATCH_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"Cannot generate more than {MAX_BATCH_PROMPTS} prompts per batch")
+    
+    logger.info(f"Generating prompt batch: {counts}")
+    
+    # In a canonical order, so batches asking for the same prompts in any order share results slot by slot
+    slots = tuple(prompt_type for prompt_type, count in sorted(counts.items()) for _ in range(count))
+    
+    try:
+        # Identical concurrent batches share a single set of upstream calls
+        generated_prompts = await prompt_calls.do(
+            ("batch", slots),
+            lambda: fetch_prompt_batch(slots)
+        )
+    except Exception as e:
+        logger.error(f"Error generating prompt batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate prompts: {str(e)}")
+    
+    prompts: Dict[str, List[str]] = {prompt_type: [] for prompt_type in counts}
+    for prompt_type, generated_prompt in zip(slots, generated_prompts):
+        prompts[prompt_type].append(generated_prompt)
+    
+    return {"prompts": prompts}
+
+async def stream_prompt_events(prompt_type: str):
+    """
+    Stream a prompt from OpenRouter as server-sent events.
+    
+    The first complete question found in either the content or the reasoning
+    is emitted as a "prompt" event and the upstream stream is closed right
+    away, so we stop waiting on (and paying for) the rest of the completion.
+    """
+    if not openrouter_breaker.allow_request():
+        logger.warning(f"OpenRouter circuit is {openrouter_breaker.state}, serving fallback prompt for: {prompt_type}")
+        yield format_sse_event("prompt", {"prompt": get_fallback_prompt(prompt_type)})
+        return
+    
+    content = ""
+    reasoning = ""
+    start = time.monotonic()
+    
+    try:
+        with track_upstream("openrouter", "chat_completion_stream") as call:
+            async with httpx.AsyncClient(timeout=OPENROUTER_TIMEOUT) as client:
+                async with client.stream(
+                    "POST",
+                    OPENROUTER_API_URL,
+                    headers=build_openrouter_headers(),
+                    json=build_openrouter_request(prompt_type, stream=True)
+                ) as response:
+                    if response.status_code != 200:
+                        error_text = (await response.aread()).decode("utf-8", errors="replace")
+                        logger.error(f"OpenRouter API error: {response.status_code}, {error_text}")
+                        call["outcome"] = "error"
+                        openrouter_breaker.record_failure()
+                        yield format_sse_event("error", {"status": response.status_code, "detail": "Failed to generate prompt from OpenRouter"})
+                        return
+                
+                    async for line in response.aiter_lines():
+                        # Skip blank lines and SSE comments (OpenRouter sends keep-alive comments)
+                        if not line or line.startswith(":") or not line.startswith("data:"):
+                            continue
+                    
+                        chunk_data = line[len("data:"):].strip()
+                        if chunk_data == "[DONE]":
+                            break
+                    
+                        try:
+                            chunk = json.loads(chunk_data)
+                            delta = chunk["choices"][0].get("delta", {})
+                        except (json.JSONDecodeError, KeyError, IndexError) as e:
+                            logger.debug(f"Skipping malformed OpenRouter chunk: {e}")
+                            continue
+                    
+                        content += delta.get("content") or ""
+                        reasoning += delta.get("reasoning") or ""
+                    
+                        generated_prompt = extract_complete_question(content) or extract_complete_question(reasoning)
+                        if generated_prompt:
+                            # Leaving the stream context closes the upstream connection early
+                            logger.info(f"Streamed prompt: {generated_prompt}")
+                            openrouter_breaker.record_success(time.monotonic() - start)
+                            yield format_sse_event("prompt", {"prompt": generated_prompt})
+                            return
+        openrouter_breaker.record_success(time.monotonic() - start)
+    except httpx.HTTPError as e:
+        logger.error(f"Error streaming prompt from OpenRouter: {str(e)}")
+        openrouter_breaker.record_failure()
+    
+    # The stream ended without a complete question - use whatever the final text holds
+    generated_prompt = content.strip() or extract_question(reasoning)
+    if not generated_prompt:
+        generated_prompt = get_fallback_prompt(prompt_type)
+        logger.info(f"Using fallback prompt: {generated_prompt}")
+    yield format_sse_event("prompt", {"prompt": generated_prompt})
+
+@router.post("/generate/stream")
+async def generate_prompt_stream(request: PromptRequest = Body(...)):
+    """
+    Generate a reflective prompt as a server-sent events stream.
+    
+    Emits a single "prompt" event with {"prompt": ...} as soon as a complete
+    question is available, or an "error" event if OpenRouter rejects the request.
+    """
+    logger.info(f"Streaming prompt for type: {request.promptType}")
+    return StreamingResponse(
+        stream_prompt_events(request.promptType),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
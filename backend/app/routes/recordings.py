@@ -1,14 +1,396 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Header, Form
-from typing import Optional
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Header, Form, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from postgrest.exceptions import APIError
+from pydantic import BaseModel, Field
+from typing import Dict, Iterator, List, Optional, Tuple
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from collections import Counter
 import json
 import os
-from ..config.settings import get_supabase_client, logger
+import re
+from ..config.settings import (
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_COMPRESS_MIN_BYTES,
+    SEARCH_INDEX_PATH,
+    STORAGE_PURGE_BATCH_SIZE,
+    STORAGE_PURGE_CONCURRENCY,
+    STORAGE_QUOTA_BYTES,
+    SUPABASE_URL,
+    get_supabase_client,
+    logger,
+)
+from ..utils.auth import get_current_user
+from ..utils.media_probe import MediaProbe
+from ..utils.pending_uploads import PendingUploads
+from ..utils.response_cache import ResponseCache
+from ..utils.search_index import SearchIndex
+from ..utils.storage_purge import StoragePurge
+from ..utils.storage_usage import StorageUsage
 
 router = APIRouter(tags=["recordings"])
 
 supabase = get_supabase_client()
 
+# Per-user usage counters, updated on every upload and delete
+storage_usage = StorageUsage(supabase, quota_bytes=STORAGE_QUOTA_BYTES)
+
+# Removes the stored files of deleted users
+storage_purge = StoragePurge(supabase, "recordings", batch_size=STORAGE_PURGE_BATCH_SIZE, concurrency=STORAGE_PURGE_CONCURRENCY)
+
+# Signed uploads not finalized yet, swept once their URLs expire
+pending_uploads = PendingUploads(supabase)
+
+# Full-text index of notes and tags, updated on every upload, edit and delete
+search_index = SearchIndex(SEARCH_INDEX_PATH)
+
+# List, calendar and tag responses, cached per user and version of their recordings
+response_cache = ResponseCache("recordings", max_bytes=RESPONSE_CACHE_MAX_BYTES, min_compress_bytes=RESPONSE_COMPRESS_MIN_BYTES)
+
+# How long the storage API keeps signed upload URLs valid
+SIGNED_UPLOAD_LIFETIME = timedelta(hours=2)
+
+# Bytes read from an uploaded file at a time
+UPLOAD_READ_CHUNK_SIZE = 1024 * 1024
+
+# Columns of a recording sent to clients
+RECORDING_COLUMNS = "id, created_at, file_url, file_type, size_bytes, container, duration_seconds, video_codec, audio_codec, width, height, note, tags"
+
+
+class RecordingUpdate(BaseModel):
+    note: Optional[str] = None
+    tags: Optional[List[str]] = None
+
+
+class UploadRequest(BaseModel):
+    file_type: str = Field(pattern="^(audio|video)$")
+    size_bytes: int
+
+
+class UploadFinalize(BaseModel):
+    path: str
+    file_type: str = Field(pattern="^(audio|video)$")
+    size_bytes: int
+    note: Optional[str] = None
+    tags: Optional[List[str]] = None
+
+
+def storage_path(file_url: str) -> Optional[str]:
+    """Path of a recording in the recordings bucket, from its public URL."""
+    marker = "/object/public/recordings/"
+    if marker not in file_url:
+        return None
+    return file_url.split(marker, 1)[1].split("?", 1)[0]
+
+
+def new_recording_path(user_id: str, file_type: str) -> str:
+    """Path in the recordings bucket for a new recording of a user."""
+    timestamp = datetime.now().timestamp()
+    file_extension = "webm" if file_type == "audio" else "mp4"
+    return f"{user_id}/{timestamp}.{file_extension}"
+
+
+def is_recording_path(user_id: str, path: str) -> bool:
+    """Whether a path is one `new_recording_path` makes for the user, so clients cannot name other users' files."""
+    return re.fullmatch(rf"{re.escape(user_id)}/\d+(\.\d+)?\.(webm|mp4)", path) is not None
+
+
+def stored_object(path: str) -> Optional[Dict]:
+    """Listing entry (with its metadata, e.g. the size) of an object in the recordings bucket, or None."""
+    folder, _, name = path.rpartition("/")
+    # The search matches names by prefix
+    entries = supabase.storage.from_("recordings").list(folder, {"limit": 100, "search": name}) or []
+    return next((entry for entry in entries if entry.get("name") == name and entry.get("id") is not None), None)
+
+
+def read_upload(file: UploadFile) -> Tuple[bytes, Dict]:
+    """
+    Content of an uploaded file, and its duration, codecs and dimensions read from the chunks as they pass.
+
+    Blocking; call it in the threadpool. The container headers are parsed
+    from each chunk as it is read, so the file is not walked a second time.
+    """
+    probe = MediaProbe()
+    chunks = []
+    file.file.seek(0)
+    while True:
+        chunk = file.file.read(UPLOAD_READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if probe is None:
+            continue
+        try:
+            probe.feed(chunk)
+        except Exception as e:
+            logger.warning(f"Failed to read media headers of {file.filename}: {str(e)}")
+            probe = None
+    content = b"".join(chunks)
+    media = probe.result() if probe is not None else {}
+    media.pop("size_bytes", None)
+    return content, media
+
+
+def save_recording(user_id: str, path: str, file_type: str, size: int, media: Dict, note: Optional[str], tags: List[str]) -> Dict:
+    """
+    Insert the recordings row of a stored file and index it, returning the row.
+
+    Needs, so that a file is never saved twice:
+        alter table recordings add constraint recordings_file_url_key unique (file_url);
+    """
+    public_url = supabase.storage.from_("recordings").get_public_url(path)
+    db_response = supabase.table("recordings").insert({
+        "created_at": datetime.now().isoformat(),
+        "user_id": user_id,
+        "file_url": public_url,
+        "file_type": file_type,
+        "size_bytes": size,
+        **media,
+        "note": note,
+        "tags": tags,
+    }).execute()
+
+    if not db_response.data:
+        raise HTTPException(status_code=500, detail="Failed to save recording metadata")
+    recording = db_response.data[0]
+
+    try:
+        search_index.add(recording)
+    except Exception as e:
+        # The recording is saved; the next index rebuild picks it up
+        logger.warning(f"Failed to index recording {path}: {str(e)}")
+    return recording
+
+
+def reconcile_storage_usage() -> Dict:
+    """Correct drifted usage counters from the recordings table. Runs as a background job."""
+    return storage_usage.reconcile()
+
+
+def recordings_pages(columns: str, page_size: int = 1000, user_id: Optional[str] = None) -> Iterator[List[Dict]]:
+    """Every recordings row, or every row of one user, a page at a time."""
+    start = 0
+    while True:
+        query = supabase.table("recordings").select(columns)
+        if user_id is not None:
+            query = query.eq("user_id", user_id)
+        # The end of postgrest's range is exclusive
+        response = query.order("id").range(start, start + page_size).execute()
+        rows = response.data or []
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        start += page_size
+
+
+def parse_created_at(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else None
+    except ValueError:
+        return None
+
+
+def local_date(created_at: Optional[str], zone: ZoneInfo) -> Optional[date]:
+    """Day of a recording in a time zone; timestamps without an offset are UTC."""
+    moment = parse_created_at(created_at)
+    if moment is None:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(zone).date()
+
+
+def resolve_timezone(name: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown time zone: {name}")
+
+
+def day_bounds(day: date, zone: ZoneInfo) -> Tuple[datetime, datetime]:
+    """Start and end, in UTC, of a day in a time zone."""
+    start = datetime.combine(day, time.min, tzinfo=zone)
+    end = datetime.combine(day + timedelta(days=1), time.min, tzinfo=zone)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+
+
+def array_literal(values: List[str]) -> str:
+    """Postgres array literal of strings, quoted so commas and braces in them survive."""
+    return "{" + ",".join('"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"' for value in values) + "}"
+
+
+def recordings_page(
+    user_id: str,
+    limit: int,
+    offset: int,
+    file_type: Optional[str] = None,
+    tag: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Tuple[List[Dict], int]:
+    """
+    One page of a user's recordings, newest first, filtered by the database.
+
+    Args:
+        since: Only recordings created at or after this moment
+        until: Only recordings created before this moment
+
+    Returns:
+        The rows of the page, and the number of rows matching the filters
+    """
+    query = supabase.table("recordings").select(RECORDING_COLUMNS, count="exact").eq("user_id", user_id)
+    if file_type:
+        query = query.eq("file_type", file_type)
+    if tag:
+        query = query.contains("tags", array_literal([tag]))
+    if since:
+        query = query.gte("created_at", since.isoformat())
+    if until:
+        query = query.lt("created_at", until.isoformat())
+    # One order parameter for both columns; ties on created_at are broken by id
+    query = query.order("created_at.desc,id", desc=True)
+    try:
+        # The end of postgrest's range is exclusive
+        response = query.range(offset, offset + limit).execute()
+    except APIError as e:
+        # PostgREST answers a page past the last row with 416 instead of an empty page
+        if e.code != "PGRST103" or offset == 0:
+            raise
+        return [], recordings_page(user_id, 1, 0, file_type, tag, since, until)[1]
+    return response.data or [], response.count or 0
+
+
+def get_recordings_version(user_id: str) -> int:
+    """
+    Version of a user's recordings, bumped by the database on every insert, update and delete.
+
+    Needs:
+        create table recording_versions (
+            user_id text primary key,
+            version bigint not null default 0
+        );
+
+        create or replace function bump_recording_version() returns trigger
+        language plpgsql as $$
+        begin
+            insert into recording_versions as v (user_id, version)
+            values (coalesce(new.user_id, old.user_id), 1)
+            on conflict (user_id) do update set version = v.version + 1;
+            return null;
+        end;
+        $$;
+
+        create trigger recordings_bump_version
+            after insert or update or delete on recordings
+            for each row execute function bump_recording_version();
+    """
+    response = supabase.table("recording_versions").select("version").eq("user_id", user_id).execute()
+    return response.data[0]["version"] if response.data else 0
+
+
+def rebuild_search_index() -> int:
+    """Rebuild the search index from the recordings table. Runs as a background job."""
+    return search_index.rebuild(recordings_pages("id, user_id, created_at, file_type, file_url, note, tags"))
+
+
+def purge_user_recordings(user_id: str) -> Dict:
+    """
+    Remove the stored files, recordings rows and usage counters of a deleted user. Runs as a background job.
+
+    Queued whenever a user is deleted. Does nothing while the user still
+    exists, so a replayed job can never touch a live user's recordings.
+    Raises if some files could not be removed, so the job is retried; a
+    retry only lists and removes what is left.
+    """
+    if not user_id:
+        raise ValueError("Refusing to purge recordings without a user id")
+    if supabase.table("users").select("user_id").eq("user_id", user_id).execute().data:
+        logger.warning(f"Not purging recordings of user {user_id}, who still exists")
+        return {"user_id": user_id, "skipped": True}
+
+    result = storage_purge.purge(user_id)
+    rows = supabase.table("recordings").delete().eq("user_id", user_id).execute().data or []
+    storage_usage.forget(user_id)
+    try:
+        search_index.remove_user(user_id)
+    except Exception as e:
+        logger.warning(f"Failed to remove recordings of user {user_id} from the search index: {str(e)}")
+
+    logger.info(f"Purged user {user_id}: {result['removed']} files ({result['bytes']} bytes) and {len(rows)} recordings rows")
+    if result["removed"] < result["found"]:
+        raise RuntimeError(f"{result['found'] - result['removed']} files of user {user_id} could not be removed")
+    return {"user_id": user_id, "files": result["removed"], "bytes": result["bytes"], "rows": len(rows)}
+
+
+def sweep_orphaned_recordings(page_size: int = 1000) -> Dict:
+    """
+    Purge the recordings of users deleted without a purge, e.g. before purges existed. Runs as a background job.
+
+    Orphans are storage folders and recordings rows whose user is no
+    longer in the users table. Each is purged like a deleted user, which
+    checks again that the user is gone.
+
+    Returns:
+        Dict: Orphaned users found and purged, files removed and bytes reclaimed
+    """
+    users = set()
+    start = 0
+    while True:
+        # The end of postgrest's range is exclusive
+        rows = supabase.table("users").select("user_id").order("user_id").range(start, start + page_size).execute().data or []
+        users.update(row["user_id"] for row in rows)
+        if len(rows) < page_size:
+            break
+        start += page_size
+
+    owners = set(storage_purge.folders())
+    for page in recordings_pages("id, user_id", page_size):
+        owners.update(row["user_id"] for row in page)
+    orphans = sorted(owner for owner in owners if owner and owner not in users)
+
+    purged = failed = files = reclaimed = 0
+    for user_id in orphans:
+        try:
+            result = purge_user_recordings(user_id)
+        except Exception as e:
+            failed += 1
+            logger.error(f"Failed to purge recordings of deleted user {user_id}: {str(e)}")
+            continue
+        if not result.get("skipped"):
+            purged += 1
+            files += result["files"]
+            reclaimed += result["bytes"]
+
+    logger.info(f"Orphan sweep reclaimed {reclaimed} bytes in {files} files from {purged} deleted users ({failed} failed)")
+    return {"orphans": len(orphans), "purged": purged, "failed": failed, "files": files, "bytes": reclaimed}
+
+
+def sweep_expired_uploads(batch_size: int = 1000) -> Dict:
+    """
+    Remove the objects of signed uploads never finalized before their URLs expired. Runs as a background job.
+
+    Returns:
+        Dict: Expired uploads claimed, and stored objects removed
+    """
+    expired = removed = 0
+    while True:
+        rows = pending_uploads.claim_expired(batch_size)
+        if not rows:
+            break
+        expired += len(rows)
+        try:
+            # Objects never uploaded are simply not in the response
+            removed += len(supabase.storage.from_("recordings").remove([row["path"] for row in rows]) or [])
+        except Exception:
+            pending_uploads.restore(rows)
+            raise
+        if len(rows) < batch_size:
+            break
+
+    logger.info(f"Expired upload sweep removed {removed} objects of {expired} unfinalized uploads")
+    return {"expired": expired, "removed": removed}
+
 
 @router.post("/upload")
 async def upload_recording(
@@ -16,54 +398,349 @@ async def upload_recording(
     file_type: str = Form(...),
     note: str = Form(None),
     tags: Optional[str] = Form(None),
-    user_id: str = Form(...),
+    user: Dict = Depends(get_current_user),
+):
+    try:
+        user_id = user["user_id"]
+
+        filename = new_recording_path(user_id, file_type)
+
+        # Count the file against the quota before any bytes go to storage
+        size = file.size if file.size is not None else len(await file.read())
+        if not storage_usage.reserve(user_id, file_type, size):
+            raise HTTPException(status_code=413, detail="Storage quota exceeded")
+
+        try:
+            # Duration, codecs and dimensions from the container headers, so clients can list recordings without loading them
+            file_content, media = await run_in_threadpool(read_upload, file)
+
+            # Upload file to Supabase Storage
+            upload_response = await run_in_threadpool(
+                supabase.storage.from_("recordings").upload,
+                filename,
+                file_content,
+                {"contentType": f"{file_type}/webm"}
+            )
+
+            if not upload_response:
+                raise HTTPException(status_code=500, detail="Failed to upload file")
+            logger.debug(f"Note received for recording {filename}")
+
+            parsed_tags = []
+            if tags:
+                parsed_tags = json.loads(tags)
+            recording = await run_in_threadpool(save_recording, user_id, filename, file_type, size, media, note, parsed_tags)
+        except Exception:
+            # The file was not stored; stop counting it
+            storage_usage.release(user_id, file_type, size)
+            raise
+
+        return {"message": "Recording uploaded successfully", "url": recording["file_url"]}
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/upload/sign")
+async def sign_upload(upload: UploadRequest, user: Dict = Depends(get_current_user)):
+    """
+    Signed URL to upload a recording straight to storage, for `/upload/finalize` afterwards.
+
+    The URL can only create the returned path, under the user's folder. The
+    client PUTs the file to it, so the bytes never pass through the API.
+    Uploads that would exceed the quota, counting the user's other pending
+    uploads, are refused here, before any bytes are sent; the quota is
+    taken when the upload is finalized. Each URL is recorded as a pending
+    upload, and the object of one not finalized by the time the URL expires
+    is removed by the `sweep_expired_uploads` job.
+    """
+    try:
+        user_id = user["user_id"]
+        if upload.size_bytes <= 0:
+            raise HTTPException(status_code=400, detail="size_bytes must be positive")
+        if storage_usage.quota_bytes:
+            remaining = storage_usage.usage(user_id)["remaining_bytes"] - pending_uploads.pending_bytes(user_id)
+            if upload.size_bytes > remaining:
+                raise HTTPException(status_code=413, detail="Storage quota exceeded")
+
+        path = new_recording_path(user_id, upload.file_type)
+        signed = supabase.storage.from_("recordings").create_signed_upload_url(path)
+        pending_uploads.add(user_id, path, upload.file_type, upload.size_bytes, datetime.now(timezone.utc) + SIGNED_UPLOAD_LIFETIME)
+        # Built from the token, as the client library joins its URL with a double slash
+        signed_url = f"{SUPABASE_URL.rstrip('/')}/storage/v1/object/upload/sign/recordings/{path}?token={signed['token']}"
+        return {"path": path, "signed_url": signed_url, "token": signed["token"]}
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error signing upload: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/upload/finalize")
+async def finalize_upload(upload: UploadFinalize, user: Dict = Depends(get_current_user)):
+    """
+    Save a recording uploaded with a URL from `/upload/sign`.
+
+    The path must be a pending upload of the user, signed for the same
+    file type and size, and the object must exist with that size. A size
+    mismatch (e.g. an interrupted upload) or an upload over the quota
+    removes the object, and the client starts over with a new URL. The
+    pending upload is claimed before anything is saved, so concurrent
+    finalizes of one path save it once and the others get a 409.
+    Duration, codecs and dimensions are left empty, since the API never
+    reads the file.
+    """
+    try:
+        user_id = user["user_id"]
+        path = upload.path
+        if not is_recording_path(user_id, path):
+            raise HTTPException(status_code=400, detail="Not an upload path of the current user")
+
+        pending = pending_uploads.get(user_id, path)
+        if pending is None:
+            raise HTTPException(status_code=409, detail="No pending upload at this path; it was finalized or has expired")
+        if pending["file_type"] != upload.file_type or pending["size_bytes"] != upload.size_bytes:
+            raise HTTPException(status_code=400, detail="file_type and size_bytes must match the signed upload")
+
+        stored = stored_object(path)
+        if stored is None:
+            raise HTTPException(status_code=404, detail="Upload not found")
+
+        if pending_uploads.claim(path) is None:
+            raise HTTPException(status_code=409, detail="Upload already finalized")
+
+        size = int((stored.get("metadata") or {}).get("size") or 0)
+        if size != upload.size_bytes:
+            supabase.storage.from_("recordings").remove([path])
+            raise HTTPException(status_code=400, detail=f"Uploaded {size} bytes, expected {upload.size_bytes}")
+
+        if not storage_usage.reserve(user_id, upload.file_type, size):
+            supabase.storage.from_("recordings").remove([path])
+            raise HTTPException(status_code=413, detail="Storage quota exceeded")
+        try:
+            recording = save_recording(user_id, path, upload.file_type, size, {}, upload.note, upload.tags or [])
+        except Exception:
+            storage_usage.release(user_id, upload.file_type, size)
+            # Pending again, so the client can retry, or the sweep removes the object
+            pending_uploads.restore([pending])
+            raise
+
+        return {"message": "Recording uploaded successfully", "url": recording["file_url"], "id": recording.get("id")}
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error finalizing upload {upload.path}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("")
+async def list_recordings(
+    request: Request,
+    file_type: Optional[str] = Query(None, pattern="^(audio|video)$"),
+    tag: Optional[str] = Query(None),
+    day: Optional[date] = Query(None, alias="date", description="Only recordings of this day in `tz`"),
+    tz: str = Query("UTC", description="IANA time zone of `date`"),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    user: Dict = Depends(get_current_user),
 ):
+    """
+    The current user's recordings, newest first, with their duration, codecs and dimensions.
+
+    Responses carry an ETag and are cached until the user's recordings
+    change; sending it back in If-None-Match gets a 304.
+    """
     try:
-        # Check if user exists in Supabase
-        user_response = supabase.table("users").select("id").eq("user_id", user_id).execute()
-        
-        if not user_response.data:
-            raise HTTPException(status_code=404, detail="User not found in database")
-
-        # Generate a unique filename
-        timestamp = datetime.now().timestamp()
-        file_extension = "webm" if file_type == "audio" else "mp4"
-        filename = f"{user_id}/{timestamp}.{file_extension}"
-
-        # Upload file to Supabase Storage
-        file_content = await file.read()
-        upload_response = supabase.storage.from_("recordings").upload(
-            filename,
-            file_content,
-            {"contentType": f"{file_type}/webm"}
+        user_id = user["user_id"]
+        zone = resolve_timezone(tz)
+        since, until = day_bounds(day, zone) if day else (None, None)
+        # Read before the rows, so a cached response is never older than its version
+        version = await run_in_threadpool(get_recordings_version, user_id)
+
+        def build():
+            rows, total = recordings_page(user_id, limit, offset, file_type=file_type, tag=tag, since=since, until=until)
+            return {"recordings": rows, "total": total, "limit": limit, "offset": offset}
+
+        return await run_in_threadpool(
+            response_cache.respond, request, user_id, version, ("list", file_type, tag, day, tz, limit, offset), build
         )
 
-        if not upload_response:
-            raise HTTPException(status_code=500, detail="Failed to upload file")
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error listing recordings: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/calendar")
+async def recordings_calendar(
+    request: Request,
+    tz: str = Query("UTC", description="IANA time zone the days are in"),
+    user: Dict = Depends(get_current_user),
+):
+    """Days on which the current user recorded, newest first, with the number of recordings of each type."""
+    try:
+        user_id = user["user_id"]
+        zone = resolve_timezone(tz)
+        version = await run_in_threadpool(get_recordings_version, user_id)
+
+        def build():
+            days: Dict[date, Counter] = {}
+            for page in recordings_pages("created_at, file_type", user_id=user_id):
+                for row in page:
+                    day = local_date(row.get("created_at"), zone)
+                    if day is not None:
+                        days.setdefault(day, Counter())[row.get("file_type")] += 1
+            return {
+                "timezone": tz,
+                "days": [
+                    {"date": day.isoformat(), "count": sum(counts.values()), "audio": counts["audio"], "video": counts["video"]}
+                    for day, counts in sorted(days.items(), reverse=True)
+                ],
+            }
+
+        return await run_in_threadpool(response_cache.respond, request, user_id, version, ("calendar", tz), build)
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error getting recordings calendar: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/tags")
+async def recording_tags(request: Request, user: Dict = Depends(get_current_user)):
+    """Tags used by the current user, most used first, with their number of recordings."""
+    try:
+        user_id = user["user_id"]
+        version = await run_in_threadpool(get_recordings_version, user_id)
+
+        def build():
+            counts = Counter(
+                tag for page in recordings_pages("tags", user_id=user_id) for row in page for tag in set(row.get("tags") or [])
+            )
+            return {"tags": [{"tag": tag, "count": count} for tag, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))]}
+
+        return await run_in_threadpool(response_cache.respond, request, user_id, version, ("tags",), build)
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error getting recording tags: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/usage")
+async def get_storage_usage(user: Dict = Depends(get_current_user)):
+    """Bytes and number of recordings stored by the current user, in total and per file type."""
+    try:
+        return storage_usage.usage(user["user_id"])
+    except Exception as e:
+        logger.error(f"Error getting storage usage: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/search")
+async def search_recordings(
+    q: str = Query(..., min_length=1, description="Words to find in notes and tags; each matches as a prefix"),
+    date_from: Optional[date] = Query(None, description="Earliest recording date, inclusive"),
+    date_to: Optional[date] = Query(None, description="Latest recording date, inclusive"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    user: Dict = Depends(get_current_user),
+):
+    """
+    Search the current user's recordings by note and tags, best matches first.
+
+    Hits whose recording no longer exists (deleted without going through
+    this API) are dropped from the results and the index, so a page may
+    hold fewer than `limit` results until the next index rebuild.
+    """
+    try:
+        user_id = user["user_id"]
+
+        def search():
+            results = search_index.search(user_id, q, date_from=date_from, date_to=date_to, limit=limit, offset=offset)
+            if not results:
+                return results
+            response = supabase.table("recordings").select("id").eq("user_id", user_id).in_("id", [result["id"] for result in results]).execute()
+            existing = {str(row["id"]) for row in response.data or []}
+            for result in results:
+                if result["id"] not in existing:
+                    search_index.remove(result["id"])
+            return [result for result in results if result["id"] in existing]
+
+        return {"query": q, "results": await run_in_threadpool(search)}
+    except Exception as e:
+        logger.error(f"Error searching recordings: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.patch("/{recording_id}")
+async def update_recording(recording_id: str, update: RecordingUpdate, user: Dict = Depends(get_current_user)):
+    """Edit the note or tags of one of the current user's recordings."""
+    try:
+        user_id = user["user_id"]
+        changes = update.model_dump(exclude_unset=True)
+        if not changes:
+            raise HTTPException(status_code=400, detail="Nothing to update")
+        if "tags" in changes and changes["tags"] is None:
+            changes["tags"] = []
+
+        response = supabase.table("recordings").update(changes).eq("id", recording_id).eq("user_id", user_id).execute()
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Recording not found")
+        recording = response.data[0]
+
+        try:
+            search_index.add(recording)
+        except Exception as e:
+            logger.warning(f"Failed to index recording {recording_id}: {str(e)}")
+
+        return {"message": "Recording updated successfully", "recording": recording}
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error updating recording {recording_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/{recording_id}")
+async def delete_recording(recording_id: str, user: Dict = Depends(get_current_user)):
+    """Delete one of the current user's recordings, its stored file and its share of the usage counters."""
+    try:
+        user_id = user["user_id"]
 
-        # Get the public URL
-        public_url = supabase.storage.from_("recordings").get_public_url(filename)
-        print("Note received:", note)
+        def delete():
+            response = supabase.table("recordings").select("id, file_url, file_type, size_bytes").eq("id", recording_id).eq("user_id", user_id).execute()
+            if not response.data:
+                raise HTTPException(status_code=404, detail="Recording not found")
+            recording = response.data[0]
 
-        parsed_tags = []
-        if tags:
-            parsed_tags = json.loads(tags)
-        # Save to recordings table
-        db_response = supabase.table("recordings").insert({
-            "created_at": datetime.now().isoformat(),
-            "user_id": user_id,
-            "file_url": public_url,
-            "file_type": file_type,
-            "note": note,
-            "tags": parsed_tags,
-        }).execute()
+            path = storage_path(recording["file_url"] or "")
+            if path:
+                supabase.storage.from_("recordings").remove([path])
 
-        if not db_response.data:
-            raise HTTPException(status_code=500, detail="Failed to save recording metadata")
+            deleted = supabase.table("recordings").delete().eq("id", recording_id).eq("user_id", user_id).execute()
+            # Of concurrent deletes of one recording, only the one that removed the row releases its usage
+            if not deleted.data:
+                raise HTTPException(status_code=404, detail="Recording not found")
+            storage_usage.release(user_id, recording["file_type"], recording.get("size_bytes") or 0)
+            try:
+                search_index.remove(recording_id)
+            except Exception as e:
+                logger.warning(f"Failed to remove recording {recording_id} from the search index: {str(e)}")
 
-        return {"message": "Recording uploaded successfully", "url": public_url}
+        await run_in_threadpool(delete)
+        return {"message": "Recording deleted successfully", "id": recording_id}
 
     except HTTPException as e:
         raise e
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        logger.error(f"Error deleting recording {recording_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
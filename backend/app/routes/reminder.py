@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException
 import logging
 import requests
 import time
@@ -6,9 +6,13 @@ from datetime import datetime, timedelta
 from typing import List, Dict
 import pytz
 
-from ..config.settings import get_supabase_client, logger
+from ..config.settings import get_supabase_client
+from ..jobs import job_queue
 from ..utils.email import send_email, create_reminder_email_body
 
+# Own logger, so the per-user lines can be rate limited and sampled separately
+logger = logging.getLogger(__name__)
+
 # Initialize router
 router = APIRouter(prefix="/reminder", tags=["synchronization"])
 
@@ -55,11 +59,11 @@ def get_users_needing_reminder() -> List[Dict]:
                 local_time = local_tz.localize(local_time)
                 reminder_time_utc = local_time.astimezone(pytz.UTC).strftime('%H:%M')
                 
-                logger.info(f"User {user['user_id']} local reminder time: {user['reminder_time']}, UTC: {reminder_time_utc}")
+                logger.debug(f"User {user['user_id']} local reminder time: {user['reminder_time']}, UTC: {reminder_time_utc}")
                 
                 # Check daily reminder
                 if reminder_time_utc == current_time_utc:
-                    logger.info(f"Found matching reminder time for user {user['user_id']}")
+                    logger.debug(f"Found matching reminder time for user {user['user_id']}")
                     users_needing_reminder.append({
                         'user_id': user['user_id'],
                         'email': user['users']['email'],
@@ -76,7 +80,7 @@ def get_users_needing_reminder() -> List[Dict]:
                 if last_login:
                     last_login_dt = datetime.fromisoformat(last_login.replace('Z', '+00:00'))
                     days_since_login = (now - last_login_dt).days
-                    logger.info(f"User {user['user_id']} last login: {last_login}, days since: {days_since_login}")
+                    logger.debug(f"User {user['user_id']} last login: {last_login}, days since: {days_since_login}")
                     if days_since_login >= 7:
                         users_needing_reminder.append({
                             'user_id': user['user_id'],
@@ -91,39 +95,55 @@ def get_users_needing_reminder() -> List[Dict]:
         return []
 
 def send_reminder_email(user_id: str, email: str, reminder_type: str) -> bool:
-    """Send reminder email to user."""
-    try:
-        subject = "MyCorner: Daily Reminder to Login!" if reminder_type == "daily" else "MyCorner Weekly Reminder: We miss you!"
-        body = create_reminder_email_body(reminder_type)
-        
-        success = send_email(email, subject, body)
-        if success:
-            logger.info(f"Successfully sent {reminder_type} reminder to {email}")
-        else:
-            logger.error(f"Failed to send {reminder_type} reminder to {email}")
-            
-        return success
-    except Exception as e:
-        logger.error(f"Error sending reminder to user {user_id}: {str(e)}")
-        return False
+    """
+    Send reminder email to user. Runs as the "send_reminder_email" job.
+
+    Raises when the email could not be sent, so the job queue retries it.
+    """
+    subject = "MyCorner: Daily Reminder to Login!" if reminder_type == "daily" else "MyCorner Weekly Reminder: We miss you!"
+    body = create_reminder_email_body(reminder_type)
+    
+    if not send_email(email, subject, body):
+        logger.error(f"Failed to send {reminder_type} reminder to user {user_id}")
+        raise RuntimeError(f"Failed to send {reminder_type} reminder to user {user_id}")
+
+    logger.info(f"Successfully sent {reminder_type} reminder to {email}")
+    return True
+
+def queue_reminder_emails(minute: str) -> int:
+    """
+    Find users needing a reminder and queue one email job per user.
+
+    Runs as the "check_reminders" job. Email jobs are keyed by user, type and
+    minute, so a retried check does not send anyone a second email.
+
+    Args:
+        minute: The minute the check was requested for (YYYYmmddHHMM)
+
+    Returns:
+        int: Number of reminder emails queued
+    """
+    users = get_users_needing_reminder()
+    queued = job_queue.enqueue_many(
+        (
+            "send_reminder_email",
+            {"user_id": user['user_id'], "email": user['email'], "reminder_type": user['type']},
+            f"reminder:{user['user_id']}:{user['type']}:{minute}",
+        )
+        for user in users
+    )
+    logger.info(f"Queued {queued} reminder emails")
+    return queued
 
 @router.post("/check-reminders")
-async def check_reminders(background_tasks: BackgroundTasks):
-    """Endpoint to check and send reminders."""
+async def check_reminders():
+    """Endpoint to check and send reminders. The check runs in the job worker."""
     try:
         logger.info("Reminder endpoint called")
-        users = get_users_needing_reminder()
-        logger.info(f"Found {len(users)} users needing reminders")
-        
-        for user in users:
-            logger.info(f"Adding reminder task for user {user['user_id']} ({user['type']})")
-            background_tasks.add_task(
-                send_reminder_email,
-                user['user_id'],
-                user['email'],
-                user['type']
-            )
-        return {"message": f"Processing reminders for {len(users)} users"}
+        minute = datetime.now(pytz.UTC).strftime('%Y%m%d%H%M')
+        # One check per minute, however often the endpoint is called
+        job_id = job_queue.enqueue("check_reminders", {"minute": minute}, job_id=f"check_reminders:{minute}")
+        return {"message": "Reminder check queued", "job_id": job_id}
     except Exception as e:
         logger.error(f"Error in check_reminders: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException
 import logging
 import requests
+import os
 import time
 
-from ..config.settings import get_supabase_client, CLERK_SECRET_KEY, logger
+from ..config.settings import get_supabase_client, CLERK_API_URL, CLERK_SECRET_KEY, logger
+from ..jobs import job_queue
+from ..utils.metrics import track_upstream
+from .users import delete_users
 
 # Initialize router
 router = APIRouter(prefix="/sync", tags=["synchronization"])
@@ -11,15 +15,18 @@ router = APIRouter(prefix="/sync", tags=["synchronization"])
 # Initialize Supabase client
 supabase = get_supabase_client()
 
+# Pause between Clerk lookups during a full sync, to stay under Clerk's rate limit
+CLERK_SYNC_DELAY = float(os.getenv("CLERK_SYNC_DELAY", 0.5))
+
 @router.post("/check-deletions")
-async def check_user_deletions(background_tasks: BackgroundTasks):
+async def check_user_deletions():
     """
     Check all users in Supabase against Clerk and delete any that no longer exist in Clerk.
     This can be run manually or on a schedule to keep the databases in sync.
     """
-    # Start the sync in the background so the API call can return quickly
-    background_tasks.add_task(perform_user_sync)
-    return {"status": "success", "message": "User synchronization started in the background"}
+    # Queue the sync for the job worker so the API call returns right away
+    job_id = job_queue.enqueue("sync_users")
+    return {"status": "success", "message": "User synchronization queued", "job_id": job_id}
 
 async def perform_user_sync():
     """
@@ -51,21 +58,16 @@ async def perform_user_sync():
                 logger.info(f"User {user_id} not found in Clerk, deleting from Supabase")
                 
                 # Delete the user from Supabase
-                delete_response = (
-                    supabase.table("users")
-                    .delete()
-                    .eq("user_id", user_id)
-                    .execute()
-                )
-                
-                if hasattr(delete_response, 'error') and delete_response.error:
-                    logger.error(f"Failed to delete user {user_id}: {delete_response.error}")
+                try:
+                    delete_users([user_id])
+                except Exception as e:
+                    logger.error(f"Failed to delete user {user_id}: {str(e)}")
                 else:
                     deleted_count += 1
                     logger.info(f"Successfully deleted user {user_id} from Supabase")
             
             # Add a small delay to avoid rate limiting
-            time.sleep(0.5)
+            time.sleep(CLERK_SYNC_DELAY)
         
         logger.info(f"User synchronization completed. Deleted {deleted_count} users.")
     
@@ -94,10 +96,13 @@ async def check_user_exists_in_clerk(user_id: str) -> bool:
         }
         
         # Call Clerk's API to get the user
-        response = requests.get(
-            f"https://api.clerk.com/v1/users/{user_id}",
-            headers=headers
-        )
+        with track_upstream("clerk", "get_user") as call:
+            response = requests.get(
+                f"{CLERK_API_URL}/users/{user_id}",
+                headers=headers
+            )
+            if response.status_code not in (200, 404):
+                call["outcome"] = "error"
         
         # If the user exists, we'll get a 200 status code
         if response.status_code == 200:
@@ -139,16 +144,11 @@ async def check_single_user(user_id: str):
             return {"status": "success", "message": f"User {user_id} exists in Clerk, no action taken"}
             
         # User doesn't exist in Clerk, delete from Supabase
-        delete_response = (
-            supabase.table("users")
-            .delete()
-            .eq("user_id", user_id)
-            .execute()
-        )
-        
-        if hasattr(delete_response, 'error') and delete_response.error:
-            logger.error(f"Failed to delete user {user_id}: {delete_response.error}")
-            raise HTTPException(status_code=500, detail=f"Failed to delete user: {delete_response.error}")
+        try:
+            delete_response = delete_users([user_id])
+        except RuntimeError as e:
+            logger.error(f"Failed to delete user {user_id}: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Failed to delete user: {str(e)}")
             
         return {"status": "success", "message": f"User {user_id} deleted from Supabase", "data": delete_response.data}
         
@@ -2,6 +2,8 @@ from fastapi import APIRouter, Request, HTTPException
 import time
 
 from ..config.settings import get_supabase_client, logger
+from ..utils.structured_logging import log_payload
+from .users import delete_users
 
 # Initialize router
 router = APIRouter(tags=["test"])
@@ -38,7 +40,8 @@ async def test_webhook(request: Request):
         }
         
         # Log the payload
-        logger.info(f"Simulating Clerk webhook with payload: {webhook_payload}")
+        logger.info(f"Simulating Clerk webhook for user {user_id}")
+        log_payload("Simulated Clerk webhook payload", webhook_payload)
         
         # Check if user exists
         check_user = supabase.table("users").select("*").eq("user_id", user_id).execute()
@@ -48,16 +51,11 @@ async def test_webhook(request: Request):
             return {"status": "warning", "message": f"User {user_id} not found in Supabase, nothing to delete"}
             
         # Delete the user
-        response = (
-            supabase.table("users")
-            .delete()
-            .eq("user_id", user_id)
-            .execute()
-        )
-        
-        if hasattr(response, 'error') and response.error:
-            logger.error(f"Failed to delete user: {response.error}")
-            return {"status": "error", "message": str(response.error)}
+        try:
+            response = delete_users([user_id])
+        except RuntimeError as e:
+            logger.error(f"Failed to delete user: {str(e)}")
+            return {"status": "error", "message": str(e)}
             
         return {
             "status": "success", 
@@ -1,7 +1,16 @@
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Depends, Header, Request, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, List, Optional, Tuple
+import hmac
+import json
 import logging
+import os
 
-from ..config.settings import get_supabase_client, logger
+from ..config.settings import USER_IMPORT_TOKEN, get_supabase_client, logger
+from ..jobs import queue_recording_purges
+from ..utils.auth import user_lookup_cache
+from ..utils.clerk import user_row_from_clerk
+from ..utils.write_coalescer import WriteCoalescer
 
 # Initialize router
 router = APIRouter(tags=["users"])
@@ -9,57 +18,303 @@ router = APIRouter(tags=["users"])
 # Initialize Supabase client
 supabase = get_supabase_client()
 
+def upsert_users(rows: List[Dict]):
+    """Insert or update users in Supabase with a single request."""
+    response = supabase.table("users").upsert(rows, on_conflict="user_id").execute()
+
+    # Check for error in the response's error attribute
+    if hasattr(response, 'error') and response.error:
+        raise RuntimeError(f"Failed to sync user data: {response.error}")
+
+    # New users may have been cached as missing
+    for row in rows:
+        user_lookup_cache.invalidate(row["user_id"])
+
+    return response
+
+def update_users(rows: List[Dict]) -> List[str]:
+    """
+    Update existing users with a single request, skipping users that are not in the table.
+
+    Unlike an upsert, this never inserts: a buffered write of a user that
+    any process deleted meanwhile is dropped instead of recreating the user
+    without its `created_at`. Columns missing from a row keep their value.
+
+    Needs:
+        create or replace function update_users(p_rows jsonb) returns table (user_id text)
+        language sql as $$
+            update users u
+            set (last_sign_in, username, first_name, last_name, profile_image_url, email) = (
+                select p.last_sign_in, p.username, p.first_name, p.last_name, p.profile_image_url, p.email
+                from jsonb_populate_record(u, r.value) p
+            )
+            from jsonb_array_elements(p_rows) r
+            where u.user_id = r.value->>'user_id'
+            returning u.user_id;
+        $$;
+
+    Returns:
+        List[str]: IDs of the users that were updated
+    """
+    response = supabase.rpc("update_users", {"p_rows": rows}).execute()
+    if hasattr(response, 'error') and response.error:
+        raise RuntimeError(f"Failed to update users: {response.error}")
+    return [row["user_id"] for row in response.data or []]
+
+def create_or_update_user(row: Dict):
+    """
+    Insert a new user, or update an existing one without touching its `created_at`.
+
+    Tries an insert that skips existing users first, which answers with the
+    row only if it was inserted; existing users are then updated without
+    `created_at`.
+    """
+    response = supabase.table("users").upsert(row, on_conflict="user_id", ignore_duplicates=True).execute()
+    if hasattr(response, 'error') and response.error:
+        raise RuntimeError(f"Failed to sync user data: {response.error}")
+    if response.data:
+        user_lookup_cache.invalidate(row["user_id"])
+        return response
+    update_users([{column: value for column, value in row.items() if column != "created_at"}])
+    return response
+
+# Columns of the users table that clients may set
+USER_COLUMNS = ("user_id", "last_sign_in", "created_at", "username", "first_name", "last_name", "profile_image_url", "email")
+
+# Bulk import settings
+USER_IMPORT_BATCH_SIZE = int(os.getenv("USER_IMPORT_BATCH_SIZE", 500))
+USER_IMPORT_MAX_BATCH_SIZE = 5000
+USER_IMPORT_MAX_LINE_BYTES = 1024 * 1024
+USER_IMPORT_MAX_REPORTED_ERRORS = 1000
+
+# Repeated syncs of a user this process already wrote are debounced and flushed as batched updates
+user_writes = WriteCoalescer(
+    "users",
+    update_users,
+    key="user_id",
+    interval=float(os.getenv("USER_WRITE_FLUSH_INTERVAL", 5)),
+    batch_size=int(os.getenv("USER_WRITE_BATCH_SIZE", 500)),
+)
+
+def delete_users(user_ids: List[str]):
+    """
+    Delete a batch of users from Supabase with a single request.
+
+    Every path that deletes users goes through here, so none of them leaves
+    buffered profile writes, cached lookups or stored recordings behind.
+    """
+    # Drop buffered profile writes so they cannot recreate the users
+    for user_id in user_ids:
+        user_writes.forget(user_id)
+
+    response = (
+        supabase.table("users")
+        .delete()
+        .in_("user_id", user_ids)
+        .execute()
+    )
+
+    if hasattr(response, 'error') and response.error:
+        raise RuntimeError(f"Failed to delete users from Supabase: {response.error}")
+
+    for user_id in user_ids:
+        user_lookup_cache.invalidate(user_id)
+
+    # Their stored recordings are removed in the background
+    queue_recording_purges(user_ids)
+
+    return response
+
 @router.post("/sync-user")
 async def sync_user(request: Request):
     """Sync user data with Supabase - handles both creation and updates."""
     try:
         data = await request.json()
         user_id = data.get("user_id")
-        created_at = data.get("created_at")
-        last_sign_in = data.get("last_sign_in")
-        username = data.get("username")
-        first_name = data.get("first_name")
-        last_name = data.get("last_name")
-        profile_image_url = data.get("profile_image_url")
-        email = data.get("email")
 
         if not user_id:
             raise HTTPException(status_code=400, detail="Missing user_id")
 
-        # First check if user exists
-        existing_user = supabase.table("users").select("*").eq("user_id", user_id).execute()
-        
-        if existing_user.data and len(existing_user.data) > 0:
-            # User exists, only update last_sign_in
-            logger.info(f"Updating last_sign_in for existing user: {user_id}")
-            response = (
-                supabase.table("users")
-                .update({"last_sign_in": last_sign_in, "username": username, "first_name": first_name, "last_name": last_name, "profile_image_url": profile_image_url, "email": email})
-                .eq("user_id", user_id)
-                .execute()
-            )
-        else:
-            # New user, create full record
-            logger.info(f"Creating new user record: {user_id}")
-            user_data = {
-                "user_id": user_id,
-                "last_sign_in": last_sign_in,
-                "created_at": created_at,
-                "username": username,
-                "first_name": first_name,
-                "last_name": last_name,
-                "profile_image_url": profile_image_url,
-                "email": email
-            }
-            response = supabase.table("users").insert(user_data).execute()
-
-        # Check for error in the response's error attribute
-        if hasattr(response, 'error') and response.error:
-            logger.error(f"Failed to sync user data: {response.error}")
-            raise HTTPException(status_code=500, detail="Failed to sync user data")
-
-        return {"message": "User data synced successfully", "data": response.data}
+        user_data = {
+            "user_id": user_id,
+            "last_sign_in": data.get("last_sign_in"),
+            "created_at": data.get("created_at"),
+            "username": data.get("username"),
+            "first_name": data.get("first_name"),
+            "last_name": data.get("last_name"),
+            "profile_image_url": data.get("profile_image_url"),
+            "email": data.get("email")
+        }
+
+        if user_writes.is_known(user_id):
+            # The row exists already, so the update can wait for the next flush; it keeps its created_at
+            logger.debug(f"Queueing profile update for user: {user_id}")
+            user_data.pop("created_at")
+            user_writes.write(user_data)
+            return {"message": "User data synced successfully", "data": [user_data]}
+
+        # First sync of this user in this process: write it now so it exists before any upload
+        logger.info(f"Upserting user record: {user_id}")
+        response = await run_in_threadpool(create_or_update_user, user_data)
+        user_writes.mark_known(user_id)
 
+        # An existing user was updated, which leaves its created_at as it was
+        data = response.data or [{column: value for column, value in user_data.items() if column != "created_at"}]
+        return {"message": "User data synced successfully", "data": data}
+
+    except HTTPException as e:
+        raise e
     except Exception as e:
         logger.error(f"Error in sync_user: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+def parse_import_record(line: bytes) -> Dict:
+    """
+    Parse and validate one NDJSON line of a user import.
+    
+    A line is either a row in the POST /sync-user format (with "user_id") or
+    a Clerk user object (with "id"), e.g. from a Clerk export.
+    
+    Returns:
+        Dict: A users row with every column in USER_COLUMNS
+        
+    Raises:
+        ValueError: If the line is not a valid user record
+    """
+    try:
+        record = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    
+    if not isinstance(record, dict):
+        raise ValueError("Record must be a JSON object")
+    
+    if "user_id" in record:
+        row = {column: record.get(column) for column in USER_COLUMNS}
+    elif "id" in record:
+        row = user_row_from_clerk(record)
+    else:
+        raise ValueError("Missing user_id")
+    
+    if not isinstance(row["user_id"], str) or not row["user_id"]:
+        raise ValueError("user_id must be a non-empty string")
+    for column, value in row.items():
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"{column} must be a string or null")
+    
+    return row
+
+async def flush_import_batch(batch: Dict[str, Tuple[int, Dict]], errors: List[Dict]) -> Tuple[int, int]:
+    """
+    Upsert one batch of imported users.
+    
+    Args:
+        batch: Line number and row for each user_id in the batch
+        errors: Error reports to append failed lines to
+        
+    Returns:
+        Tuple[int, int]: Number of rows imported and number of rows that failed
+    """
+    if not batch:
+        return 0, 0
+    
+    try:
+        await run_in_threadpool(upsert_users, [row for _, row in batch.values()])
+    except Exception as e:
+        logger.error(f"Failed to import batch of {len(batch)} users: {str(e)}")
+        for line_number, _ in batch.values():
+            if len(errors) < USER_IMPORT_MAX_REPORTED_ERRORS:
+                errors.append({"line": line_number, "error": f"Database error: {str(e)}"})
+        return 0, len(batch)
+    
+    for user_id in batch:
+        user_writes.mark_known(user_id)
+    return len(batch), 0
+
+def require_import_admin(x_import_token: Optional[str] = Header(None)):
+    """Only allow requests carrying the admin import token."""
+    if not USER_IMPORT_TOKEN or x_import_token is None or not hmac.compare_digest(x_import_token, USER_IMPORT_TOKEN):
+        # Don't reveal whether imports are configured
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@router.post("/import-users", dependencies=[Depends(require_import_admin)])
+async def import_users(
+    request: Request,
+    batch_size: Optional[int] = Query(None, ge=1, le=USER_IMPORT_MAX_BATCH_SIZE),
+):
+    """
+    Bulk import users from an NDJSON request body, one user per line.
+    
+    The body is parsed as it streams in and written as batched upserts on
+    user_id, so memory use is bounded by the batch size regardless of the
+    size of the import. Invalid lines are skipped and reported by line number.
+    Columns missing from a record are set to null.
+    """
+    batch_size = batch_size or USER_IMPORT_BATCH_SIZE
+    
+    batch: Dict[str, Tuple[int, Dict]] = {}
+    errors: List[Dict] = []
+    line_number = 0
+    imported = 0
+    failed = 0
+    buffer = b""
+    
+    def report_error(error: str):
+        nonlocal failed
+        failed += 1
+        if len(errors) < USER_IMPORT_MAX_REPORTED_ERRORS:
+            errors.append({"line": line_number, "error": error})
+    
+    async def handle_line(line: bytes):
+        nonlocal batch, imported, failed
+        if not line.strip():
+            return
+        try:
+            row = parse_import_record(line)
+        except ValueError as e:
+            report_error(str(e))
+            return
+        
+        # A batch may hold each user only once, so a later line replaces an earlier one
+        batch[row["user_id"]] = (line_number, row)
+        if len(batch) >= batch_size:
+            batch_imported, batch_failed = await flush_import_batch(batch, errors)
+            imported += batch_imported
+            failed += batch_failed
+            batch = {}
+    
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line_number += 1
+                await handle_line(line)
+            
+            if len(buffer) > USER_IMPORT_MAX_LINE_BYTES:
+                raise HTTPException(status_code=413, detail=f"Line {line_number + 1} exceeds {USER_IMPORT_MAX_LINE_BYTES} bytes")
+        
+        if buffer:
+            line_number += 1
+            await handle_line(buffer)
+        
+        batch_imported, batch_failed = await flush_import_batch(batch, errors)
+        imported += batch_imported
+        failed += batch_failed
+    
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error in import_users: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    logger.info(f"User import finished: {line_number} lines, {imported} imported, {failed} failed")
+    
+    return {
+        "message": "User import finished",
+        "lines": line_number,
+        "imported": imported,
+        "failed": failed,
+        "errors": errors,
+        "errors_truncated": failed > len(errors),
+    }
@@ -1,11 +1,18 @@
 from fastapi import APIRouter, Request, HTTPException
-import logging
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, List
+import asyncio
+import base64
 import json
 import hmac
 import hashlib
+import os
 import time
 
-from ..config.settings import get_supabase_client, CLERK_WEBHOOK_SECRET, logger
+from ..config.settings import get_supabase_client, CLERK_WEBHOOK_SECRET, WEBHOOK_QUEUE_PATH, logger
+from ..utils.clerk import clerk_timestamp_to_iso, user_row_from_clerk
+from ..utils.event_queue import EventQueue
+from .users import delete_users, upsert_users
 
 # Initialize router
 router = APIRouter(tags=["webhooks"])
@@ -13,109 +20,295 @@ router = APIRouter(tags=["webhooks"])
 # Initialize Supabase client
 supabase = get_supabase_client()
 
+# Worker settings
+WEBHOOK_BATCH_WINDOW = float(os.getenv("WEBHOOK_BATCH_WINDOW", 0.5))  # seconds to wait for a burst to build up
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", 5))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", 100))
+WEBHOOK_RETENTION_SECONDS = 7 * 24 * 3600  # keep processed ids to recognize redeliveries
+SIGNATURE_TOLERANCE_SECONDS = 5 * 60
+
+# Events that carry a full user profile, and events that only mean the user signed in
+USER_PROFILE_EVENTS = {"user.created", "user.updated"}
+SESSION_EVENTS = {"session.created"}
+
+# Events are persisted here before we acknowledge them, and processed by the worker
+webhook_queue = EventQueue(WEBHOOK_QUEUE_PATH)
+
+_worker_task = None
+_wakeup = None
+
+
+def verify_webhook_signature(payload_str: str, svix_id: str, svix_timestamp: str, svix_signature: str) -> bool:
+    """
+    Verify a Svix webhook signature as sent by Clerk.
+
+    Args:
+        payload_str: The raw request body
+        svix_id: The svix-id header
+        svix_timestamp: The svix-timestamp header
+        svix_signature: The svix-signature header, a space separated list of "v1,<signature>"
+
+    Returns:
+        bool: True if one of the signatures matches and the timestamp is recent
+    """
+    try:
+        if abs(time.time() - int(svix_timestamp)) > SIGNATURE_TOLERANCE_SECONDS:
+            logger.error("Clerk webhook timestamp outside of tolerance")
+            return False
+    except ValueError:
+        return False
+
+    secret = CLERK_WEBHOOK_SECRET
+    if secret.startswith("whsec_"):
+        secret = secret[len("whsec_"):]
+
+    # Create the signature payload
+    payload = f"{svix_id}.{svix_timestamp}.{payload_str}"
+
+    # Compute HMAC
+    computed_signature = base64.b64encode(
+        hmac.new(base64.b64decode(secret), payload.encode("utf-8"), hashlib.sha256).digest()
+    ).decode("utf-8")
+
+    for versioned_signature in svix_signature.split(" "):
+        version, _, signature = versioned_signature.partition(",")
+        if version == "v1" and hmac.compare_digest(computed_signature, signature):
+            return True
+    return False
+
+
 @router.post("/webhook/clerk")
 async def clerk_webhook(request: Request):
-    """Handle Clerk webhooks for user events."""
+    """
+    Handle Clerk webhooks for user events.
+
+    The event is verified and persisted to the local webhook queue, then
+    acknowledged right away. The webhook worker processes it asynchronously.
+    """
     try:
         # Get the raw request body
         body = await request.body()
         payload_str = body.decode('utf-8')
-        
-        # Log the raw request for debugging
-        logger.info(f"Received webhook payload: {payload_str}")
-        
+
+        clerk_id = request.headers.get("svix-id")
+
         # Verify the webhook signature in production
         if CLERK_WEBHOOK_SECRET:
             # Get the signature from headers
             clerk_signature = request.headers.get("svix-signature")
             clerk_timestamp = request.headers.get("svix-timestamp")
-            clerk_id = request.headers.get("svix-id")
-            
+
             if not (clerk_signature and clerk_timestamp and clerk_id):
                 logger.error("Missing Clerk webhook signature headers")
                 raise HTTPException(status_code=400, detail="Missing signature headers")
-                
-            # Create the signature payload
-            payload = f"{clerk_timestamp}.{clerk_id}.{payload_str}"
-            
-            # Compute HMAC
-            computed_signature = hmac.new(
-                CLERK_WEBHOOK_SECRET.encode("utf-8"),
-                payload.encode("utf-8"),
-                hashlib.sha256
-            ).hexdigest()
-            
+
             # Verify the signature
-            if not hmac.compare_digest(computed_signature, clerk_signature):
+            if not verify_webhook_signature(payload_str, clerk_id, clerk_timestamp, clerk_signature):
                 logger.error("Invalid Clerk webhook signature")
                 raise HTTPException(status_code=401, detail="Invalid signature")
-        
+
         # Parse the JSON data
         try:
             data = json.loads(payload_str)
         except json.JSONDecodeError as e:
             logger.error(f"Invalid JSON payload: {e}")
             return {"status": "error", "message": "Invalid JSON payload"}
-        
-        # Log the entire webhook payload for debugging
-        logger.info(f"Processed webhook data: {data}")
-        
+
         # Get the event type
         event_type = data.get("type")
-        logger.info(f"Webhook event type: {event_type}")
-        
         if not event_type:
             logger.error("Missing event type in webhook payload")
             return {"status": "error", "message": "Missing event type"}
-        
-        if event_type == "user.deleted":
-            # Extract user ID from the correct location in the payload
-            user_data = data.get("data", {})
-            user_id = user_data.get("id")
-            logger.info(f"Extracted user_id from webhook: {user_id}")
-            
-            if not user_id:
-                logger.error("Missing user_id in webhook payload")
-                return {"status": "error", "message": "Missing user_id"}
-                
-            logger.info(f"Attempting to delete user from Supabase: {user_id}")
-            
-            # Check if user exists before deletion
-            try:
-                check_user = supabase.table("users").select("*").eq("user_id", user_id).execute()
-                user_exists = check_user.data and len(check_user.data) > 0
-                logger.info(f"User record exists in database: {user_exists}")
-                
-                if not user_exists:
-                    logger.warning(f"User {user_id} not found in database, nothing to delete")
-                    return {"status": "success", "message": f"User {user_id} not found in database, nothing to delete"}
-                
-                # Delete the user from Supabase
-                response = (
-                    supabase.table("users")
-                    .delete()
-                    .eq("user_id", user_id)
-                    .execute()
-                )
-                
-                # Log the response for debugging
-                logger.info(f"Supabase delete response: {response}")
-                
-                if hasattr(response, 'error') and response.error:
-                    logger.error(f"Failed to delete user from Supabase: {response.error}")
-                    return {"status": "error", "message": f"Failed to delete user from Supabase: {response.error}"}
-                
-                # Log success outcome
-                logger.info(f"Successfully deleted user {user_id} from Supabase")
-                return {"status": "success", "message": f"User {user_id} deleted from Supabase"}
-                
-            except Exception as e:
-                logger.error(f"Database error when deleting user: {str(e)}")
-                return {"status": "error", "message": f"Database error: {str(e)}"}
-        else:
-            logger.info(f"Ignoring non-deletion event: {event_type}")
-            return {"status": "success", "message": f"Ignored {event_type} event"}
-        
+
+        # Without svix headers (local testing), deduplicate on the payload itself
+        event_id = clerk_id or "sha256:" + hashlib.sha256(body).hexdigest()
+
+        if not webhook_queue.put(event_id, event_type, data):
+            logger.info(f"Duplicate webhook event {event_id} ({event_type}) ignored")
+            return {"status": "success", "message": "Duplicate event ignored"}
+
+        logger.info(f"Queued webhook event {event_id} ({event_type})")
+        if _wakeup is not None:
+            _wakeup.set()
+
+        return {"status": "success", "message": f"Queued {event_type} event"}
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Webhook processing error: {str(e)}")
-        return {"status": "error", "message": f"Error: {str(e)}"} 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+def update_sign_ins(sign_ins: Dict[str, str]):
+    """
+    Set `last_sign_in` of existing users, with one request per distinct timestamp.
+
+    An update rather than an upsert, so a sign-in of a user without a row
+    (its user.created event not processed yet) changes nothing instead of
+    inserting a partial row.
+    """
+    by_time: Dict[str, List[str]] = {}
+    for user_id, signed_in_at in sign_ins.items():
+        by_time.setdefault(signed_in_at, []).append(user_id)
+
+    for signed_in_at, user_ids in by_time.items():
+        response = (
+            supabase.table("users")
+            .update({"last_sign_in": signed_in_at})
+            .in_("user_id", user_ids)
+            .execute()
+        )
+        if hasattr(response, 'error') and response.error:
+            raise RuntimeError(f"Failed to update sign-ins in Supabase: {response.error}")
+
+
+async def apply_in_batches(operation, keys: List[str], event_ids: Dict[str, List[str]], build_batch=None) -> int:
+    """
+    Apply a batched Supabase operation and settle the queued events behind it.
+
+    Args:
+        operation: Called with one batch at a time
+        keys: The user ids to process
+        event_ids: The queued event ids behind each user id
+        build_batch: Turns a slice of `keys` into the batch passed to `operation`
+
+    Returns:
+        int: Number of events that failed and were returned to the queue
+    """
+    failed = 0
+    for start in range(0, len(keys), WEBHOOK_BATCH_SIZE):
+        batch = keys[start:start + WEBHOOK_BATCH_SIZE]
+        batch_event_ids = [event_id for key in batch for event_id in event_ids[key]]
+        try:
+            await run_in_threadpool(operation, build_batch(batch) if build_batch else batch)
+        except Exception as e:
+            logger.error(f"Database error when processing webhook events: {str(e)}")
+            webhook_queue.fail(batch_event_ids, str(e))
+            failed += len(batch_event_ids)
+            continue
+        webhook_queue.complete(batch_event_ids)
+    return failed
+
+
+async def process_webhook_events(events: List[Dict]) -> int:
+    """
+    Process a batch of queued webhook events.
+
+    Events are coalesced per user: profile events become batched upserts
+    keeping the latest data, sign-ins become updates of existing users, and
+    deletions become batched `in_` deletes. A user deleted in the batch gets no upsert. Events of other
+    types are acknowledged and ignored.
+
+    Returns:
+        int: Number of events that failed and were returned to the queue
+    """
+    profiles: Dict[str, Dict] = {}
+    sign_ins: Dict[str, str] = {}
+    deletions: Dict[str, List[str]] = {}
+    event_ids: Dict[str, List[str]] = {}
+    ignored = []
+
+    # Events are claimed oldest first, so later events overwrite earlier ones
+    for event in events:
+        data = event["payload"].get("data") or {}
+
+        if event["kind"] in USER_PROFILE_EVENTS and data.get("id"):
+            user_id = data["id"]
+            profiles[user_id] = user_row_from_clerk(data)
+        elif event["kind"] in SESSION_EVENTS and data.get("user_id"):
+            user_id = data["user_id"]
+            signed_in_at = clerk_timestamp_to_iso(data.get("created_at"))
+            if signed_in_at and signed_in_at > sign_ins.get(user_id, ""):
+                sign_ins[user_id] = signed_in_at
+        elif event["kind"] == "user.deleted" and data.get("id"):
+            user_id = data["id"]
+            deletions.setdefault(user_id, [])
+        else:
+            logger.info(f"Ignoring webhook event {event['id']} ({event['kind']})")
+            ignored.append(event["id"])
+            continue
+
+        event_ids.setdefault(user_id, []).append(event["id"])
+
+    webhook_queue.complete(ignored)
+
+    # A sign-in newer than the profile event wins; a full profile makes a separate sign-in update redundant
+    for user_id, signed_in_at in list(sign_ins.items()):
+        if user_id in profiles:
+            if signed_in_at > (profiles[user_id]["last_sign_in"] or ""):
+                profiles[user_id]["last_sign_in"] = signed_in_at
+            del sign_ins[user_id]
+
+    for user_id in deletions:
+        profiles.pop(user_id, None)
+        sign_ins.pop(user_id, None)
+
+    failed = 0
+    failed += await apply_in_batches(
+        upsert_users, list(profiles), event_ids,
+        lambda batch: [profiles[user_id] for user_id in batch]
+    )
+    # Sign-ins only update users that exist, leaving their other columns untouched
+    failed += await apply_in_batches(
+        update_sign_ins, list(sign_ins), event_ids,
+        lambda batch: {user_id: sign_ins[user_id] for user_id in batch}
+    )
+    failed += await apply_in_batches(delete_users, list(deletions), event_ids)
+
+    logger.info(f"Processed webhook events: {len(profiles)} profiles, {len(sign_ins)} sign-ins, {len(deletions)} deletions")
+    return failed
+
+
+async def run_webhook_worker():
+    """Process queued webhook events until cancelled."""
+    logger.info("Webhook worker started")
+    last_purge = 0.0
+
+    while True:
+        try:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=WEBHOOK_POLL_INTERVAL)
+                # Give a burst of deliveries a moment to arrive so it is handled in one batch
+                await asyncio.sleep(WEBHOOK_BATCH_WINDOW)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+
+            # Drain the queue, leaving failed events for the next poll
+            while True:
+                events = webhook_queue.claim(WEBHOOK_BATCH_SIZE)
+                if not events:
+                    break
+                failed = await process_webhook_events(events)
+                if failed or len(events) < WEBHOOK_BATCH_SIZE:
+                    break
+
+            if time.time() - last_purge > 3600:
+                webhook_queue.purge_completed(WEBHOOK_RETENTION_SECONDS)
+                last_purge = time.time()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in webhook worker: {str(e)}")
+
+
+def start_webhook_worker():
+    """Start the webhook worker on the running event loop."""
+    global _worker_task, _wakeup
+    if _worker_task is None:
+        _wakeup = asyncio.Event()
+        _worker_task = asyncio.create_task(run_webhook_worker())
+
+
+async def stop_webhook_worker():
+    """Stop the webhook worker. Unprocessed events stay queued for the next start."""
+    global _worker_task
+    if _worker_task is not None:
+        _worker_task.cancel()
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+        _worker_task = None
+    logger.info("Webhook worker stopped")
@@ -0,0 +1,209 @@
+"""
+Scheduled jobs and the leader-elected scheduler that runs them.
+
+Every process that takes part in the election (each API worker in the
+"embedded" mode, or the processes started with `python run.py scheduler`)
+competes for one lease, and only the leader runs the cron jobs. When the
+leader dies, another process takes over within the election interval (or
+the lease TTL for the database lease).
+"""
+
+import asyncio
+import signal
+from typing import Optional
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from .config.settings import (
+    API_BASE_URL,
+    SCHEDULER_ELECTION,
+    SCHEDULER_ELECTION_INTERVAL,
+    SCHEDULER_LEASE_TTL,
+    SCHEDULER_LOCK_PATH,
+    get_supabase_client,
+    logger,
+    supabase_registry,
+    validate_config,
+)
+from .jobs import job_queue
+from .utils.leader import FileLease, LeaderElector, NoLease, SupabaseLease
+
+async def sync_users_job():
+    """Queue a full user synchronization for the job worker."""
+    job_id = job_queue.enqueue("sync_users")
+    logger.info(f"Queued user synchronization (job {job_id})")
+
+async def reconcile_storage_usage_job():
+    """Queue a correction of the per-user storage usage counters for the job worker."""
+    job_id = job_queue.enqueue("reconcile_storage_usage")
+    logger.info(f"Queued storage usage reconciliation (job {job_id})")
+
+async def rebuild_search_index_job():
+    """Queue a rebuild of the recording search index for the job worker."""
+    job_id = job_queue.enqueue("rebuild_search_index")
+    logger.info(f"Queued search index rebuild (job {job_id})")
+
+async def sweep_orphaned_recordings_job():
+    """Queue a purge of recordings left behind by deleted users for the job worker."""
+    job_id = job_queue.enqueue("sweep_orphaned_recordings")
+    logger.info(f"Queued orphaned recordings sweep (job {job_id})")
+
+async def sweep_expired_uploads_job():
+    """Queue the removal of signed uploads never finalized for the job worker."""
+    job_id = job_queue.enqueue("sweep_expired_uploads")
+    logger.info(f"Queued expired uploads sweep (job {job_id})")
+
+async def check_reminders():
+    """Check for reminders that need to be sent."""
+    # Imported here since it is only needed once the scheduler runs
+    import aiohttp
+
+    try:
+        logger.info("Running reminder check...")
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                f"{API_BASE_URL}/reminder/check-reminders",
+                headers={"Content-Type": "application/json"}
+            ) as response:
+                if response.status != 200:
+                    logger.error(f"Error checking reminders: {await response.text()}")
+                else:
+                    result = await response.json()
+                    logger.info(f"Reminder check completed successfully: {result}")
+    except Exception as e:
+        logger.error(f"Error in check_reminders scheduler: {str(e)}")
+
+def create_scheduler() -> AsyncIOScheduler:
+    """Create a scheduler with all cron jobs added."""
+    scheduler = AsyncIOScheduler()
+
+    # Schedule the user synchronization task to run daily at 3:00 AM
+    scheduler.add_job(
+        sync_users_job,
+        CronTrigger(hour=22, minute=7),  # Run at 3:00 AM every day
+        id="sync_users_job",
+        name="Sync users between Clerk and Supabase",
+        replace_existing=True,
+    )
+
+    # Correct drift in the storage usage counters daily
+    scheduler.add_job(
+        reconcile_storage_usage_job,
+        CronTrigger(hour=4, minute=30),
+        id="reconcile_storage_usage_job",
+        name="Reconcile storage usage counters",
+        replace_existing=True,
+    )
+
+    # Rebuild the search index daily, picking up changes made outside this API
+    scheduler.add_job(
+        rebuild_search_index_job,
+        CronTrigger(hour=4, minute=45),
+        id="rebuild_search_index_job",
+        name="Rebuild recording search index",
+        replace_existing=True,
+    )
+
+    # Weekly, purge recordings of users deleted without a purge being queued
+    scheduler.add_job(
+        sweep_orphaned_recordings_job,
+        CronTrigger(day_of_week="sun", hour=5, minute=0),
+        id="sweep_orphaned_recordings_job",
+        name="Purge recordings of deleted users",
+        replace_existing=True,
+    )
+
+    # Hourly, remove objects of signed uploads whose URLs expired before they were finalized
+    scheduler.add_job(
+        sweep_expired_uploads_job,
+        CronTrigger(minute=15),
+        id="sweep_expired_uploads_job",
+        name="Remove expired signed uploads",
+        replace_existing=True,
+    )
+
+    # Add job to check reminders every minute
+    scheduler.add_job(
+        check_reminders,
+        trigger=CronTrigger(minute="*"),
+        id="check_reminders",
+        name="Check and send reminders",
+        replace_existing=True
+    )
+
+    return scheduler
+
+def create_lease(kind: str = SCHEDULER_ELECTION):
+    """
+    Create the lease processes compete for.
+
+    Args:
+        kind: "file" for an OS lock (one host), "database" for a Supabase lease row (any number of hosts), "none" to always lead
+    """
+    if kind == "file":
+        return FileLease(SCHEDULER_LOCK_PATH)
+    if kind == "database":
+        return SupabaseLease(get_supabase_client(), "scheduler", ttl=SCHEDULER_LEASE_TTL)
+    if kind == "none":
+        return NoLease()
+    raise ValueError(f"Unknown scheduler election: {kind}")
+
+class SchedulerService:
+    """Runs the cron jobs while this process holds the scheduler lease."""
+
+    def __init__(self, lease=None, interval: float = SCHEDULER_ELECTION_INTERVAL):
+        self.scheduler: Optional[AsyncIOScheduler] = None
+        self.elector = LeaderElector(
+            lease if lease is not None else create_lease(),
+            on_elected=self._start_jobs,
+            on_demoted=self._stop_jobs,
+            interval=interval,
+        )
+
+    @property
+    def is_leader(self) -> bool:
+        return self.elector.is_leader
+
+    def _start_jobs(self):
+        self.scheduler = create_scheduler()
+        self.scheduler.start()
+        logger.info("Scheduler started")
+
+        # Log all scheduled jobs
+        for job in self.scheduler.get_jobs():
+            logger.info(f"Scheduled job: {job.name} (next run: {job.next_run_time})")
+
+    def _stop_jobs(self):
+        if self.scheduler is not None:
+            # Running jobs finish on their own; no new runs are started
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
+            logger.info("Scheduler stopped")
+
+    def start(self):
+        """Join the election on the running event loop."""
+        self.elector.start()
+
+    async def stop(self):
+        """Leave the election, stopping the jobs if this process is the leader."""
+        await self.elector.stop()
+
+async def run_scheduler_process():
+    """Run the scheduler as its own process until SIGINT or SIGTERM."""
+    validate_config()
+
+    service = SchedulerService()
+    service.start()
+    logger.info(f"Scheduler process started (election: {SCHEDULER_ELECTION})")
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopped.set)
+
+    await stopped.wait()
+
+    logger.info("Scheduler process shutting down")
+    await service.stop()
+    supabase_registry.close()
@@ -0,0 +1,129 @@
+from fastapi import Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, Optional, Tuple
+import os
+import threading
+import time
+
+from ..config.settings import get_supabase_client, logger
+from .clerk import get_clerk_user_data
+
+# Initialize Supabase client
+supabase = get_supabase_client()
+
+USER_LOOKUP_TTL = float(os.getenv("USER_LOOKUP_TTL", 300))
+USER_LOOKUP_NEGATIVE_TTL = float(os.getenv("USER_LOOKUP_NEGATIVE_TTL", 30))
+USER_LOOKUP_CACHE_SIZE = int(os.getenv("USER_LOOKUP_CACHE_SIZE", 50000))
+
+
+class UserLookupCache:
+    """
+    TTL cache mapping Clerk user ids to their `users` row id.
+
+    Missing users are cached as well (negative caching), for a shorter time,
+    so that repeated requests for an unknown user do not hit the database.
+    Deletion and creation paths call invalidate() so that neither kind of
+    entry outlives a change to the row.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float, max_size: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries: Dict[str, Tuple[Optional[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Tuple[bool, Optional[int]]:
+        """
+        Look up a cached entry.
+
+        Returns:
+            Tuple[bool, Optional[int]]: Whether there was a live entry, and the row id (None if the user does not exist)
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False, None
+        row_id, expires_at = entry
+        if expires_at <= time.monotonic():
+            with self._lock:
+                self._entries.pop(user_id, None)
+            return False, None
+        return True, row_id
+
+    def put(self, user_id: str, row_id: Optional[int]):
+        """Cache the row id of a user, or None if the user does not exist."""
+        ttl = self.ttl if row_id is not None else self.negative_ttl
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                self._evict()
+            self._entries[user_id] = (row_id, time.monotonic() + ttl)
+
+    def invalidate(self, user_id: str):
+        """Drop the cached entry of a user."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self):
+        # Drop expired entries first, then the oldest half if that was not enough
+        now = time.monotonic()
+        for user_id in [user_id for user_id, (_, expires_at) in self._entries.items() if expires_at <= now]:
+            del self._entries[user_id]
+        if len(self._entries) >= self.max_size:
+            for user_id in list(self._entries)[:len(self._entries) // 2]:
+                del self._entries[user_id]
+
+
+user_lookup_cache = UserLookupCache(USER_LOOKUP_TTL, USER_LOOKUP_NEGATIVE_TTL, USER_LOOKUP_CACHE_SIZE)
+
+
+def fetch_user_row_id(user_id: str) -> Optional[int]:
+    """Get the `users` row id of a Clerk user from Supabase, or None if there is no row."""
+    response = supabase.table("users").select("id").eq("user_id", user_id).execute()
+    if not response.data:
+        return None
+    return response.data[0]["id"]
+
+
+async def resolve_user_row_id(user_id: str) -> Optional[int]:
+    """Get the `users` row id of a Clerk user, using the lookup cache."""
+    found, row_id = user_lookup_cache.get(user_id)
+    if found:
+        return row_id
+
+    row_id = await run_in_threadpool(fetch_user_row_id, user_id)
+    user_lookup_cache.put(user_id, row_id)
+    return row_id
+
+
+def verified_user_id(authorization: Optional[str]) -> Optional[str]:
+    """Clerk user id of a valid session token in an Authorization header, or None; never raises."""
+    try:
+        return get_clerk_user_data(authorization)["id"]
+    except Exception:
+        return None
+
+
+async def get_current_user(authorization: Optional[str] = Header(None)) -> Dict:
+    """
+    FastAPI dependency returning the authenticated user.
+
+    The user is taken from the verified Clerk session token in the
+    Authorization header and must have a row in the `users` table.
+
+    Returns:
+        Dict: {"user_id": Clerk user id, "id": users row id, "claims": token claims}
+    """
+    # In a thread, since an unknown signing key makes verification fetch Clerk's JWKS
+    clerk_user = await run_in_threadpool(get_clerk_user_data, authorization)
+    user_id = clerk_user["id"]
+
+    row_id = await resolve_user_row_id(user_id)
+    if row_id is None:
+        logger.warning(f"Authenticated user {user_id} not found in database")
+        raise HTTPException(status_code=404, detail="User not found in database")
+
+    return {"user_id": user_id, "id": row_id, "claims": clerk_user["claims"]}
@@ -1,34 +1,244 @@
 import requests
 from fastapi import HTTPException
-from ..config.settings import  logger
-import base64
-import json
+from ..config.settings import CLERK_SECRET_KEY, CLERK_JWKS_URL, CLERK_ISSUER, CLERK_AUTHORIZED_PARTIES, logger
+from .metrics import track_upstream
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+import hashlib
+import threading
+import time
+import jwt
 
 
-def get_clerk_user_data(authorization: str):
-    if not authorization.startswith('Bearer '):
+class JWKSCache:
+    """
+    In-process cache of a JSON Web Key Set.
+
+    Keys are looked up by `kid` without any network call. An unknown `kid`
+    (e.g. after Clerk rotated its keys) triggers a refresh of the whole set,
+    at most once every `min_refresh_interval` seconds so that tokens with
+    made-up key ids cannot make us hammer the JWKS endpoint.
+    """
+
+    def __init__(self, fetch: Callable[[], Dict], min_refresh_interval: float = 60.0, ttl: float = 24 * 3600):
+        self.fetch = fetch
+        self.min_refresh_interval = min_refresh_interval
+        self.ttl = ttl
+        self._keys: Dict[str, object] = {}
+        self._fetched_at = 0.0
+        self._attempted_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_key(self, kid: str):
+        """
+        Get the public key for a key id.
+
+        Raises:
+            jwt.InvalidKeyError: If the key set does not contain the key id
+        """
+        key = self._keys.get(kid)
+        if key is not None and time.monotonic() - self._fetched_at < self.ttl:
+            return key
+
+        with self._lock:
+            key = self._keys.get(kid)
+            now = time.monotonic()
+            stale = now - self._fetched_at >= self.ttl
+            may_refresh = not self._keys or now - self._attempted_at >= self.min_refresh_interval
+            if (key is None or stale) and may_refresh:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    # Keep serving the keys we have if Clerk is unreachable
+                    if key is None:
+                        raise
+                    logger.warning(f"Failed to refresh JWKS, using cached keys: {str(e)}")
+                key = self._keys.get(kid, key)
+
+        if key is None:
+            raise jwt.InvalidKeyError(f"Unknown signing key: {kid}")
+        return key
+
+    def refresh(self):
+        """Fetch the key set and replace the cached keys."""
+        self._attempted_at = time.monotonic()
+        jwks = self.fetch()
+        keys = {}
+        for jwk in jwks.get("keys", []):
+            if jwk.get("kid") and jwk.get("kty") == "RSA":
+                keys[jwk["kid"]] = jwt.PyJWK(jwk, algorithm="RS256").key
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+        logger.info(f"Loaded {len(keys)} signing keys from JWKS")
+
+
+class ClaimsCache:
+    """
+    Bounded LRU cache of verified token claims, keyed by token hash.
+
+    Entries expire at the token's `exp`, so a cached token is never
+    accepted after it would have failed verification.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def token_hash(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[Dict]:
+        """Get the cached claims of a token, or None if it is not cached or has expired."""
+        token_hash = self.token_hash(token)
+        with self._lock:
+            claims = self._entries.get(token_hash)
+            if claims is None:
+                return None
+            if claims["exp"] <= time.time():
+                del self._entries[token_hash]
+                return None
+            self._entries.move_to_end(token_hash)
+            return claims
+
+    def put(self, token: str, claims: Dict):
+        """Cache the verified claims of a token."""
+        token_hash = self.token_hash(token)
+        with self._lock:
+            self._entries[token_hash] = claims
+            self._entries.move_to_end(token_hash)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ClerkTokenVerifier:
+    """
+    Verifies Clerk session tokens (RS256 JWTs).
+
+    Verified claims are cached until the token expires, so repeat requests
+    with the same token skip the signature check.
+    """
+
+    def __init__(
+        self,
+        jwks: JWKSCache,
+        issuer: Optional[str] = None,
+        authorized_parties: Optional[List[str]] = None,
+        leeway: float = 5.0,
+        claims_cache: Optional[ClaimsCache] = None,
+    ):
+        self.jwks = jwks
+        self.issuer = issuer
+        self.authorized_parties = authorized_parties or []
+        self.leeway = leeway
+        self.claims_cache = claims_cache or ClaimsCache()
+
+    def verify(self, token: str) -> Dict:
+        """
+        Verify a session token and return its claims.
+
+        Raises:
+            jwt.InvalidTokenError: If the token is malformed, expired or not signed by Clerk
+        """
+        claims = self.claims_cache.get(token)
+        if claims is not None:
+            return claims
+
+        header = jwt.get_unverified_header(token)
+        if header.get("alg") != "RS256":
+            raise jwt.InvalidAlgorithmError(f"Unsupported token algorithm: {header.get('alg')}")
+        if not header.get("kid"):
+            raise jwt.InvalidTokenError("Token has no key id")
+
+        claims = jwt.decode(
+            token,
+            self.jwks.get_key(header["kid"]),
+            algorithms=["RS256"],
+            issuer=self.issuer,
+            leeway=self.leeway,
+            options={"require": ["exp", "iat", "sub"], "verify_aud": False},
+        )
+
+        azp = claims.get("azp")
+        if self.authorized_parties and azp and azp not in self.authorized_parties:
+            raise jwt.InvalidTokenError(f"Token issued for unauthorized party: {azp}")
+
+        self.claims_cache.put(token, claims)
+        return claims
+
+
+def fetch_clerk_jwks() -> Dict:
+    """Fetch Clerk's JSON Web Key Set."""
+    headers = {"Authorization": f"Bearer {CLERK_SECRET_KEY}"} if CLERK_SECRET_KEY else {}
+    with track_upstream("clerk", "jwks"):
+        response = requests.get(CLERK_JWKS_URL, headers=headers, timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+
+# Shared verifier for incoming requests
+clerk_token_verifier = ClerkTokenVerifier(
+    JWKSCache(fetch_clerk_jwks),
+    issuer=CLERK_ISSUER,
+    authorized_parties=CLERK_AUTHORIZED_PARTIES,
+)
+
+
+def get_clerk_user_data(authorization: str, verifier: Optional[ClerkTokenVerifier] = None):
+    if not authorization or not authorization.startswith('Bearer '):
         raise HTTPException(status_code=401, detail="Invalid authorization header format")
         
     token = authorization.split(' ')[1]
     
     try:
-        # Decode the JWT token to get the user ID
-        parts = token.split('.')
-        if len(parts) != 3:
-            raise HTTPException(status_code=401, detail="Invalid token format")
-
-        # Decode the payload
-        payload = parts[1]
-        padding = '=' * (4 - len(payload) % 4)
-        payload += padding
-        decoded_payload = base64.urlsafe_b64decode(payload)
-        token_data = json.loads(decoded_payload)
-
-        # Get the user ID from the token
-        user_id = token_data.get('sub')
-        if not user_id:
-            raise HTTPException(status_code=401, detail="No user ID found in token")
-
-        return {"id": user_id}
-    except Exception as e:
-        raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
\ No newline at end of file
+        # Verify the JWT token to get the user ID
+        token_data = (verifier or clerk_token_verifier).verify(token)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token has expired")
+    # PyJWTError also covers unknown signing keys and malformed keys in the JWKS
+    except (jwt.PyJWTError, requests.RequestException) as e:
+        logger.warning(f"Rejected session token: {str(e)}")
+        raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
+
+    # Get the user ID from the token
+    return {"id": token_data["sub"], "claims": token_data}
+
+
+def clerk_timestamp_to_iso(timestamp: Optional[int]) -> Optional[str]:
+    """Convert a Clerk timestamp (milliseconds since the epoch) to an ISO 8601 string."""
+    if not timestamp:
+        return None
+    return datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc).isoformat()
+
+
+def user_row_from_clerk(user_data: Dict) -> Dict:
+    """
+    Build a `users` row from a Clerk user object, as found in webhooks and exports.
+
+    The columns match what the frontend sends to POST /sync-user.
+    """
+    email = None
+    email_addresses = user_data.get("email_addresses") or []
+    for email_address in email_addresses:
+        if email_address.get("id") == user_data.get("primary_email_address_id"):
+            email = email_address.get("email_address")
+            break
+    if email is None and email_addresses:
+        email = email_addresses[0].get("email_address")
+
+    return {
+        "user_id": user_data["id"],
+        "created_at": clerk_timestamp_to_iso(user_data.get("created_at")),
+        "last_sign_in": clerk_timestamp_to_iso(user_data.get("last_sign_in_at")),
+        "username": user_data.get("username"),
+        "first_name": user_data.get("first_name"),
+        "last_name": user_data.get("last_name"),
+        "profile_image_url": user_data.get("image_url") or user_data.get("profile_image_url"),
+        "email": email,
+    }
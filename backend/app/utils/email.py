@@ -5,6 +5,8 @@ import os
 from dotenv import load_dotenv
 import logging
 
+from .metrics import track_upstream
+
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -39,18 +41,19 @@ def send_email(to_email: str, subject: str, body: str) -> bool:
         # Add body
         msg.attach(MIMEText(body, 'html'))
         
-        # Create SMTP session
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        
-        # Login to SMTP server
-        server.login(EMAIL_USERNAME, EMAIL_PASSWORD)
-        
-        # Send email
-        server.sendmail(EMAIL_USERNAME, to_email, msg.as_string())
-        
-        # Close SMTP session
-        server.quit()
+        with track_upstream("smtp", "send"):
+            # Create SMTP session
+            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+            server.starttls()
+            
+            # Login to SMTP server
+            server.login(EMAIL_USERNAME, EMAIL_PASSWORD)
+            
+            # Send email
+            server.sendmail(EMAIL_USERNAME, to_email, msg.as_string())
+            
+            # Close SMTP session
+            server.quit()
         
         logger.info(f"Email sent successfully to {to_email}")
         return True
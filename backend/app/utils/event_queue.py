@@ -0,0 +1,233 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class EventQueue:
+    """
+    Durable, idempotent local event queue backed by SQLite.
+
+    Events are keyed by an id supplied by the producer, so putting the same
+    event twice is a no-op. Consumers claim pending events for a lease; events
+    whose lease runs out (e.g. because the process died mid-batch) become
+    claimable again. Several processes on the same host can share one file.
+    """
+
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    DEAD = "dead"
+
+    def __init__(self, path: str, max_attempts: int = 5, lease_seconds: float = 300.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+        # Reentrant, since the connection is opened lazily while the lock is held
+        self._lock = threading.RLock()
+        self._db = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Opened on first use so that creating a queue at import time touches no files
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    self._db = self._open()
+        return self._db
+
+    def _open(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS events (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                claimed_by TEXT,
+                claimed_at REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS events_status_created ON events (status, created_at)")
+        return conn
+
+    def put(self, event_id: str, kind: str, payload: Dict) -> bool:
+        """
+        Add an event to the queue unless an event with the same id exists.
+
+        Args:
+            event_id: Unique id of the event, used for deduplication
+            kind: The event type
+            payload: JSON-serializable event data
+
+        Returns:
+            bool: True if the event was added, False if it was a duplicate
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO events (id, kind, payload, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (event_id, kind, json.dumps(payload), self.PENDING, now, now),
+            )
+        return cursor.rowcount == 1
+
+    def put_many(self, events: Iterable[Tuple[str, str, Dict]]) -> int:
+        """
+        Add several events in one transaction, skipping ids that already exist.
+
+        Args:
+            events: (event_id, kind, payload) tuples
+
+        Returns:
+            int: Number of events added
+        """
+        now = time.time()
+        rows = [(event_id, kind, json.dumps(payload), self.PENDING, now, now) for event_id, kind, payload in events]
+        if not rows:
+            return 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.executemany(
+                    "INSERT OR IGNORE INTO events (id, kind, payload, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount
+
+    def claim(self, limit: int = 100) -> List[Dict]:
+        """
+        Claim up to `limit` events for processing, oldest first.
+
+        Returns:
+            List[Dict]: The claimed events with their id, kind, payload and attempts
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    """
+                    UPDATE events SET status = ?, claimed_by = ?, claimed_at = ?, attempts = attempts + 1, updated_at = ?
+                    WHERE id IN (
+                        SELECT id FROM events
+                        WHERE status = ? OR (status = ? AND claimed_at < ?)
+                        ORDER BY created_at LIMIT ?
+                    )
+                    """,
+                    (self.PROCESSING, self.owner, now, now, self.PENDING, self.PROCESSING, now - self.lease_seconds, limit),
+                )
+                rows = self._conn.execute(
+                    "SELECT id, kind, payload, attempts FROM events WHERE status = ? AND claimed_by = ? AND claimed_at = ? ORDER BY created_at",
+                    (self.PROCESSING, self.owner, now),
+                ).fetchall()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return [
+            {"id": row["id"], "kind": row["kind"], "payload": json.loads(row["payload"]), "attempts": row["attempts"]}
+            for row in rows
+        ]
+
+    def renew(self, event_ids: Iterable[str]) -> int:
+        """
+        Extend the lease of events this consumer is still processing.
+
+        Returns:
+            int: Number of events renewed; events claimed by another consumer in the meantime are not
+        """
+        event_ids = list(event_ids)
+        if not event_ids:
+            return 0
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.executemany(
+                "UPDATE events SET claimed_at = ?, updated_at = ? WHERE id = ? AND status = ? AND claimed_by = ?",
+                [(now, now, event_id, self.PROCESSING, self.owner) for event_id in event_ids],
+            )
+        return cursor.rowcount
+
+    def complete(self, event_ids: Iterable[str]):
+        """Mark claimed events as done."""
+        event_ids = list(event_ids)
+        if not event_ids:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE events SET status = ?, last_error = NULL, updated_at = ? WHERE id = ?",
+                [(self.DONE, now, event_id) for event_id in event_ids],
+            )
+
+    def fail(self, event_ids: Iterable[str], error: str):
+        """
+        Return claimed events to the queue after a failed attempt.
+
+        Events that have used up `max_attempts` are marked dead instead.
+        """
+        event_ids = list(event_ids)
+        if not event_ids:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE events SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, last_error = ?, updated_at = ? WHERE id = ?",
+                [(self.max_attempts, self.DEAD, self.PENDING, error, now, event_id) for event_id in event_ids],
+            )
+        logger.warning(f"Failed to process {len(event_ids)} queued events: {error}")
+
+    def counts(self) -> Dict[str, int]:
+        """Number of events in each status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS count FROM events GROUP BY status").fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+    def purge_completed(self, older_than_seconds: float) -> int:
+        """
+        Delete done events older than the given age.
+
+        Completed events are kept for a while so that redeliveries are still
+        recognized as duplicates.
+
+        Returns:
+            int: Number of events deleted
+        """
+        cutoff = time.time() - older_than_seconds
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM events WHERE status = ? AND updated_at < ?",
+                (self.DONE, cutoff),
+            )
+        return cursor.rowcount
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
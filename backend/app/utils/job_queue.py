@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .event_queue import EventQueue
+from .metrics import background_job_duration_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """
+    Persistent queue of background jobs, stored in an EventQueue.
+
+    A job is a handler name plus JSON-serializable keyword arguments. Jobs
+    with the same id are only queued once, so callers can pass an id to
+    deduplicate (e.g. one reminder check per minute).
+    """
+
+    def __init__(self, queue: EventQueue):
+        self.queue = queue
+        self._listeners: List[Callable[[], None]] = []
+
+    def enqueue(self, name: str, payload: Optional[Dict] = None, job_id: Optional[str] = None) -> str:
+        """
+        Queue a job.
+
+        Returns:
+            str: The job id
+        """
+        job_id = job_id or uuid.uuid4().hex
+        if self.queue.put(job_id, name, payload or {}):
+            self._notify()
+        return job_id
+
+    def enqueue_many(self, jobs: Iterable[Tuple[str, Dict, Optional[str]]]) -> int:
+        """
+        Queue several jobs in one transaction.
+
+        Args:
+            jobs: (name, payload, job_id or None) tuples
+
+        Returns:
+            int: Number of jobs queued (duplicates are skipped)
+        """
+        added = self.queue.put_many((job_id or uuid.uuid4().hex, name, payload) for name, payload, job_id in jobs)
+        if added:
+            self._notify()
+        return added
+
+    def subscribe(self, callback: Callable[[], None]):
+        """Call `callback` whenever a job is queued in this process."""
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback: Callable[[], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self):
+        for callback in list(self._listeners):
+            callback()
+
+
+class JobWorker:
+    """
+    Runs queued jobs in a thread or process pool.
+
+    Up to `concurrency` jobs run at a time. Jobs queued from the same process
+    are picked up right away; jobs queued by other processes within
+    `poll_interval` seconds. A failed job is retried until the queue's
+    `max_attempts` is used up. The lease of a running job is renewed every
+    third of the queue's lease, so a job may run for any length of time and
+    is only claimed again once its worker stopped renewing it (e.g. died).
+
+    Args:
+        job_queue: The queue to take jobs from
+        execute: Module-level function taking (name, payload) that runs a job; with a process pool it must be importable by the workers
+        concurrency: Maximum number of jobs running at a time
+        pool: "thread" or "process"
+        poll_interval: Seconds between checks for jobs queued by other processes
+        retention_seconds: How long finished jobs are kept, so their ids still deduplicate
+        observe: Called with (name, outcome, seconds) after each job, e.g. to record more metrics
+        should_profile: Called with a job's name before it runs; if it returns True, the job runs as execute(name, payload, True)
+    """
+
+    def __init__(
+        self,
+        job_queue: JobQueue,
+        execute: Callable[[str, Dict], Any],
+        concurrency: int = 4,
+        pool: str = "thread",
+        poll_interval: float = 1.0,
+        retention_seconds: float = 24 * 3600,
+        observe: Optional[Callable[[str, str, float], None]] = None,
+        should_profile: Optional[Callable[[str], bool]] = None,
+    ):
+        if pool not in ("thread", "process"):
+            raise ValueError(f"Unknown worker pool: {pool}")
+        self.job_queue = job_queue
+        self.execute = execute
+        self.concurrency = concurrency
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.observe = observe
+        self.should_profile = should_profile
+
+        self._executor: Optional[Executor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _create_executor(self) -> Executor:
+        if self.pool == "process":
+            # Spawned rather than forked, since the parent runs threads (logging, pools)
+            return ProcessPoolExecutor(max_workers=self.concurrency, mp_context=multiprocessing.get_context("spawn"))
+        return ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="job-worker")
+
+    def _wake(self):
+        # Jobs may be queued from any thread, e.g. by a job fanning out more jobs
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _heartbeat(self, job: Dict):
+        interval = self.job_queue.queue.lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not self.job_queue.queue.renew([job["id"]]):
+                    logger.warning(f"Lost the lease of job {job['kind']} ({job['id']})")
+                    return
+            except Exception as e:
+                logger.error(f"Failed to renew the lease of job {job['kind']} ({job['id']}): {str(e)}")
+
+    async def _run_job(self, job: Dict):
+        name = job["kind"]
+        outcome = "success"
+        started = time.perf_counter()
+        executor = self._executor
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            args = (name, job["payload"], True) if self.should_profile and self.should_profile(name) else (name, job["payload"])
+            await self._loop.run_in_executor(executor, self.execute, *args)
+            self.job_queue.queue.complete([job["id"]])
+        except Exception as e:
+            if isinstance(e, BrokenExecutor) and self._executor is executor:
+                # A pool process died (e.g. killed for memory); later jobs get a new pool
+                logger.error("Job worker pool broke, starting a new one")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._create_executor()
+            outcome = "error"
+            logger.error(f"Job {name} ({job['id']}) failed on attempt {job['attempts']}: {str(e)}")
+            self.job_queue.queue.fail([job["id"]], str(e))
+        finally:
+            heartbeat.cancel()
+            elapsed = time.perf_counter() - started
+            background_job_duration_seconds.observe(elapsed, job=name, outcome=outcome)
+            if self.observe is not None:
+                self.observe(name, outcome, elapsed)
+            logger.info(f"Job {name} ({job['id']}) finished in {elapsed:.3f}s ({outcome})")
+
+    async def _run(self):
+        logger.info(f"Job worker started ({self.pool} pool, concurrency {self.concurrency})")
+        last_purge = 0.0
+        while True:
+            try:
+                if time.time() - last_purge > 3600:
+                    self.job_queue.queue.purge_completed(self.retention_seconds)
+                    last_purge = time.time()
+
+                free = self.concurrency - len(self._running)
+                jobs = self.job_queue.queue.claim(free) if free > 0 else []
+                for job in jobs:
+                    task = asyncio.create_task(self._run_job(job))
+                    self._running.add(task)
+                    task.add_done_callback(self._job_done)
+
+                # Check again right away if the queue may hold more jobs than we could take
+                if jobs and len(jobs) == free:
+                    await asyncio.sleep(0)
+                    if len(self._running) < self.concurrency:
+                        continue
+
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in job worker: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+
+    def _job_done(self, task: asyncio.Task):
+        self._running.discard(task)
+        # A slot is free again
+        self._wakeup.set()
+
+    def start(self):
+        """Start running jobs on the running event loop."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._executor = self._create_executor()
+        self.job_queue.subscribe(self._wake)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 30.0):
+        """
+        Stop taking jobs and wait up to `timeout` seconds for running ones.
+
+        Jobs that are still running after that are claimed again by a worker
+        once their lease runs out.
+        """
+        if self._task is None:
+            return
+        self.job_queue.unsubscribe(self._wake)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        if self._running:
+            done, pending = await asyncio.wait(self._running, timeout=timeout)
+            if pending:
+                logger.warning(f"Stopping job worker with {len(pending)} jobs still running")
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        logger.info("Job worker stopped")
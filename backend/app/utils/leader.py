@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def holder_id() -> str:
+    """Identify this process in lease records and logs."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class NoLease:
+    """Lease that is always held, for deployments with a single process."""
+
+    def try_acquire(self) -> bool:
+        return True
+
+    def release(self):
+        pass
+
+
+class FileLease:
+    """
+    Leadership held through an exclusive OS lock on a file.
+
+    Works across processes on one host, e.g. several uvicorn workers. The
+    operating system drops the lock when the holding process exits, however
+    it dies, so another process can take over on its next attempt.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def try_acquire(self) -> bool:
+        # Imported here since it only exists on POSIX systems
+        import fcntl
+
+        if self._file is not None:
+            return True
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_file = open(self.path, "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f"{holder_id()}\n")
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is not None:
+            # Closing the file releases the lock
+            self._file.close()
+            self._file = None
+
+
+class SupabaseLease:
+    """
+    Leadership held through a time-limited lease row in Supabase.
+
+    Works across hosts. The lease is taken over with a conditional update
+    that only matches an expired lease, and renewed with one that only
+    matches our own, so at most one process holds it at a time. If the
+    holder dies, the lease expires after `ttl` seconds. Hosts are assumed to
+    have roughly synchronized clocks.
+
+    Needs a table:
+        create table scheduler_leases (
+            name text primary key,
+            holder text not null,
+            expires_at timestamptz not null
+        );
+    """
+
+    def __init__(self, client, name: str, ttl: float = 30.0, table: str = "scheduler_leases"):
+        self.client = client
+        self.name = name
+        self.ttl = ttl
+        self.table = table
+        self.holder = holder_id()
+        self._created = False
+
+    def _now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    def try_acquire(self) -> bool:
+        now = self._now()
+        lease = {"holder": self.holder, "expires_at": (now + timedelta(seconds=self.ttl)).isoformat()}
+
+        if not self._created:
+            # Make sure the row exists; an existing lease is left alone
+            self.client.table(self.table).upsert(
+                {"name": self.name, "holder": "", "expires_at": now.isoformat()},
+                ignore_duplicates=True,
+                on_conflict="name",
+            ).execute()
+            self._created = True
+
+        # Renew our own lease
+        response = self.client.table(self.table).update(lease).eq("name", self.name).eq("holder", self.holder).execute()
+        if response.data:
+            return True
+
+        # Take over an expired one
+        response = self.client.table(self.table).update(lease).eq("name", self.name).lt("expires_at", now.isoformat()).execute()
+        return bool(response.data)
+
+    def release(self):
+        try:
+            self.client.table(self.table).update({"expires_at": self._now().isoformat()}).eq("name", self.name).eq("holder", self.holder).execute()
+        except Exception as e:
+            logger.warning(f"Failed to release lease {self.name}: {str(e)}")
+
+
+class LeaderElector:
+    """
+    Keeps trying to become leader, and calls back when leadership changes.
+
+    Every `interval` seconds a follower tries to acquire the lease and the
+    leader renews it. `on_elected` runs when this process becomes leader and
+    `on_demoted` when it loses the lease or stops.
+    """
+
+    def __init__(self, lease, on_elected: Callable[[], None], on_demoted: Callable[[], None], interval: float = 10.0):
+        self.lease = lease
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.interval = interval
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                # Leases may do blocking I/O
+                held = await loop.run_in_executor(None, self.lease.try_acquire)
+            except Exception as e:
+                logger.error(f"Leader election failed: {str(e)}")
+                held = False
+
+            if held and not self.is_leader:
+                self.is_leader = True
+                logger.info("Became scheduler leader")
+                self.on_elected()
+            elif not held and self.is_leader:
+                self.is_leader = False
+                logger.warning("Lost scheduler leadership")
+                self.on_demoted()
+
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start taking part in the election on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop taking part and hand over leadership if held."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self.is_leader:
+            self.is_leader = False
+            self.on_demoted()
+        await asyncio.get_running_loop().run_in_executor(None, self.lease.release)
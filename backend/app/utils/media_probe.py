@@ -0,0 +1,554 @@
+import logging
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# Largest element or box read into memory (an MP4 moov box holds the sample
+# tables, about 1 MB per hour of video); anything bigger is skipped
+MAX_HEADER_BYTES = 16 * 1024 * 1024
+
+CODEC_NAMES = {
+    # Matroska / WebM codec IDs
+    "V_VP8": "vp8",
+    "V_VP9": "vp9",
+    "V_AV1": "av1",
+    "V_MPEG4/ISO/AVC": "h264",
+    "V_MPEGH/ISO/HEVC": "h265",
+    "A_OPUS": "opus",
+    "A_VORBIS": "vorbis",
+    "A_AAC": "aac",
+    "A_MPEG/L3": "mp3",
+    "A_FLAC": "flac",
+    "A_PCM/INT/LIT": "pcm",
+    # MP4 sample entry types
+    "avc1": "h264",
+    "avc3": "h264",
+    "hvc1": "h265",
+    "hev1": "h265",
+    "vp08": "vp8",
+    "vp09": "vp9",
+    "av01": "av1",
+    "mp4a": "aac",
+    "Opus": "opus",
+    "fLaC": "flac",
+    ".mp3": "mp3",
+}
+
+
+def codec_name(codec: str) -> str:
+    """Common name of a Matroska codec ID or MP4 sample entry type, e.g. "V_VP8" or "avc1"."""
+    codec = codec.strip("\x00 ")
+    if codec in CODEC_NAMES:
+        return CODEC_NAMES[codec]
+    if codec[:2] in ("V_", "A_"):
+        codec = codec[2:]
+    return codec.lower()
+
+
+class _StreamParser:
+    """
+    Walks a stream of length-prefixed elements as it is fed, without holding it.
+
+    Subclasses implement `_parse`, reading elements from the start of a
+    buffer. Elements they don't need are skipped by size, so the bytes of
+    media data are counted but never copied or looked at.
+    """
+
+    container = ""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._skip = 0
+        self.done = False
+        self.tracks: List[Dict] = []
+        self.duration: Optional[float] = None
+
+    def feed(self, data: Buffer):
+        if self.done:
+            return
+        view = memoryview(data)
+        if self._skip:
+            skipped = min(self._skip, len(view))
+            self._skip -= skipped
+            view = view[skipped:]
+        if not len(view):
+            return
+
+        if self._buffer:
+            self._buffer += view
+            consumed = self._parse(self._buffer)
+            del self._buffer[:consumed]
+        else:
+            consumed = self._parse(view)
+            self._buffer = bytearray(view[consumed:])
+
+        if self.done:
+            self._buffer = bytearray()
+
+    def _skip_from(self, buf: Buffer, pos: int, size: int) -> int:
+        """Position after skipping `size` bytes, continuing into later data if the buffer ends first."""
+        end = pos + size
+        if end <= len(buf):
+            return end
+        self._skip = end - len(buf)
+        return len(buf)
+
+    def _parse(self, buf: Buffer) -> int:
+        """Read as many whole elements as possible and return the number of bytes consumed."""
+        raise NotImplementedError
+
+
+# EBML / Matroska element IDs (https://www.matroska.org/technical/elements.html)
+EBML = 0x1A45DFA3
+DOC_TYPE = 0x4282
+SEGMENT = 0x18538067
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+DEFAULT_DURATION = 0x23E383
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+AUDIO = 0xE1
+SAMPLING_FREQUENCY = 0xB5
+CHANNELS = 0x9F
+CLUSTER = 0x1F43B675
+CLUSTER_TIMECODE = 0xE7
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+SIMPLE_BLOCK = 0xA3
+
+# Elements whose children are read; everything else not listed below is skipped
+EBML_MASTERS = {EBML, SEGMENT, INFO, TRACKS, TRACK_ENTRY, VIDEO, AUDIO, CLUSTER, BLOCK_GROUP}
+EBML_UINTS = {TIMECODE_SCALE, TRACK_NUMBER, TRACK_TYPE, DEFAULT_DURATION, PIXEL_WIDTH, PIXEL_HEIGHT, CHANNELS, CLUSTER_TIMECODE}
+EBML_FLOATS = {DURATION, SAMPLING_FREQUENCY}
+EBML_STRINGS = {DOC_TYPE, CODEC_ID}
+EBML_BLOCKS = {BLOCK, SIMPLE_BLOCK}
+
+UNKNOWN_SIZE = -1
+TRACK_TYPES = {1: "video", 2: "audio"}
+
+
+def read_vint(buf: Buffer, pos: int, end: int, keep_marker: bool = False) -> Optional[Tuple[int, int]]:
+    """
+    EBML variable-length integer at `pos` and the position after it; None if the buffer ends first.
+
+    IDs keep their length marker bit, sizes drop it (an all-ones size means unknown).
+    """
+    if pos >= end:
+        return None
+    first = buf[pos]
+    if first == 0:
+        raise ValueError("Invalid EBML variable-length integer")
+    length = 9 - first.bit_length()
+    if pos + length > end:
+        return None
+    value = int.from_bytes(buf[pos:pos + length], "big")
+    if not keep_marker:
+        mask = (1 << (7 * length)) - 1
+        value &= mask
+        if value == mask:
+            value = UNKNOWN_SIZE
+    return value, pos + length
+
+
+class WebMParser(_StreamParser):
+    """
+    Reads the EBML header, segment info and track entries of a WebM / Matroska stream.
+
+    Browser recordings (MediaRecorder) have no duration in their header, as
+    the length isn't known while recording; it then comes from the timecode
+    of the last block plus one frame, which takes reading the few header
+    bytes of each block in the file.
+    """
+
+    container = "webm"
+
+    def __init__(self):
+        super().__init__()
+        self.timecode_scale = 1_000_000
+        self._track: Optional[Dict] = None
+        self._cluster_timecode = 0
+        # Track number -> (latest block time, gap before it), in nanoseconds
+        self._block_times: Dict[int, Tuple[int, int]] = {}
+
+    def _parse(self, buf: Buffer) -> int:
+        pos = 0
+        end = len(buf)
+        while not self.done:
+            element_id = read_vint(buf, pos, end, keep_marker=True)
+            if element_id is None:
+                return pos
+            element_id, size_pos = element_id
+            size = read_vint(buf, size_pos, end)
+            if size is None:
+                return pos
+            size, data_pos = size
+
+            if element_id in EBML_MASTERS:
+                # Children follow right away; sizes are not needed, which also copes with unknown-size segments and clusters
+                self._enter(element_id)
+                pos = data_pos
+            elif size == UNKNOWN_SIZE:
+                raise ValueError(f"Unknown size for EBML element {element_id:#x}")
+            elif element_id in EBML_BLOCKS:
+                # Track number (up to 8 bytes) and 16-bit timecode
+                header_end = min(data_pos + size, data_pos + 10)
+                if header_end > end:
+                    return pos
+                self._block(buf, data_pos, header_end)
+                pos = self._skip_from(buf, data_pos, size)
+            elif element_id in EBML_UINTS or element_id in EBML_FLOATS or element_id in EBML_STRINGS:
+                if size > MAX_HEADER_BYTES:
+                    pos = self._skip_from(buf, data_pos, size)
+                    continue
+                if data_pos + size > end:
+                    return pos
+                self._value(element_id, bytes(buf[data_pos:data_pos + size]))
+                pos = data_pos + size
+            else:
+                pos = self._skip_from(buf, data_pos, size)
+        return pos
+
+    def _enter(self, element_id: int):
+        if element_id == TRACK_ENTRY:
+            self._track = {}
+            self.tracks.append(self._track)
+        elif element_id == CLUSTER and self.duration is not None and self.tracks:
+            # Header complete, and it had the duration: no need to read the blocks
+            self.done = True
+
+    def _value(self, element_id: int, data: bytes):
+        if element_id in EBML_UINTS:
+            value = int.from_bytes(data, "big")
+            if element_id == CLUSTER_TIMECODE:
+                self._cluster_timecode = value
+            elif element_id == TIMECODE_SCALE:
+                self.timecode_scale = value or self.timecode_scale
+            elif self._track is not None:
+                if element_id == TRACK_NUMBER:
+                    self._track["number"] = value
+                elif element_id == TRACK_TYPE:
+                    self._track["type"] = TRACK_TYPES.get(value)
+                elif element_id == DEFAULT_DURATION:
+                    self._track["default_duration"] = value
+                elif element_id == PIXEL_WIDTH:
+                    self._track["width"] = value
+                elif element_id == PIXEL_HEIGHT:
+                    self._track["height"] = value
+                elif element_id == CHANNELS:
+                    self._track["channels"] = value
+        elif element_id in EBML_FLOATS:
+            if len(data) not in (4, 8):
+                return
+            value = struct.unpack(">f" if len(data) == 4 else ">d", data)[0]
+            if element_id == DURATION:
+                self.duration = value * self.timecode_scale / 1e9
+            elif element_id == SAMPLING_FREQUENCY and self._track is not None:
+                self._track["sample_rate"] = int(value)
+        else:
+            value = data.decode("ascii", "replace").rstrip("\x00")
+            if element_id == DOC_TYPE:
+                self.container = value
+            elif element_id == CODEC_ID and self._track is not None:
+                self._track["codec"] = codec_name(value)
+
+    def _block(self, buf: Buffer, pos: int, end: int):
+        track = read_vint(buf, pos, end)
+        if track is None or track[1] + 2 > end:
+            return
+        track_number, timecode_pos = track
+        timecode = int.from_bytes(buf[timecode_pos:timecode_pos + 2], "big", signed=True)
+        block_time = (self._cluster_timecode + timecode) * self.timecode_scale
+        previous = self._block_times.get(track_number)
+        if previous is None:
+            self._block_times[track_number] = (block_time, 0)
+        elif block_time > previous[0]:
+            self._block_times[track_number] = (block_time, block_time - previous[0])
+
+    def finish(self):
+        if self.duration is not None or not self._block_times:
+            return
+        # The last block plays for one frame: the track's default duration, or else the gap before it
+        default_durations = {track.get("number"): track.get("default_duration") for track in self.tracks}
+        self.duration = max(
+            block_time + (default_durations.get(track_number) or gap)
+            for track_number, (block_time, gap) in self._block_times.items()
+        ) / 1e9
+
+
+def iter_boxes(data: bytes, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """(type, payload start, payload end) of each MP4 box in data[start:end]."""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+# Boxes holding other boxes on the way to the track headers
+MP4_CONTAINERS = {b"trak", b"mdia", b"minf", b"stbl", b"mvex", b"traf"}
+
+
+class MP4Parser(_StreamParser):
+    """
+    Reads the movie box (moov) of an MP4 / QuickTime stream, wherever it is.
+
+    Media data (mdat) is skipped by size, so a moov written after the media
+    costs nothing extra. Fragmented files (as recorded by some browsers)
+    have no duration in the moov; it then comes from the sample durations
+    in each fragment header (moof).
+    """
+
+    container = "mp4"
+
+    def __init__(self):
+        super().__init__()
+        self.fragmented = False
+        self._tracks_by_id: Dict[int, Dict] = {}
+        self._default_sample_durations: Dict[int, int] = {}
+        self._fragment_ends: Dict[int, int] = {}
+
+    def _parse(self, buf: Buffer) -> int:
+        pos = 0
+        end = len(buf)
+        while not self.done:
+            if pos + 8 > end:
+                return pos
+            size, box_type = struct.unpack_from(">I4s", buf, pos)
+            header = 8
+            if size == 1:
+                if pos + 16 > end:
+                    return pos
+                size = struct.unpack_from(">Q", buf, pos + 8)[0]
+                header = 16
+            elif size == 0:
+                # Runs to the end of the stream; only media data is written that way
+                self.done = True
+                return pos
+            if size < header:
+                raise ValueError(f"Invalid MP4 box size {size}")
+
+            if box_type in (b"moov", b"moof") and size <= MAX_HEADER_BYTES:
+                if pos + size > end:
+                    return pos
+                box = bytes(buf[pos:pos + size])
+                if box_type == b"moov":
+                    self._movie(box, header, size)
+                else:
+                    self._fragment(box, header, size)
+                pos += size
+            else:
+                pos = self._skip_from(buf, pos, size)
+        return pos
+
+    def _movie(self, data: bytes, start: int, end: int):
+        for box_type, box_start, box_end in iter_boxes(data, start, end):
+            if box_type == b"mvhd":
+                timescale, duration = self._times(data, box_start)
+                if timescale and duration:
+                    self.duration = duration / timescale
+            elif box_type == b"trak":
+                track: Dict = {}
+                self._track(data, box_start, box_end, track)
+                self.tracks.append(track)
+                if "id" in track:
+                    self._tracks_by_id[track["id"]] = track
+            elif box_type == b"mvex":
+                self.fragmented = True
+                for child_type, child_start, _ in iter_boxes(data, box_start, box_end):
+                    if child_type == b"trex":
+                        track_id, _, default_duration = struct.unpack_from(">III", data, child_start + 4)
+                        self._default_sample_durations[track_id] = default_duration
+
+        if self.duration and not self.fragmented:
+            self.done = True
+
+    @staticmethod
+    def _times(data: bytes, pos: int) -> Tuple[int, int]:
+        """Timescale and duration of a version 0 or 1 mvhd / mdhd box."""
+        if data[pos] == 1:
+            return struct.unpack_from(">IQ", data, pos + 20)
+        return struct.unpack_from(">II", data, pos + 12)
+
+    def _track(self, data: bytes, start: int, end: int, track: Dict):
+        for box_type, box_start, box_end in iter_boxes(data, start, end):
+            if box_type in MP4_CONTAINERS:
+                self._track(data, box_start, box_end, track)
+            elif box_type == b"tkhd":
+                version = data[box_start]
+                track["id"] = struct.unpack_from(">I", data, box_start + (20 if version == 1 else 12))[0]
+                # 16.16 fixed point, after the matrix
+                width, height = struct.unpack_from(">II", data, box_start + (88 if version == 1 else 76))
+                if width and height:
+                    track["width"], track["height"] = width >> 16, height >> 16
+            elif box_type == b"mdhd":
+                track["timescale"], duration = self._times(data, box_start)
+                if track["timescale"] and duration:
+                    track["duration"] = duration / track["timescale"]
+            elif box_type == b"hdlr":
+                handler = data[box_start + 8:box_start + 12]
+                track["type"] = {b"vide": "video", b"soun": "audio"}.get(handler)
+            elif box_type == b"stsd" and box_start + 16 <= box_end:
+                # The first sample entry names the codec
+                entry_type = data[box_start + 12:box_start + 16].decode("latin-1")
+                track["codec"] = codec_name(entry_type)
+                entry = box_start + 16
+                if track.get("type") == "video" and entry + 28 <= box_end and "width" not in track:
+                    track["width"], track["height"] = struct.unpack_from(">HH", data, entry + 24)
+                elif track.get("type") == "audio" and entry + 28 <= box_end:
+                    track["channels"] = struct.unpack_from(">H", data, entry + 16)[0]
+                    track["sample_rate"] = struct.unpack_from(">I", data, entry + 24)[0] >> 16
+
+    def _fragment(self, data: bytes, start: int, end: int):
+        for box_type, box_start, box_end in iter_boxes(data, start, end):
+            if box_type == b"traf":
+                self._track_fragment(data, box_start, box_end)
+
+    def _track_fragment(self, data: bytes, start: int, end: int):
+        track_id = None
+        default_duration = 0
+        base_time = None
+        total = 0
+        for box_type, box_start, _ in iter_boxes(data, start, end):
+            flags = int.from_bytes(data[box_start + 1:box_start + 4], "big")
+            if box_type == b"tfhd":
+                track_id = struct.unpack_from(">I", data, box_start + 4)[0]
+                default_duration = self._default_sample_durations.get(track_id, 0)
+                pos = box_start + 8 + (8 if flags & 0x01 else 0) + (4 if flags & 0x02 else 0)
+                if flags & 0x08:
+                    default_duration = struct.unpack_from(">I", data, pos)[0]
+            elif box_type == b"tfdt":
+                base_time = struct.unpack_from(">Q" if data[box_start] == 1 else ">I", data, box_start + 4)[0]
+            elif box_type == b"trun":
+                count = struct.unpack_from(">I", data, box_start + 4)[0]
+                if not flags & 0x100:
+                    total += count * default_duration
+                    continue
+                pos = box_start + 8 + (4 if flags & 0x01 else 0) + (4 if flags & 0x04 else 0)
+                stride = 4 * sum(1 for flag in (0x100, 0x200, 0x400, 0x800) if flags & flag)
+                total += sum(struct.unpack_from(">I", data, pos + i * stride)[0] for i in range(count))
+
+        if track_id is None:
+            return
+        if base_time is None:
+            base_time = self._fragment_ends.get(track_id, 0)
+        self._fragment_ends[track_id] = max(self._fragment_ends.get(track_id, 0), base_time + total)
+
+    def finish(self):
+        if self.duration:
+            return
+        durations = [track["duration"] for track in self.tracks if track.get("duration")]
+        for track_id, fragment_end in self._fragment_ends.items():
+            timescale = self._tracks_by_id.get(track_id, {}).get("timescale")
+            if timescale:
+                durations.append(fragment_end / timescale)
+        if durations:
+            self.duration = max(durations)
+
+
+class MediaProbe:
+    """
+    Duration, codecs and dimensions of a WebM or MP4 recording, read from its container headers as it streams past.
+
+    Feed the file in chunks of any size, in order. Nothing is decoded: the
+    parser reads the header elements it needs and skips media data by size,
+    stopping as soon as it has everything. Data it can't make sense of ends
+    parsing rather than raising, and `result` reports whatever was found.
+
+    Example:
+        probe = MediaProbe()
+        for chunk in chunks:
+            probe.feed(chunk)
+        probe.result()  # {"container": "webm", "duration_seconds": 12.34, ...}
+    """
+
+    def __init__(self):
+        self.size = 0
+        self._head = b""
+        self._parser: Optional[_StreamParser] = None
+        self._failed = False
+
+    @property
+    def done(self) -> bool:
+        """True once more data would change nothing but `size`."""
+        return self._failed or (self._parser is not None and self._parser.done)
+
+    def feed(self, data: Buffer):
+        self.size += len(data)
+        if self.done:
+            return
+
+        if self._parser is None:
+            # Held until there are enough bytes to tell the container apart
+            self._head += bytes(data)
+            if len(self._head) < 12:
+                return
+            if self._head.startswith(b"\x1a\x45\xdf\xa3"):
+                self._parser = WebMParser()
+            elif self._head[4:8] in (b"ftyp", b"moov", b"mdat", b"free", b"wide"):
+                self._parser = MP4Parser()
+            else:
+                self._failed = True
+                return
+            data, self._head = self._head, b""
+
+        try:
+            self._parser.feed(data)
+        except (ValueError, struct.error, IndexError) as e:
+            logger.debug(f"Stopped reading media headers: {str(e)}")
+            self._failed = True
+
+    def result(self) -> Dict:
+        """
+        What was found, with None for anything that wasn't.
+
+        Returns:
+            Dict: container, duration_seconds, video_codec, audio_codec, width, height, size_bytes
+        """
+        parser = self._parser
+        if parser is not None:
+            parser.finish()
+        tracks = parser.tracks if parser else []
+        video = next((track for track in tracks if track.get("type") == "video"), {})
+        audio = next((track for track in tracks if track.get("type") == "audio"), {})
+        duration = parser.duration if parser else None
+        return {
+            "container": parser.container if parser else None,
+            "duration_seconds": round(duration, 3) if duration else None,
+            "video_codec": video.get("codec"),
+            "audio_codec": audio.get("codec"),
+            "width": video.get("width"),
+            "height": video.get("height"),
+            "size_bytes": self.size,
+        }
+
+
+def probe_media(content: Buffer, chunk_size: int = 1024 * 1024) -> Dict:
+    """`MediaProbe.result` for a file already in memory, fed in chunks without copying it."""
+    probe = MediaProbe()
+    view = memoryview(content)
+    for start in range(0, len(view), chunk_size):
+        probe.feed(view[start:start + chunk_size])
+        if probe.done:
+            break
+    probe.size = len(view)
+    return probe.result()
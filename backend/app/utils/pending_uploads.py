@@ -0,0 +1,78 @@
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PendingUploads:
+    """
+    Signed uploads that were handed out but not finalized yet, in Supabase.
+
+    Each signed URL gets a row with the path it may create, the size the
+    client announced and when the URL expires. Finalizing an upload and
+    sweeping an expired one both start by deleting the row, and only the
+    request whose delete returned it goes on, so an upload is saved at most
+    once and never both saved and swept.
+
+    Needs:
+        create table recording_uploads (
+            path text primary key,
+            user_id text not null references users(user_id) on delete cascade,
+            file_type text not null,
+            size_bytes bigint not null,
+            expires_at timestamptz not null
+        );
+        create index recording_uploads_expires_at on recording_uploads (expires_at);
+
+    Args:
+        client: Supabase client
+    """
+
+    def __init__(self, client, table: str = "recording_uploads"):
+        self.client = client
+        self.table = table
+
+    def add(self, user_id: str, path: str, file_type: str, size: int, expires_at: datetime):
+        """Record a signed upload."""
+        response = self.client.table(self.table).insert({
+            "path": path,
+            "user_id": user_id,
+            "file_type": file_type,
+            "size_bytes": size,
+            "expires_at": expires_at.isoformat(),
+        }).execute()
+        if not response.data:
+            raise RuntimeError(f"Failed to record signed upload {path}")
+
+    def get(self, user_id: str, path: str) -> Optional[Dict]:
+        """The pending upload of a user at a path, or None."""
+        response = self.client.table(self.table).select("*").eq("path", path).eq("user_id", user_id).execute()
+        return response.data[0] if response.data else None
+
+    def pending_bytes(self, user_id: str) -> int:
+        """Bytes announced by a user's signed uploads whose URLs have not expired."""
+        now = datetime.now(timezone.utc).isoformat()
+        response = self.client.table(self.table).select("size_bytes").eq("user_id", user_id).gte("expires_at", now).execute()
+        return sum(row["size_bytes"] for row in response.data or [])
+
+    def claim(self, path: str) -> Optional[Dict]:
+        """Remove the row of an upload, returning it only to the one caller whose delete removed it."""
+        response = self.client.table(self.table).delete().eq("path", path).execute()
+        return response.data[0] if response.data else None
+
+    def restore(self, rows: List[Dict]):
+        """Put back claimed rows whose finalize or sweep failed, so it can be tried again."""
+        if rows:
+            self.client.table(self.table).upsert(rows, on_conflict="path").execute()
+
+    def claim_expired(self, limit: int = 1000) -> List[Dict]:
+        """Claim up to `limit` uploads whose URLs expired, returning the rows this call removed."""
+        now = datetime.now(timezone.utc).isoformat()
+        response = self.client.table(self.table).select("path").lt("expires_at", now).order("expires_at").limit(limit).execute()
+        paths = [row["path"] for row in response.data or []]
+        if not paths:
+            return []
+        # Filtered on the expiry again, so a row cannot be claimed on a stale read
+        response = self.client.table(self.table).delete().in_("path", paths).lt("expires_at", now).execute()
+        return response.data or []
@@ -0,0 +1,318 @@
+import cProfile
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from .metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile-token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+
+class ProfileStore:
+    """
+    Directory of saved profiles.
+
+    Each profile is kept as a pstats dump (`<id>.prof`, for snakeviz or
+    pstats), a text report (`<id>.txt`) and its metadata (`<id>.json`).
+    Only the newest `max_reports` profiles are kept.
+    """
+
+    def __init__(self, directory: str, max_reports: int = 100, report_limit: int = 40):
+        self.directory = directory
+        self.max_reports = max_reports
+        self.report_limit = report_limit
+
+    def path(self, profile_id: str, extension: str) -> str:
+        # Ids are generated by save(); anything else could point outside the directory
+        if not profile_id.replace("-", "").isalnum():
+            raise KeyError(profile_id)
+        return os.path.join(self.directory, f"{profile_id}.{extension}")
+
+    def format_report(self, profile: cProfile.Profile, meta: Dict) -> str:
+        """Render a call tree report: the slowest functions by cumulative time and what they call."""
+        output = io.StringIO()
+        output.write(" ".join(f"{key}={value}" for key, value in meta.items()) + "\n\n")
+        stats = pstats.Stats(profile, stream=output)
+        stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE)
+        stats.print_stats(self.report_limit)
+        stats.print_callees(self.report_limit)
+        return output.getvalue()
+
+    @staticmethod
+    def new_id() -> str:
+        # Sortable by creation time
+        return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    def save(self, profile: cProfile.Profile, meta: Dict, profile_id: Optional[str] = None) -> str:
+        """
+        Save a finished profile.
+
+        Returns:
+            str: The id of the saved profile
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = profile_id or self.new_id()
+        meta = {"id": profile_id, **meta}
+
+        profile.dump_stats(self.path(profile_id, "prof"))
+        with open(self.path(profile_id, "txt"), "w") as f:
+            f.write(self.format_report(profile, meta))
+        with open(self.path(profile_id, "json"), "w") as f:
+            json.dump(meta, f)
+
+        self._prune()
+        return profile_id
+
+    def list(self) -> List[Dict]:
+        """Metadata of the saved profiles, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        profiles.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return profiles
+
+    def report(self, profile_id: str) -> str:
+        """
+        Get the text report of a profile.
+
+        Raises:
+            KeyError: If there is no profile with this id
+        """
+        try:
+            with open(self.path(profile_id, "txt")) as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(profile_id)
+
+    def _prune(self):
+        ids = sorted(name[:-len(".json")] for name in os.listdir(self.directory) if name.endswith(".json"))
+        for profile_id in ids[:max(0, len(ids) - self.max_reports)]:
+            for extension in ("prof", "txt", "json"):
+                try:
+                    os.remove(self.path(profile_id, extension))
+                except FileNotFoundError:
+                    pass
+
+
+class ArmedJobs:
+    """
+    Jobs armed for profiling, as rows of a SQLite file shared by every process on the host.
+
+    The job worker that takes an armed job may run in another process than
+    the API worker that armed it, so the flag cannot live in memory. Taking
+    a job deletes its row, so of all the workers exactly one profiles the run.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Opened on first use so that creating it at import time touches no files
+        with self._lock:
+            if self._db is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("CREATE TABLE IF NOT EXISTS armed_jobs (name TEXT PRIMARY KEY, armed_at REAL NOT NULL)")
+            return self._db
+
+    def arm(self, name: str):
+        self._conn.execute("INSERT OR REPLACE INTO armed_jobs (name, armed_at) VALUES (?, ?)", (name, time.time()))
+
+    def take(self, name: str) -> bool:
+        """Disarm a job, returning whether it was armed."""
+        return self._conn.execute("DELETE FROM armed_jobs WHERE name = ?", (name,)).rowcount > 0
+
+
+class Profiler:
+    """
+    On-demand cProfile profiling of requests and scheduled jobs.
+
+    A request is profiled if it carries the admin token in the
+    X-Profile-Token header, or if it is picked by sampling (a per-route rate,
+    falling back to `default_sample_rate`). A job is profiled on its next run
+    after arm_job() is called, by whichever worker process runs it when
+    `armed_jobs` is given.
+
+    Only one profile runs at a time; requests that would overlap are not
+    profiled. Requests share the event loop thread, so a request profile
+    also contains work of other requests that ran concurrently, and work
+    handed off to the thread pool is not included.
+    """
+
+    def __init__(
+        self,
+        store: ProfileStore,
+        token: Optional[str] = None,
+        default_sample_rate: float = 0.0,
+        sample_rates: Optional[Dict[str, float]] = None,
+        armed_jobs: Optional[ArmedJobs] = None,
+    ):
+        self.store = store
+        self.token = token
+        self.default_sample_rate = default_sample_rate
+        self.sample_rates = sample_rates or {}
+        self.jobs: Set[str] = set()
+        # Without a shared store, only runs in this process can be profiled
+        self.armed_jobs = armed_jobs
+        self._armed_jobs: Set[str] = set()
+        self._running = threading.Lock()
+
+    @property
+    def requests_enabled(self) -> bool:
+        """Whether any request can be profiled; if not, the middleware is not installed."""
+        return bool(self.token) or self.default_sample_rate > 0 or any(rate > 0 for rate in self.sample_rates.values())
+
+    def is_admin(self, token: Optional[str]) -> bool:
+        """Check a token against the admin profiling token."""
+        return bool(self.token) and token is not None and hmac.compare_digest(token, self.token)
+
+    def reason_to_profile(self, headers: Dict[str, str], route: str) -> Optional[str]:
+        """
+        Decide whether to profile a request.
+
+        Returns:
+            Optional[str]: "header" or "sample" if the request should be profiled, None otherwise
+        """
+        if self.is_admin(headers.get(PROFILE_HEADER)):
+            return "header"
+        rate = self.sample_rates.get(route, self.default_sample_rate)
+        if rate > 0 and random.random() < rate:
+            return "sample"
+        return None
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """Start a profile, or return None if another one is running."""
+        if not self._running.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except Exception:
+            self._running.release()
+            raise
+        return profile
+
+    def finish(self, profile: cProfile.Profile, meta: Dict, profile_id: Optional[str] = None) -> Optional[str]:
+        """Stop a profile and save it. Returns the profile id, or None if saving failed."""
+        profile.disable()
+        self._running.release()
+        try:
+            profile_id = self.store.save(profile, meta, profile_id)
+        except Exception as e:
+            logger.error(f"Failed to save profile: {str(e)}")
+            return None
+        logger.info(f"Saved profile {profile_id}: {meta}")
+        return profile_id
+
+    def register_job(self, name: str):
+        """Allow arm_job() for a job."""
+        self.jobs.add(name)
+
+    def arm_job(self, name: str):
+        """Profile the next run of a scheduled job."""
+        if name not in self.jobs:
+            raise KeyError(name)
+        if self.armed_jobs is not None:
+            self.armed_jobs.arm(name)
+        else:
+            self._armed_jobs.add(name)
+
+    def take_armed_job(self, name: str) -> bool:
+        """Whether the next run of a job is to be profiled; disarms it, so only one run is."""
+        if self.armed_jobs is not None:
+            return self.armed_jobs.take(name)
+        if name in self._armed_jobs:
+            self._armed_jobs.discard(name)
+            return True
+        return False
+
+    def profile_call(self, name: str, fn: Callable[[], Any]) -> Any:
+        """
+        Run `fn` under a profile saved as a run of job `name`.
+
+        cProfile only sees the calling thread, so call this from the thread
+        that does the job's work. Runs `fn` unprofiled if another profile is
+        running.
+        """
+        profile = self.start()
+        if profile is None:
+            logger.warning(f"Another profile is running, job {name} runs unprofiled")
+            return fn()
+
+        started = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            self.finish(profile, {"kind": "job", "job": name, "duration_ms": round((time.perf_counter() - started) * 1000, 1)})
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles the requests picked by the profiler.
+
+    The profile covers the whole request, including streamed response
+    bodies. The id of the saved profile is returned in the X-Profile-Id
+    response header of requests profiled via the admin header.
+    """
+
+    def __init__(self, app, profiler: Profiler, exclude_prefixes: tuple = ("/admin/profiles", "/metrics")):
+        self.app = app
+        self.profiler = profiler
+        self.exclude_prefixes = exclude_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        route = route_template(scope)
+        reason = self.profiler.reason_to_profile(headers, route)
+        profile = self.profiler.start() if reason else None
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        # The id is picked up front so it can go out in the response headers
+        profile_id = self.profiler.store.new_id()
+        meta = {"kind": "request", "reason": reason, "method": scope["method"], "route": route, "path": scope["path"]}
+        status = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if reason == "header":
+                    message["headers"] = list(message.get("headers", [])) + [(PROFILE_ID_HEADER.lower().encode(), profile_id.encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            meta.update(status=status, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+            self.profiler.finish(profile, meta, profile_id)
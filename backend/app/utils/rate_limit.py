@@ -0,0 +1,183 @@
+import math
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+from .metrics import registry
+
+rate_limited_requests_total = registry.counter(
+    "rate_limited_requests_total",
+    "Requests refused with 429, by route and reason (rate or concurrency).",
+    ("route", "reason"),
+)
+
+
+class _Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [tokens, last refill]
+        self.buckets: Dict[Hashable, List[float]] = {}
+
+
+class TokenBucketLimiter:
+    """
+    A token bucket per key (e.g. per user), refilled continuously.
+
+    Each key may send `burst` requests at once and `rate` per second after
+    that. Buckets are spread over shards with a lock each, so requests of
+    different users rarely wait on each other. Buckets that have refilled
+    completely are dropped when a shard grows past `max_keys`, as they
+    hold no state worth keeping.
+
+    Args:
+        rate: Tokens added per second
+        burst: Bucket size
+        shards: Number of independently locked shards
+        max_keys: Buckets per shard before idle ones are dropped
+    """
+
+    def __init__(self, rate: float, burst: float, shards: int = 16, max_keys: int = 10000):
+        if rate <= 0 or burst < 1:
+            raise ValueError("A token bucket needs a positive rate and a burst of at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._shards = [_Shard() for _ in range(shards)]
+
+    def acquire(self, key: Hashable, cost: float = 1.0) -> float:
+        """
+        Take `cost` tokens from a key's bucket.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the seconds until there are enough
+        """
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                if len(shard.buckets) >= self.max_keys:
+                    self._evict(shard, now)
+                bucket = shard.buckets[key] = [self.burst, now]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / self.rate
+
+    def _evict(self, shard: _Shard, now: float):
+        # Drop full buckets first, then the oldest half if that was not enough
+        for key in [key for key, (tokens, updated) in shard.buckets.items() if tokens + (now - updated) * self.rate >= self.burst]:
+            del shard.buckets[key]
+        if len(shard.buckets) >= self.max_keys:
+            for key in list(shard.buckets)[:len(shard.buckets) // 2]:
+                del shard.buckets[key]
+
+
+class ConcurrencyLimiter:
+    """Caps the requests in progress per key."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key: Hashable) -> bool:
+        with self._lock:
+            active = self._active.get(key, 0)
+            if active >= self.limit:
+                return False
+            self._active[key] = active + 1
+            return True
+
+    def release(self, key: Hashable):
+        with self._lock:
+            active = self._active.get(key, 0) - 1
+            if active > 0:
+                self._active[key] = active
+            else:
+                self._active.pop(key, None)
+
+
+class RouteLimit:
+    """
+    Limits of one route: a token bucket per client and a cap on its requests in progress, either optional.
+
+    Args:
+        per_minute: Sustained requests per minute per client; 0 for no rate limit
+        burst: Requests a client may send at once
+        concurrency: Requests in progress per client; 0 for no cap
+    """
+
+    def __init__(self, per_minute: float = 0, burst: float = 0, concurrency: int = 0):
+        self.bucket = TokenBucketLimiter(per_minute / 60, burst) if per_minute > 0 else None
+        self.concurrency = ConcurrencyLimiter(concurrency) if concurrency > 0 else None
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware answering 429 with Retry-After to clients over a route's limits.
+
+    Runs before the route reads the request body, so a refused upload is
+    never received. Clients are identified by user when `identify` can
+    tell who sent the request (a valid session token), and by IP address
+    otherwise. Only the routes in `limits` are checked.
+
+    Args:
+        limits: Limits by request path, e.g. {"/recordings/upload": RouteLimit(30, 10, concurrency=2)}
+        identify: Returns the user id of a request from its Authorization header, or None; may block, so it runs in a thread
+    """
+
+    def __init__(self, app, limits: Dict[str, RouteLimit], identify: Callable[[Optional[str]], Optional[str]]):
+        self.app = app
+        self.limits = limits
+        self.identify = identify
+
+    async def client_key(self, scope) -> str:
+        authorization = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value.decode("latin-1")
+                break
+        user_id = await run_in_threadpool(self.identify, authorization) if authorization else None
+        if user_id:
+            return f"user:{user_id}"
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = await self.client_key(scope)
+        # A request refused for concurrency costs no token
+        if limit.concurrency is not None and not limit.concurrency.try_acquire(key):
+            await self._refuse(scope, receive, send, "concurrency", 1)
+            return
+        try:
+            wait = limit.bucket.acquire(key) if limit.bucket is not None else 0
+            if wait > 0:
+                await self._refuse(scope, receive, send, "rate", wait)
+                return
+            await self.app(scope, receive, send)
+        finally:
+            if limit.concurrency is not None:
+                limit.concurrency.release(key)
+
+    async def _refuse(self, scope, receive, send, reason: str, retry_after: float):
+        rate_limited_requests_total.inc(route=scope["path"], reason=reason)
+        detail = "Too many requests" if reason == "rate" else "Too many requests in progress"
+        response = JSONResponse(
+            {"detail": detail},
+            status_code=429,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for calls to an upstream service.
+
+    The circuit opens after `failure_threshold` consecutive failures, where a
+    call slower than `slow_call_threshold` seconds counts as a failure too.
+    While open, calls are rejected for `reset_timeout` seconds. After that the
+    circuit is half-open: up to `half_open_max_calls` probe calls are let
+    through, and a probe success closes the circuit while a probe failure
+    opens it again. Probes that never report back (e.g. a cancelled request)
+    stop blocking new probes after another `reset_timeout`.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        slow_call_threshold: float = 10.0,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = self.CLOSED
+        self.failure_count = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.probe_started_at = 0.0
+
+    def allow_request(self) -> bool:
+        """
+        Check whether a call may go upstream.
+
+        Returns:
+            bool: True if the call may proceed, False if it should be short-circuited
+        """
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            logger.info(f"Circuit {self.name} is half-open, probing upstream")
+            self.state = self.HALF_OPEN
+            self.half_open_calls = 0
+
+        if self.state == self.HALF_OPEN:
+            if self.half_open_calls >= self.half_open_max_calls:
+                if time.monotonic() - self.probe_started_at < self.reset_timeout:
+                    return False
+                self.half_open_calls = 0
+            self.half_open_calls += 1
+            self.probe_started_at = time.monotonic()
+
+        return True
+
+    def record_success(self, elapsed: float):
+        """Record a completed call that took `elapsed` seconds."""
+        if elapsed > self.slow_call_threshold:
+            logger.warning(f"Slow call through circuit {self.name}: {elapsed:.2f}s")
+            self.record_failure()
+            return
+
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit {self.name} closed")
+        self.state = self.CLOSED
+        self.failure_count = 0
+
+    def record_failure(self):
+        """Record a failed call."""
+        self.failure_count += 1
+        if self.state == self.HALF_OPEN or self.failure_count >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        if self.state != self.OPEN:
+            logger.warning(f"Circuit {self.name} opened after {self.failure_count} failures")
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.half_open_calls = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one.
+
+    While a call for a key is in flight, further callers with the same key
+    wait for its result instead of starting their own call. A caller that is
+    cancelled (e.g. because its client disconnected) does not cancel the
+    shared call for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `fn` for `key`, or join the call already in flight for it.
+
+        Args:
+            key: Identifies calls that can share a result
+            fn: Starts the call when no call for the key is in flight
+
+        Returns:
+            The result of the shared call
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(fn())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(call)
+
+    def in_flight(self) -> int:
+        """Number of calls currently in flight."""
+        return len(self._calls)
+
+    def _forget(self, key: Hashable, call: asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every waiter was cancelled
+        if not call.cancelled():
+            call.exception()
@@ -0,0 +1,190 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .metrics import registry
+
+try:
+    import brotli
+except ImportError:
+    # Optional; without it, responses are only gzipped
+    brotli = None
+
+response_cache_requests_total = registry.counter(
+    "response_cache_requests_total",
+    "Cached responses served, by cache and result (hit, miss or not_modified).",
+    ("cache", "result"),
+)
+
+
+def make_etag(user_id: str, version: int, key: Hashable) -> str:
+    """
+    Weak ETag of a user's data at a version, for one query.
+
+    Weak, because the same data is sent with different content encodings.
+    """
+    digest = hashlib.sha256(f"{user_id}\0{key!r}".encode("utf-8")).hexdigest()[:16]
+    return f'W/"{version}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names the ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith("W/") else candidate) == opaque:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Preferred supported content encoding ("br" or "gzip") of an Accept-Encoding header."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    supported = ("br", "gzip") if brotli is not None else ("gzip",)
+    candidates = [(accepted.get(name, accepted.get("*", 0.0)), -rank, name) for rank, name in enumerate(supported)]
+    quality, _, name = max(candidates)
+    return name if quality > 0 else None
+
+
+class CachedBody:
+    """A JSON response body, with its compressed variants made on first use."""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self._encoded: Dict[str, bytes] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(data) for data in self._encoded.values())
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.body
+        data = self._encoded.get(encoding)
+        if data is None:
+            if encoding == "br":
+                data = brotli.compress(self.body, quality=5)
+            else:
+                data = gzip.compress(self.body, compresslevel=6, mtime=0)
+            self._encoded[encoding] = data
+        return data
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of JSON responses keyed by (user, data version, query), with ETags and compression.
+
+    The version is a counter the database bumps on every change to the
+    user's data, read at the start of each request. A changed version makes
+    new keys, so entries never need invalidating; stale ones just age out.
+    Requests whose If-None-Match names the current ETag get a 304 without
+    the data being read at all.
+
+    Args:
+        name: Label of the cache in the metrics
+        max_bytes: Memory budget for cached bodies, compressed variants included
+        min_compress_bytes: Bodies smaller than this are sent uncompressed
+    """
+
+    def __init__(self, name: str, max_bytes: int = 64 * 1024 * 1024, min_compress_bytes: int = 1024):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.min_compress_bytes = min_compress_bytes
+        self._entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, entry: CachedBody):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+
+    def _resize(self, key: Hashable, before: int, entry: CachedBody):
+        # A compressed variant was added to a cached entry
+        with self._lock:
+            if self._entries.get(key) is entry:
+                self._bytes += entry.size - before
+                self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def respond(self, request: Request, user_id: str, version: int, key: Hashable, build: Callable[[], Any]) -> Response:
+        """
+        Response for a user's data at `version`, built with `build()` only on a cache miss.
+
+        Args:
+            request: The request, for its If-None-Match and Accept-Encoding headers
+            key: The query, e.g. the route and its parameters
+            build: Returns the JSON-serializable payload; must read data no older than `version`
+        """
+        etag = make_etag(user_id, version, key)
+        headers = {
+            "ETag": etag,
+            # Per user, and to be revalidated on every use
+            "Cache-Control": "private, no-cache",
+            "Vary": "Accept-Encoding, Authorization",
+        }
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            response_cache_requests_total.inc(cache=self.name, result="not_modified")
+            return Response(status_code=304, headers=headers)
+
+        cache_key = (user_id, version, key)
+        entry = self.get(cache_key)
+        if entry is None:
+            response_cache_requests_total.inc(cache=self.name, result="miss")
+            body = json.dumps(build(), separators=(",", ":"), default=str).encode("utf-8")
+            entry = CachedBody(body)
+            self.put(cache_key, entry)
+        else:
+            response_cache_requests_total.inc(cache=self.name, result="hit")
+
+        encoding = choose_encoding(request.headers.get("accept-encoding")) if len(entry.body) >= self.min_compress_bytes else None
+        before = entry.size
+        content = entry.encoded(encoding)
+        if entry.size != before:
+            self._resize(cache_key, before, entry)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(content, media_type="application/json", headers=headers)
@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Words of a search query; everything else (including FTS5 operators) is ignored
+QUERY_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(text: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query matching entries that contain every word as a prefix.
+
+    Words are quoted, so user input can never be read as FTS5 syntax.
+    """
+    terms = QUERY_TERM.findall(text)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+class SearchIndex:
+    """
+    Full-text index of recording notes and tags in a local SQLite FTS5 table.
+
+    Documents live in a plain table, with an external-content FTS5 table
+    kept in sync by triggers, so adding or removing one recording touches
+    only its own index entries. Searches are always scoped to one user and
+    ranked with BM25, tags weighing more than notes.
+
+    The index is derived data: `rebuild` replaces it from the recordings
+    table at any time.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Reentrant, since the connection is opened lazily while the lock is held
+        self._lock = threading.RLock()
+        self._db = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Opened on first use so that creating an index at import time touches no files
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    self._db = self._open()
+        return self._db
+
+    def _open(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                rowid INTEGER PRIMARY KEY,
+                recording_id TEXT NOT NULL UNIQUE,
+                user_id TEXT NOT NULL,
+                created_at TEXT,
+                file_type TEXT,
+                file_url TEXT,
+                note TEXT NOT NULL DEFAULT '',
+                tags TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS documents_user ON documents (user_id, created_at);
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                note, tags,
+                content='documents', content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            );
+
+            CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+                INSERT INTO documents_fts (rowid, note, tags) VALUES (new.rowid, new.note, new.tags);
+            END;
+            CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+                INSERT INTO documents_fts (documents_fts, rowid, note, tags) VALUES ('delete', old.rowid, old.note, old.tags);
+            END;
+            CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
+                INSERT INTO documents_fts (documents_fts, rowid, note, tags) VALUES ('delete', old.rowid, old.note, old.tags);
+                INSERT INTO documents_fts (rowid, note, tags) VALUES (new.rowid, new.note, new.tags);
+            END;
+            """
+        )
+        return conn
+
+    @staticmethod
+    def _document(recording: Dict) -> tuple:
+        tags = recording.get("tags") or []
+        if isinstance(tags, str):
+            tags = json.loads(tags) if tags.startswith("[") else [tags]
+        return (
+            str(recording["id"]),
+            recording["user_id"],
+            recording.get("created_at"),
+            recording.get("file_type"),
+            recording.get("file_url"),
+            recording.get("note") or "",
+            "\n".join(str(tag) for tag in tags),
+        )
+
+    def _upsert(self, conn: sqlite3.Connection, recordings: Iterable[Dict]):
+        conn.executemany(
+            """
+            INSERT INTO documents (recording_id, user_id, created_at, file_type, file_url, note, tags)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (recording_id) DO UPDATE SET
+                user_id = excluded.user_id, created_at = excluded.created_at, file_type = excluded.file_type,
+                file_url = excluded.file_url, note = excluded.note, tags = excluded.tags
+            """,
+            [self._document(recording) for recording in recordings],
+        )
+
+    def add(self, recording: Dict):
+        """Index a recordings row, replacing an earlier version of it."""
+        with self._lock:
+            self._upsert(self._conn, [recording])
+
+    def remove(self, recording_id):
+        """Drop a recording from the index."""
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE recording_id = ?", (str(recording_id),))
+
+    def remove_user(self, user_id: str) -> int:
+        """Drop every recording of a user from the index, returning how many were dropped."""
+        with self._lock:
+            return self._conn.execute("DELETE FROM documents WHERE user_id = ?", (user_id,)).rowcount
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def search(
+        self,
+        user_id: str,
+        text: str,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> List[Dict]:
+        """
+        Rank a user's recordings against a query; every word matches as a prefix.
+
+        Args:
+            user_id: Only this user's recordings are searched
+            text: Free text
+            date_from: Earliest creation date, inclusive
+            date_to: Latest creation date, inclusive
+        """
+        match = build_match_query(text)
+        if match is None:
+            return []
+
+        conditions = ["documents_fts MATCH ?", "d.user_id = ?"]
+        params: List = [match, user_id]
+        # created_at is ISO 8601, so dates compare as strings
+        if date_from:
+            conditions.append("d.created_at >= ?")
+            params.append(date_from.isoformat())
+        if date_to:
+            conditions.append("d.created_at < ?")
+            params.append((date_to + timedelta(days=1)).isoformat())
+        params += [limit, offset]
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT d.recording_id, d.created_at, d.file_type, d.file_url, d.note, d.tags,
+                       snippet(documents_fts, 0, '', '', '…', 16) AS snippet,
+                       bm25(documents_fts, 1.0, 2.0) AS rank
+                FROM documents_fts JOIN documents d ON d.rowid = documents_fts.rowid
+                WHERE {" AND ".join(conditions)}
+                ORDER BY rank
+                LIMIT ? OFFSET ?
+                """,
+                params,
+            ).fetchall()
+
+        return [
+            {
+                "id": row["recording_id"],
+                "created_at": row["created_at"],
+                "file_type": row["file_type"],
+                "file_url": row["file_url"],
+                "note": row["note"],
+                "tags": row["tags"].split("\n") if row["tags"] else [],
+                "snippet": row["snippet"],
+                # BM25 is lower for better matches; flip it so higher is better
+                "score": round(-row["rank"], 4),
+            }
+            for row in rows
+        ]
+
+    def rebuild(self, pages: Iterable[List[Dict]]) -> int:
+        """
+        Replace the whole index with the given recordings rows, a page at a time.
+
+        Runs in one transaction on a connection of its own, so searches keep
+        reading the old index until the new one is complete. Updates from
+        uploads and deletes wait for it.
+
+        Returns:
+            int: Number of recordings indexed
+        """
+        indexed = 0
+        conn = self._open()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM documents")
+                for page in pages:
+                    self._upsert(conn, page)
+                    indexed += len(page)
+                # Merge the index segments written by the bulk insert
+                conn.execute("INSERT INTO documents_fts (documents_fts) VALUES ('optimize')")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+        logger.info(f"Rebuilt search index with {indexed} recordings")
+        return indexed
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,162 @@
+import logging
+from collections import defaultdict
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StorageUsage:
+    """
+    Per-user storage counters (bytes and file count per file type) in Supabase.
+
+    Uploads and deletes change the counters through one database function
+    call each, so the usage endpoint and quota checks never have to list
+    the storage bucket. The function takes a per-user lock, checks the
+    quota and updates the counter in one transaction, so concurrent uploads
+    cannot both squeeze under the quota. `reconcile` corrects any drift
+    (e.g. a crash between the storage upload and the counter update) from
+    the recordings table.
+
+    Needs:
+        create table storage_usage (
+            user_id text not null references users(user_id) on delete cascade,
+            file_type text not null,
+            bytes bigint not null default 0,
+            file_count integer not null default 0,
+            updated_at timestamptz not null default now(),
+            primary key (user_id, file_type)
+        );
+        alter table recordings add column size_bytes bigint;
+
+        create or replace function adjust_storage_usage(
+            p_user_id text, p_file_type text, p_bytes bigint, p_count integer, p_quota bigint default null
+        ) returns table (allowed boolean, total_bytes bigint)
+        language plpgsql as $$
+        declare
+            current_total bigint;
+        begin
+            perform pg_advisory_xact_lock(hashtext(p_user_id));
+            select coalesce(sum(u.bytes), 0) into current_total from storage_usage u where u.user_id = p_user_id;
+            if p_quota is not null and p_bytes > 0 and current_total + p_bytes > p_quota then
+                return query select false, current_total;
+                return;
+            end if;
+            insert into storage_usage as u (user_id, file_type, bytes, file_count)
+            values (p_user_id, p_file_type, greatest(p_bytes, 0), greatest(p_count, 0))
+            on conflict (user_id, file_type) do update
+                set bytes = greatest(u.bytes + p_bytes, 0),
+                    file_count = greatest(u.file_count + p_count, 0),
+                    updated_at = now();
+            return query select true, current_total + p_bytes;
+        end;
+        $$;
+
+    Args:
+        client: Supabase client
+        quota_bytes: Maximum bytes stored per user; 0 for no quota
+    """
+
+    def __init__(self, client, quota_bytes: int = 0, table: str = "storage_usage", function: str = "adjust_storage_usage"):
+        self.client = client
+        self.quota_bytes = quota_bytes
+        self.table = table
+        self.function = function
+
+    def _adjust(self, user_id: str, file_type: str, size: int, count: int, enforce_quota: bool) -> bool:
+        response = self.client.rpc(self.function, {
+            "p_user_id": user_id,
+            "p_file_type": file_type,
+            "p_bytes": size,
+            "p_count": count,
+            "p_quota": self.quota_bytes if enforce_quota and self.quota_bytes > 0 else None,
+        }).execute()
+        return bool(response.data and response.data[0]["allowed"])
+
+    def reserve(self, user_id: str, file_type: str, size: int) -> bool:
+        """
+        Count a new file of `size` bytes, unless it would exceed the quota.
+
+        Call before uploading, and `release` if the upload then fails.
+
+        Returns:
+            bool: False if the file does not fit in the user's quota
+        """
+        return self._adjust(user_id, file_type, size, 1, enforce_quota=True)
+
+    def release(self, user_id: str, file_type: str, size: int):
+        """Stop counting a file, after it was deleted or its upload failed."""
+        self._adjust(user_id, file_type, -size, -1, enforce_quota=False)
+
+    def forget(self, user_id: str):
+        """Drop every counter of a user, after the user and their files were deleted."""
+        self.client.table(self.table).delete().eq("user_id", user_id).execute()
+
+    def usage(self, user_id: str) -> Dict:
+        """Bytes and file count of a user, in total and per file type."""
+        response = self.client.table(self.table).select("file_type, bytes, file_count").eq("user_id", user_id).execute()
+        by_type = {row["file_type"]: {"bytes": row["bytes"], "count": row["file_count"]} for row in response.data or []}
+        total_bytes = sum(entry["bytes"] for entry in by_type.values())
+        return {
+            "user_id": user_id,
+            "total_bytes": total_bytes,
+            "total_count": sum(entry["count"] for entry in by_type.values()),
+            "by_type": by_type,
+            "quota_bytes": self.quota_bytes or None,
+            "remaining_bytes": max(self.quota_bytes - total_bytes, 0) if self.quota_bytes else None,
+        }
+
+    def _select_all(self, table: str, columns: str, order: str, page_size: int):
+        """Yield every row of a table, a page at a time, in a stable `order`."""
+        start = 0
+        while True:
+            # The end of postgrest's range is exclusive
+            response = self.client.table(table).select(columns).order(order).range(start, start + page_size).execute()
+            rows = response.data or []
+            yield from rows
+            if len(rows) < page_size:
+                return
+            start += page_size
+
+    def reconcile(self, page_size: int = 1000) -> Dict:
+        """
+        Recompute every counter from the recordings table and fix the ones that drifted.
+
+        Counters changed by uploads or deletes while this runs may be
+        overwritten with the value seen when the recordings were read; the
+        next run corrects those. Recordings uploaded before sizes were
+        stored count towards the file count only.
+
+        Returns:
+            Dict: Number of recordings read, counters checked and counters corrected
+        """
+        actual: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(lambda: {"bytes": 0, "file_count": 0})
+        recordings = 0
+        without_size = 0
+        for row in self._select_all("recordings", "id, user_id, file_type, size_bytes", "id", page_size):
+            recordings += 1
+            entry = actual[(row["user_id"], row["file_type"])]
+            entry["file_count"] += 1
+            if row.get("size_bytes") is None:
+                without_size += 1
+            else:
+                entry["bytes"] += row["size_bytes"]
+
+        counters = {
+            (row["user_id"], row["file_type"]): {"bytes": row["bytes"], "file_count": row["file_count"]}
+            for row in self._select_all(self.table, "user_id, file_type, bytes, file_count", "user_id,file_type", page_size)
+        }
+
+        corrections = []
+        for key in set(actual) | set(counters):
+            expected = actual.get(key, {"bytes": 0, "file_count": 0})
+            if counters.get(key) != expected:
+                user_id, file_type = key
+                corrections.append({"user_id": user_id, "file_type": file_type, **expected})
+
+        for start in range(0, len(corrections), page_size):
+            self.client.table(self.table).upsert(corrections[start:start + page_size], on_conflict="user_id,file_type").execute()
+
+        if without_size:
+            logger.warning(f"{without_size} recordings have no stored size and only count towards file counts")
+        logger.info(f"Storage usage reconciled: {len(corrections)} of {len(counters)} counters corrected from {recordings} recordings")
+        return {"recordings": recordings, "counters": len(counters), "corrected": len(corrections)}
@@ -0,0 +1,191 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Channel for request and response payload dumps; off unless sampled in at DEBUG level
+PAYLOAD_LOGGER = "app.payloads"
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "suppressed"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including fields passed through `extra`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _PerLoggerSetting:
+    """Looks up a per-logger setting, where a setting for "a.b" also applies to "a.b.c"."""
+
+    def __init__(self, settings: Dict[str, float]):
+        self.settings = settings
+        self._resolved: Dict[str, Optional[float]] = {}
+
+    def get(self, name: str) -> Optional[float]:
+        if name in self._resolved:
+            return self._resolved[name]
+        value = None
+        candidate = name
+        while candidate:
+            if candidate in self.settings:
+                value = self.settings[candidate]
+                break
+            candidate = candidate.rpartition(".")[0]
+        self._resolved[name] = value
+        return value
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of the records of configured loggers. Warnings and errors are always kept."""
+
+    def __init__(self, sample_rates: Dict[str, float]):
+        super().__init__()
+        self.sample_rates = _PerLoggerSetting(sample_rates)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.sample_rates.get(record.name)
+        return rate is None or random.random() < rate
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most a configured number of records per second per logger.
+
+    Each logger gets a token bucket holding one second's worth of records.
+    Dropped records are counted and the count is attached to the next record
+    that gets through as `suppressed`. Errors are never dropped.
+    """
+
+    def __init__(self, rate_limits: Dict[str, float]):
+        super().__init__()
+        self.rate_limits = _PerLoggerSetting(rate_limits)
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rate_limits.get(record.name)
+        if rate is None or record.levelno >= logging.ERROR:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            # [tokens, last refill, suppressed since the last record let through]
+            bucket = self._buckets.setdefault(record.name, [rate, now, 0])
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread.
+
+    Only the message itself is resolved on the caller's thread (so later
+    changes to its arguments don't show up in the log); exceptions and the
+    JSON encoding are formatted by the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def configure_logging(
+    level: str = "INFO",
+    json_format: bool = True,
+    sample_rates: Optional[Dict[str, float]] = None,
+    rate_limits: Optional[Dict[str, float]] = None,
+    payload_sample_rate: float = 0.0,
+    stream=None,
+) -> logging.handlers.QueueListener:
+    """
+    Send all logging through a queue to a background thread.
+
+    Callers only run the filters and put the record on a queue; formatting
+    and writing happen on the listener thread, off the event loop.
+
+    Args:
+        level: Root log level
+        json_format: Write JSON lines instead of plain text
+        sample_rates: Fraction of INFO and DEBUG records to keep, per logger
+        rate_limits: Maximum records per second, per logger
+        payload_sample_rate: Fraction of payload dumps to keep (see log_payload)
+        stream: Where to write the logs, stderr by default
+
+    Returns:
+        logging.handlers.QueueListener: The running listener; pass it to stop_logging() to flush it
+    """
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if json_format else logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+
+    sample_rates = dict(sample_rates or {})
+    sample_rates.setdefault(PAYLOAD_LOGGER, payload_sample_rate)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = LogQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(sample_rates))
+    handler.addFilter(RateLimitFilter(rate_limits or {}))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    # Payload dumps are only worth the cost when they are being sampled in
+    logging.getLogger(PAYLOAD_LOGGER).setLevel(logging.DEBUG if payload_sample_rate > 0 else logging.WARNING)
+
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_logging, listener)
+    return listener
+
+
+def stop_logging(listener: logging.handlers.QueueListener):
+    """Write out the queued records and stop the listener thread. Safe to call more than once."""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def log_payload(message: str, payload) -> None:
+    """
+    Log a request or response payload on the sampled payload channel.
+
+    The payload is only serialized if the record is going to be kept.
+    """
+    payload_logger = logging.getLogger(PAYLOAD_LOGGER)
+    if payload_logger.isEnabledFor(logging.DEBUG):
+        payload_logger.debug(message, extra={"payload": payload})
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Optional
+
+import httpx
+
+from .metrics import MetricsTransport
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger(__name__)
+
+
+class SupabaseClientRegistry:
+    """
+    Process-wide registry for the shared Supabase client.
+
+    The client is created on first use. Its PostgREST and storage clients
+    are rebuilt on top of one shared HTTP transport, so table and storage
+    calls reuse the same pool of keep-alive connections, sized by the
+    `max_connections`, `max_keepalive_connections` and `keepalive_expiry`
+    settings.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str],
+        key: Optional[str],
+        max_connections: int = 50,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        health_check_failures: int = 3,
+    ):
+        self.url = url
+        self.key = key
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.health_check_failures = health_check_failures
+
+        self._client: Optional["Client"] = None
+        self._transport: Optional[httpx.BaseTransport] = None
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._health_task: Optional[asyncio.Task] = None
+
+    def get(self) -> "Client":
+        """Get the shared client, creating it on first use."""
+        client = self._client
+        if client is not None:
+            return client
+
+        with self._lock:
+            if self._client is None:
+                if not self.url or not self.key:
+                    raise ValueError("Missing Supabase configuration. Check your .env file.")
+                self._client = self._create()
+            return self._client
+
+    def _create(self) -> "Client":
+        # Imported here so that importing the app does not pay for the Supabase SDK
+        from supabase import create_client
+
+        started = time.perf_counter()
+        client = create_client(self.url, self.key)
+        # Every table and storage call is timed on the way through
+        transport = MetricsTransport(httpx.HTTPTransport(limits=self.limits), "supabase")
+
+        # Rebuild the HTTP sessions on the shared transport, keeping their URLs, headers and timeouts
+        postgrest_session = client.postgrest.session
+        client.postgrest.session = type(postgrest_session)(
+            base_url=postgrest_session.base_url,
+            headers=postgrest_session.headers,
+            timeout=postgrest_session.timeout,
+            transport=transport,
+        )
+        postgrest_session.close()
+
+        storage_session = client.storage.session
+        client.storage.session = client.storage._client = type(storage_session)(
+            base_url=storage_session.base_url,
+            headers=storage_session.headers,
+            timeout=storage_session.timeout,
+            transport=transport,
+        )
+        storage_session.close()
+
+        self._transport = transport
+        self._failures = 0
+        logger.info(f"Created shared Supabase client in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return client
+
+    def is_initialized(self) -> bool:
+        """Check whether the client has been created."""
+        return self._client is not None
+
+    def health_check(self) -> bool:
+        """
+        Run a minimal query against Supabase.
+
+        After `health_check_failures` failures in a row the client is
+        discarded, so the next use opens fresh connections.
+
+        Returns:
+            bool: True if Supabase answered
+        """
+        try:
+            self.get().table("users").select("id").limit(1).execute()
+        except Exception as e:
+            self._failures += 1
+            logger.warning(f"Supabase health check failed ({self._failures} in a row): {str(e)}")
+            if self._failures >= self.health_check_failures:
+                logger.error("Resetting Supabase client after repeated health check failures")
+                self.close()
+            return False
+
+        self._failures = 0
+        return True
+
+    async def _run_health_checks(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            # Only check a client that is in use; don't create one just to probe it
+            if self.is_initialized():
+                await loop.run_in_executor(None, self.health_check)
+
+    def start_health_checks(self, interval: float):
+        """Run health_check() every `interval` seconds on the running event loop."""
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._run_health_checks(interval))
+
+    async def stop_health_checks(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def close(self):
+        """Close the shared client's connections. The next use creates a new client."""
+        with self._lock:
+            client, transport = self._client, self._transport
+            self._client = None
+            self._transport = None
+
+        if client is None:
+            return
+        try:
+            client.postgrest.session.close()
+            client.storage.session.close()
+            transport.close()
+        except Exception as e:
+            logger.warning(f"Error closing Supabase client: {str(e)}")
+        logger.info("Closed shared Supabase client")
+
+
+class LazySupabaseClient:
+    """
+    Stand-in for the shared Supabase client that resolves it on first attribute access.
+
+    Modules can hold one at import time without creating a client or opening connections.
+    """
+
+    def __init__(self, registry: SupabaseClientRegistry):
+        self._registry = registry
+
+    def __getattr__(self, name):
+        return getattr(self._registry.get(), name)
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class WriteCoalescer:
+    """
+    Write-behind buffer that coalesces row writes into batched writes.
+
+    Rows are keyed by `key`. Writing a row whose key is already buffered
+    merges the new values into the buffered row, so a burst of writes for
+    the same key costs a single write. Buffered rows are flushed every
+    `interval` seconds in batches of `batch_size`, and once more on stop().
+
+    `forget()` also reaches rows already taken for a flush: each batch drops
+    forgotten keys right before it is written. A delete can still land while
+    a batch is being written, so `write_batch` must only update rows that exist
+    (e.g. an UPDATE, not an INSERT ... ON CONFLICT); then a write racing a
+    delete, in this process or any other, cannot recreate the row. `write_batch`
+    runs in a thread, without holding the lock `forget()` takes.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        write_batch: Callable[[List[Dict]], None],
+        key: str,
+        interval: float = 5.0,
+        batch_size: int = 500,
+        known_keys_size: int = 100000,
+    ):
+        self.name = name
+        self.write_batch = write_batch
+        self.key = key
+        self.interval = interval
+        self.batch_size = batch_size
+        self.known_keys_size = known_keys_size
+
+        self._pending: Dict[str, Dict] = {}
+        self._known_keys: "OrderedDict[str, None]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        # Keys of the rows being flushed, and those forgotten meanwhile
+        self._in_flight: Set[str] = set()
+        self._forgotten: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def is_known(self, key_value: str) -> bool:
+        """Check whether a row with this key was written by this process."""
+        if key_value in self._known_keys:
+            self._known_keys.move_to_end(key_value)
+            return True
+        return False
+
+    def mark_known(self, key_value: str):
+        """Remember that a row with this key exists."""
+        self._known_keys[key_value] = None
+        self._known_keys.move_to_end(key_value)
+        while len(self._known_keys) > self.known_keys_size:
+            self._known_keys.popitem(last=False)
+
+    def forget(self, key_value: str):
+        """Drop a key and its buffered or in-flight row, e.g. before the row is deleted."""
+        with self._lock:
+            self._known_keys.pop(key_value, None)
+            self._pending.pop(key_value, None)
+            if key_value in self._in_flight:
+                self._forgotten.add(key_value)
+
+    def _write_unless_forgotten(self, batch: List[Dict]) -> List[Dict]:
+        with self._lock:
+            batch = [row for row in batch if row[self.key] not in self._forgotten]
+        if not batch:
+            return batch
+        # Not under the lock, so forget() never waits for a round trip
+        self.write_batch(batch)
+        with self._lock:
+            for row in batch:
+                if row[self.key] not in self._forgotten:
+                    self.mark_known(row[self.key])
+        return batch
+
+    def write(self, row: Dict):
+        """Buffer a row for the next flush, merging it with any buffered row for the same key."""
+        key_value = row[self.key]
+        if key_value in self._pending:
+            self._pending[key_value].update(row)
+        else:
+            self._pending[key_value] = dict(row)
+
+    def pending_count(self) -> int:
+        """Number of rows waiting to be flushed."""
+        return len(self._pending)
+
+    async def flush(self) -> int:
+        """
+        Write all buffered rows in batches.
+
+        Rows of a failed batch are put back into the buffer, unless a newer
+        write for the same key arrived in the meantime.
+
+        Returns:
+            int: Number of rows written
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+
+            with self._lock:
+                rows = list(self._pending.values())
+                self._pending = {}
+                self._in_flight = {row[self.key] for row in rows}
+            loop = asyncio.get_running_loop()
+            written = 0
+
+            try:
+                for start in range(0, len(rows), self.batch_size):
+                    batch = rows[start:start + self.batch_size]
+                    try:
+                        batch = await loop.run_in_executor(None, self._write_unless_forgotten, batch)
+                    except Exception as e:
+                        logger.error(f"Failed to flush {len(batch)} {self.name} writes: {str(e)}")
+                        with self._lock:
+                            for row in batch:
+                                if row[self.key] not in self._forgotten:
+                                    self._pending.setdefault(row[self.key], row)
+                        continue
+                    written += len(batch)
+            finally:
+                with self._lock:
+                    self._in_flight = set()
+                    self._forgotten = set()
+
+            if written:
+                logger.info(f"Flushed {written} {self.name} writes")
+            return written
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing {self.name} writes: {str(e)}")
+
+    def start(self):
+        """Start flushing on an interval on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the interval flush and write out everything still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._pending:
+            logger.error(f"{len(self._pending)} {self.name} writes could not be flushed on shutdown")
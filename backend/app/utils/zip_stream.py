@@ -0,0 +1,382 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+# Fetches an entry's content by key, starting at a byte offset
+Fetch = Callable[[str, int], AsyncIterator[bytes]]
+
+
+def dos_datetime(moment: Optional[datetime]) -> Tuple[int, int]:
+    """ZIP (MS-DOS) time and date fields for a datetime; ZIP cannot store dates before 1980."""
+    if moment is None or moment.year < 1980:
+        moment = datetime(1980, 1, 1)
+    time = (moment.hour << 11) | (moment.minute << 5) | (moment.second // 2)
+    date = ((moment.year - 1980) << 9) | (moment.month << 5) | moment.day
+    return time, date
+
+
+class ZipEntry:
+    """
+    One file of a streamed archive.
+
+    Entries with a `key` are fetched while streaming and stored uncompressed
+    (media is already compressed); their CRC follows the data in a data
+    descriptor. Entries with `data` are held in memory and deflated.
+
+    Args:
+        name: Path inside the archive
+        modified: Modification time stored in the archive
+        size: Size in bytes of a fetched entry, known up front
+        key: What to fetch for the entry, e.g. a storage path
+        data: Content of an in-memory entry
+    """
+
+    def __init__(self, name: str, modified: Optional[datetime] = None, size: int = 0, key: Optional[str] = None, data: Optional[bytes] = None):
+        if (key is None) == (data is None):
+            raise ValueError("A zip entry needs either a key or data")
+        self.name = name
+        self.encoded_name = name.encode("utf-8")
+        self.time, self.date = dos_datetime(modified)
+        self.key = key
+
+        if data is not None:
+            self.method = ZIP_DEFLATED
+            self.flags = FLAG_UTF8
+            self.size = len(data)
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            self.data = compressor.compress(data) + compressor.flush()
+            self.compressed_size = len(self.data)
+            self.crc: Optional[int] = zlib.crc32(data)
+        else:
+            self.method = ZIP_STORED
+            self.flags = FLAG_UTF8 | FLAG_DATA_DESCRIPTOR
+            self.size = self.compressed_size = size
+            self.data = None
+            self.crc = None
+
+        self.zip64 = self.compressed_size >= ZIP64_LIMIT or self.size >= ZIP64_LIMIT
+        # Set once the archive layout is known
+        self.offset = 0
+
+    @property
+    def streamed(self) -> bool:
+        return self.key is not None
+
+    def local_header(self) -> bytes:
+        extra = b""
+        if self.streamed:
+            # CRC and sizes follow the data in the data descriptor
+            crc = size = compressed_size = 0
+        else:
+            crc, size, compressed_size = self.crc, self.size, self.compressed_size
+        if self.zip64:
+            extra = struct.pack("<HHQQ", 1, 16, size, compressed_size)
+            size = compressed_size = ZIP64_LIMIT
+        return struct.pack(
+            "<4sHHHHHLLLHH",
+            b"PK\x03\x04", 45 if self.zip64 else 20, self.flags, self.method, self.time, self.date,
+            crc, compressed_size, size, len(self.encoded_name), len(extra),
+        ) + self.encoded_name + extra
+
+    def local_header_size(self) -> int:
+        return 30 + len(self.encoded_name) + (20 if self.zip64 else 0)
+
+    def descriptor(self) -> bytes:
+        if not self.streamed:
+            return b""
+        if self.zip64:
+            return struct.pack("<4sLQQ", b"PK\x07\x08", self.crc, self.compressed_size, self.size)
+        return struct.pack("<4sLLL", b"PK\x07\x08", self.crc, self.compressed_size, self.size)
+
+    def descriptor_size(self) -> int:
+        if not self.streamed:
+            return 0
+        return 24 if self.zip64 else 16
+
+    def _central_fields(self) -> Tuple[int, int, int, bytes]:
+        size, compressed_size, offset = self.size, self.compressed_size, self.offset
+        values = []
+        if size >= ZIP64_LIMIT or compressed_size >= ZIP64_LIMIT:
+            values += [size, compressed_size]
+            size = compressed_size = ZIP64_LIMIT
+        if offset >= ZIP64_LIMIT:
+            values.append(offset)
+            offset = ZIP64_LIMIT
+        extra = struct.pack(f"<HH{len(values)}Q", 1, 8 * len(values), *values) if values else b""
+        return size, compressed_size, offset, extra
+
+    def central_header(self) -> bytes:
+        size, compressed_size, offset, extra = self._central_fields()
+        version = 45 if extra or self.zip64 else 20
+        return struct.pack(
+            "<4sHHHHHHLLLHHHHHLL",
+            b"PK\x01\x02", (3 << 8) | version, version, self.flags, self.method, self.time, self.date,
+            self.crc, compressed_size, size, len(self.encoded_name), len(extra), 0, 0, 0,
+            0o100644 << 16, offset,
+        ) + self.encoded_name + extra
+
+    def central_header_size(self) -> int:
+        return 46 + len(self.encoded_name) + len(self._central_fields()[3])
+
+
+class ChecksumCache:
+    """
+    CRC-32s of fetched entries in a local SQLite file, keyed by entry key and size.
+
+    Lets a resumed download write data descriptors and the central directory
+    for entries before the resume point without fetching them again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Reentrant, since the connection is opened lazily while the lock is held
+        self._lock = threading.RLock()
+        self._db = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("CREATE TABLE IF NOT EXISTS checksums (key TEXT NOT NULL, size INTEGER NOT NULL, crc INTEGER NOT NULL, PRIMARY KEY (key, size))")
+                    self._db = conn
+        return self._db
+
+    def get(self, key: str, size: int) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute("SELECT crc FROM checksums WHERE key = ? AND size = ?", (key, size)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, size: int, crc: int):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO checksums (key, size, crc) VALUES (?, ?, ?)", (key, size, crc))
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class _Prefetch:
+    """Reads one entry into a bounded queue on a task, so a few entries can download at once."""
+
+    def __init__(self, fetch: Fetch, key: str, offset: int, max_chunks: int):
+        self.queue: asyncio.Queue = asyncio.Queue(max_chunks)
+        self.task = asyncio.create_task(self._run(fetch, key, offset))
+
+    async def _run(self, fetch: Fetch, key: str, offset: int):
+        try:
+            async for chunk in fetch(key, offset):
+                if chunk:
+                    await self.queue.put(chunk)
+            await self.queue.put(None)
+        except Exception as e:
+            await self.queue.put(e)
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self):
+        self.task.cancel()
+
+
+class ZipStream:
+    """
+    A ZIP archive laid out up front and streamed in any byte range.
+
+    All sizes are known before streaming, so the archive length and the
+    offset of every part are fixed, and the same entries always produce the
+    same bytes. That makes a download resumable from any offset. Archives
+    over 4 GiB or with more than 65535 entries use ZIP64.
+
+    Memory stays bounded by `prefetch` entries of `max_chunks` chunks each,
+    however large the archive.
+
+    Args:
+        entries: Files in archive order
+        fetch: Async iterator of an entry's content from a byte offset
+        checksums: Optional cache of CRCs of fetched entries
+        prefetch: Number of upcoming entries fetched while one is streamed
+        max_chunks: Chunks buffered per fetched entry
+    """
+
+    def __init__(self, entries: List[ZipEntry], fetch: Fetch, checksums: Optional[ChecksumCache] = None, prefetch: int = 2, max_chunks: int = 8):
+        self.entries = entries
+        self.fetch = fetch
+        self.checksums = checksums
+        self.prefetch = prefetch
+        self.max_chunks = max_chunks
+
+        offset = 0
+        for entry in entries:
+            entry.offset = offset
+            offset += entry.local_header_size() + entry.compressed_size + entry.descriptor_size()
+        self.central_directory_offset = offset
+        self.central_directory_size = sum(entry.central_header_size() for entry in entries)
+
+        end = offset + self.central_directory_size
+        self.zip64 = len(entries) >= 0xFFFF or end >= ZIP64_LIMIT or self.central_directory_size >= ZIP64_LIMIT
+        self.size = end + (56 + 20 if self.zip64 else 0) + 22
+
+    @property
+    def etag(self) -> str:
+        """Identifies the archive content, for If-Range checks."""
+        digest = hashlib.sha256()
+        for entry in self.entries:
+            digest.update(entry.encoded_name + b"\0" + (entry.key or "").encode("utf-8") + b"\0")
+            digest.update(struct.pack("<QHH", entry.size, entry.time, entry.date))
+            if entry.data is not None:
+                digest.update(entry.data)
+        return f'"{digest.hexdigest()[:32]}"'
+
+    def _end_records(self) -> bytes:
+        count = len(self.entries)
+        end = b""
+        if self.zip64:
+            zip64_end_offset = self.central_directory_offset + self.central_directory_size
+            end += struct.pack("<4sQHHLLQQQQ", b"PK\x06\x06", 44, 45, 45, 0, 0, count, count, self.central_directory_size, self.central_directory_offset)
+            end += struct.pack("<4sLQL", b"PK\x06\x07", 0, zip64_end_offset, 1)
+        return end + struct.pack(
+            "<4sHHHHLLH", b"PK\x05\x06", 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+            min(self.central_directory_size, ZIP64_LIMIT), min(self.central_directory_offset, ZIP64_LIMIT), 0,
+        )
+
+    async def _checksum(self, entry: ZipEntry) -> int:
+        """CRC of an entry, from the cache or by fetching it without streaming it out."""
+        if entry.crc is not None:
+            return entry.crc
+        crc = self.checksums.get(entry.key, entry.size) if self.checksums else None
+        if crc is None:
+            crc = 0
+            async for chunk in self.fetch(entry.key, 0):
+                crc = zlib.crc32(chunk, crc)
+            if self.checksums:
+                self.checksums.put(entry.key, entry.size, crc)
+        entry.crc = crc
+        return crc
+
+    async def stream(self, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """
+        Yield the archive bytes from `start` to `end` inclusive.
+
+        Raises:
+            IOError: If a fetched entry does not have its announced size; the
+                archive cannot be completed, so the response must be aborted
+        """
+        end = self.size - 1 if end is None else end
+
+        # Entries streamed out (in whole or in part), with the offset to fetch them from
+        planned: List[Tuple[ZipEntry, int]] = []
+        for entry in self.entries:
+            if not entry.streamed:
+                continue
+            data_start = entry.offset + entry.local_header_size()
+            data_end = data_start + entry.compressed_size
+            if data_end <= start or data_start > end:
+                continue
+            skip = max(start - data_start, 0)
+            if skip and self.checksums and self.checksums.get(entry.key, entry.size) is not None:
+                # The CRC is known, so only the requested part needs fetching
+                planned.append((entry, skip))
+            else:
+                planned.append((entry, 0))
+
+        prefetches: Dict[int, _Prefetch] = {}
+
+        def ensure_prefetch(index: int):
+            for ahead in range(index, min(index + self.prefetch + 1, len(planned))):
+                if ahead not in prefetches:
+                    entry, offset = planned[ahead]
+                    prefetches[ahead] = _Prefetch(self.fetch, entry.key, offset, self.max_chunks)
+
+        def window(data: bytes, offset: int) -> bytes:
+            """The part of `data` at archive `offset` that lies within the range."""
+            return data[max(start - offset, 0):max(end + 1 - offset, 0)]
+
+        next_planned = 0
+        try:
+            for entry in self.entries:
+                header_size = entry.local_header_size()
+                data_start = entry.offset + header_size
+                descriptor_start = data_start + entry.compressed_size
+                entry_end = descriptor_start + entry.descriptor_size()
+                if entry_end <= start:
+                    continue
+                if entry.offset > end:
+                    return
+
+                if data_start > start:
+                    chunk = window(entry.local_header(), entry.offset)
+                    if chunk:
+                        yield chunk
+
+                if not entry.streamed:
+                    chunk = window(entry.data, data_start)
+                    if chunk:
+                        yield chunk
+                elif descriptor_start > start and data_start <= end:
+                    current = next_planned
+                    next_planned += 1
+                    ensure_prefetch(current)
+                    offset = planned[current][1]
+
+                    position = data_start + offset
+                    crc = 0
+                    async for chunk in prefetches[current].chunks():
+                        if offset == 0:
+                            crc = zlib.crc32(chunk, crc)
+                        piece = window(chunk, position)
+                        position += len(chunk)
+                        if piece:
+                            yield piece
+                        if position > end:
+                            # The range ends inside this entry
+                            return
+                    del prefetches[current]
+                    if position != descriptor_start:
+                        raise IOError(f"{entry.key} is {position - data_start} bytes, expected {entry.compressed_size}")
+                    if offset == 0:
+                        entry.crc = crc
+                        if self.checksums:
+                            self.checksums.put(entry.key, entry.size, crc)
+
+                if entry.streamed and entry_end > start and descriptor_start <= end:
+                    await self._checksum(entry)
+                    yield window(entry.descriptor(), descriptor_start)
+
+            if self.central_directory_offset > end:
+                return
+            for entry in self.entries:
+                await self._checksum(entry)
+            central = b"".join(entry.central_header() for entry in self.entries) + self._end_records()
+            yield window(central, self.central_directory_offset)
+        finally:
+            for prefetch in prefetches.values():
+                prefetch.cancel()
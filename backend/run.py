@@ -1,4 +1,18 @@
+import asyncio
+import sys
+
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="127.0.0.1", port=8000, reload=True) 
\ No newline at end of file
+    if sys.argv[1:] == ["scheduler"]:
+        # Run only the cron jobs, apart from the API workers (set SCHEDULER_MODE=external for those)
+        from app.scheduler import run_scheduler_process
+
+        asyncio.run(run_scheduler_process())
+    elif sys.argv[1:] == ["worker"]:
+        # Run only queued background jobs (set JOB_WORKER_MODE=external for the API workers)
+        from app.jobs import run_worker_process
+
+        asyncio.run(run_worker_process())
+    else:
+        uvicorn.run("app.main:app", host="127.0.0.1", port=8000, reload=True)
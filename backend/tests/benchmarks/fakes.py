@@ -0,0 +1,468 @@
+"""
+In-process fakes for every upstream the backend talks to.
+
+One Starlette app serves fake Supabase PostgREST and storage, the Clerk
+users and JWKS API and OpenRouter chat completions, each under its own path
+prefix and with a configurable latency. It runs under uvicorn on a
+background thread, so the app under test talks to it over real sockets
+through its normal clients. SMTP is faked by replacing smtplib.SMTP.
+"""
+
+import asyncio
+import csv
+import json
+import socket
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+from urllib.parse import parse_qsl
+
+import jwt
+import uvicorn
+from cryptography.hazmat.primitives.asymmetric import rsa
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+FAKE_KEY_ID = "benchmark-key"
+
+
+class LocalServer:
+    """Runs an ASGI app under uvicorn on a free local port, from a background thread."""
+
+    def __init__(self, app, name: str = "server", lifespan: str = "auto"):
+        self.app = app
+        self.name = name
+        self.lifespan = lifespan
+        self.port = 0
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+
+        config = uvicorn.Config(
+            self.app,
+            host="127.0.0.1",
+            port=self.port,
+            lifespan=self.lifespan,
+            log_level="warning",
+            access_log=False,
+        )
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name=self.name, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError(f"{self.name} failed to start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=10)
+
+
+class FakeDatabase:
+    """
+    Rows of each table, with just enough PostgREST filtering for the app's queries.
+
+    Supports `eq.`, `in.()`, `gte.`, `lt.` and `cs.{}` filters, `order`, `limit`,
+    Range pagination and exact counts. Selected columns and
+    embedded resources are not interpreted; rows are returned as stored, so
+    scenarios store rows already shaped like the app's select. Database
+    functions called through /rpc are methods of the same name, and writes
+    to recordings bump recording_versions like the app's trigger does.
+    """
+
+    def __init__(self):
+        self.tables: Dict[str, List[Dict]] = defaultdict(list)
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def seed(self, table: str, rows: List[Dict]):
+        with self._lock:
+            for row in rows:
+                row.setdefault("id", self._next_id)
+                self._next_id += 1
+            self.tables[table] = rows
+
+    @staticmethod
+    def _matches(row: Dict, filters: List) -> bool:
+        for column, condition in filters:
+            value = row.get(column)
+            if condition.startswith("eq."):
+                if str(value) != condition[3:]:
+                    return False
+            elif condition.startswith("in.("):
+                if str(value) not in condition[4:-1].split(","):
+                    return False
+            elif condition.startswith("gte."):
+                if value is None or FakeDatabase._moment(value) < FakeDatabase._moment(condition[4:]):
+                    return False
+            elif condition.startswith("lt."):
+                if value is None or FakeDatabase._moment(value) >= FakeDatabase._moment(condition[3:]):
+                    return False
+            elif condition.startswith("cs.{"):
+                wanted = next(csv.reader([condition[4:-1]], escapechar="\\"))
+                if not set(wanted) <= set(value or []):
+                    return False
+        return True
+
+    @staticmethod
+    def _moment(value: str) -> datetime:
+        """A timestamp as the database compares it; values without an offset are UTC."""
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+    @staticmethod
+    def _order(rows: List[Dict], order: Optional[str]) -> List[Dict]:
+        # Sorted by the last column first, so earlier columns take precedence
+        for term in reversed(order.split(",") if order else []):
+            column, _, direction = term.partition(".")
+            rows = sorted(rows, key=lambda row: (row.get(column) is not None, row.get(column) or 0), reverse=direction.startswith("desc"))
+        return rows
+
+    @staticmethod
+    def _parse(params: List) -> tuple:
+        filters = [(key, value) for key, value in params if key not in ("select", "limit", "on_conflict", "order", "offset")]
+        limit = next((int(value) for key, value in params if key == "limit"), None)
+        return filters, limit
+
+    def select(self, table: str, params: List) -> List[Dict]:
+        filters, limit = self._parse(params)
+        rows = [row for row in self.tables.get(table, []) if self._matches(row, filters)]
+        rows = self._order(rows, dict(params).get("order"))
+        return rows[:limit] if limit is not None else rows
+
+    def upsert(self, table: str, rows: List[Dict], on_conflict: Optional[str], ignore_duplicates: bool = False) -> List[Dict]:
+        with self._lock:
+            existing = self.tables[table]
+            index = {row.get(on_conflict): row for row in existing} if on_conflict else {}
+            written = []
+            for row in rows:
+                current = index.get(row.get(on_conflict)) if on_conflict else None
+                if current is not None:
+                    if ignore_duplicates:
+                        continue
+                    current.update(row)
+                    written.append(current)
+                    continue
+                row = dict(row, id=self._next_id)
+                self._next_id += 1
+                existing.append(row)
+                if on_conflict:
+                    index[row.get(on_conflict)] = row
+                written.append(row)
+            self._bump_versions(table, written)
+            return written
+
+    def update(self, table: str, params: List, changes: Dict) -> List[Dict]:
+        filters, _ = self._parse(params)
+        with self._lock:
+            updated = [row for row in self.tables.get(table, []) if self._matches(row, filters)]
+            for row in updated:
+                row.update(changes)
+            self._bump_versions(table, updated)
+            return updated
+
+    def _bump_versions(self, table: str, rows: List[Dict]):
+        """The bump_recording_version trigger."""
+        if table != "recordings":
+            return
+        versions = {row["user_id"]: row for row in self.tables["recording_versions"]}
+        for row in rows:
+            version = versions.get(row.get("user_id"))
+            if version is None:
+                version = versions[row.get("user_id")] = {"user_id": row.get("user_id"), "version": 0}
+                self.tables["recording_versions"].append(version)
+            version["version"] += 1
+
+    def update_users(self, p_rows: List[Dict]) -> List[Dict]:
+        """The update_users function: updates existing users and skips missing ones."""
+        with self._lock:
+            users = {row["user_id"]: row for row in self.tables["users"]}
+            updated = []
+            for row in p_rows:
+                current = users.get(row["user_id"])
+                if current is not None:
+                    current.update({column: value for column, value in row.items() if column != "created_at"})
+                    updated.append({"user_id": row["user_id"]})
+            return updated
+
+    def adjust_storage_usage(self, p_user_id: str, p_file_type: str, p_bytes: int, p_count: int, p_quota: Optional[int] = None) -> List[Dict]:
+        """The adjust_storage_usage database function."""
+        with self._lock:
+            rows = self.tables["storage_usage"]
+            total = sum(row["bytes"] for row in rows if row["user_id"] == p_user_id)
+            if p_quota is not None and p_bytes > 0 and total + p_bytes > p_quota:
+                return [{"allowed": False, "total_bytes": total}]
+            row = next((row for row in rows if row["user_id"] == p_user_id and row["file_type"] == p_file_type), None)
+            if row is None:
+                row = {"user_id": p_user_id, "file_type": p_file_type, "bytes": 0, "file_count": 0}
+                rows.append(row)
+            row["bytes"] = max(row["bytes"] + p_bytes, 0)
+            row["file_count"] = max(row["file_count"] + p_count, 0)
+            return [{"allowed": True, "total_bytes": total + p_bytes}]
+
+    def delete(self, table: str, params: List) -> List[Dict]:
+        filters, _ = self._parse(params)
+        with self._lock:
+            kept, deleted = [], []
+            for row in self.tables.get(table, []):
+                (deleted if self._matches(row, filters) else kept).append(row)
+            self.tables[table] = kept
+            self._bump_versions(table, deleted)
+            return deleted
+
+
+class FakeSMTP:
+    """Drop-in replacement for smtplib.SMTP that records messages instead of sending them."""
+
+    latency = 0.0
+    sent: List[Dict] = []
+    _lock = threading.Lock()
+
+    def __init__(self, host: str = "", port: int = 0, *args, **kwargs):
+        self.host = host
+        self.port = port
+
+    def starttls(self, *args, **kwargs):
+        return 220, b"ready"
+
+    def login(self, user, password):
+        return 235, b"authenticated"
+
+    def sendmail(self, from_addr, to_addrs, msg, *args, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            FakeSMTP.sent.append({"from": from_addr, "to": to_addrs, "bytes": len(msg)})
+        return {}
+
+    def quit(self):
+        return 221, b"bye"
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.sent = []
+
+
+class FakeUpstreams:
+    """
+    Fake Supabase, Clerk and OpenRouter servers on one local port.
+
+    Attributes:
+        db: Table rows served by the fake PostgREST
+        deleted_clerk_users: Clerk user ids the fake users API answers with 404
+        latency: Simulated latency in seconds per upstream
+        requests: Number of requests served per upstream
+        stored_bytes: Bytes received by the fake storage API
+        objects: Sizes of the objects the fake storage API serves, by path; their content is generated
+    """
+
+    def __init__(self, latency: Optional[Dict[str, float]] = None):
+        self.db = FakeDatabase()
+        self.deleted_clerk_users: Set[str] = set()
+        self.latency = {"supabase": 0.0, "storage": 0.0, "clerk": 0.0, "openrouter": 0.0}
+        self.latency.update(latency or {})
+        self.requests: Counter = Counter()
+        self.stored_bytes = 0
+        self.objects: Dict[str, int] = {}
+        self.completion = "What is one small moment from today that you are grateful for?"
+
+        self._private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._server: Optional[LocalServer] = None
+        self.port = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def env(self) -> Dict[str, str]:
+        """Environment variables that point the app at these fakes."""
+        return {
+            "SUPABASE_URL": self.url,
+            # Supabase's client only checks that the key looks like a JWT
+            "SUPABASE_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.benchmark",
+            "CLERK_SECRET_KEY": "sk_test_benchmark",
+            "CLERK_API_URL": f"{self.url}/clerk/v1",
+            "CLERK_JWKS_URL": f"{self.url}/clerk/v1/jwks",
+            "OPENROUTER_API_URL": f"{self.url}/openrouter/api/v1/chat/completions",
+            "OPENROUTER_API_KEY": "sk-or-benchmark",
+        }
+
+    def session_token(self, user_id: str, ttl: int = 3600) -> str:
+        """Sign a session token for `user_id` that the app accepts via the fake JWKS."""
+        now = int(time.time())
+        return jwt.encode(
+            {"sub": user_id, "iat": now, "nbf": now, "exp": now + ttl},
+            self._private_key,
+            algorithm="RS256",
+            headers={"kid": FAKE_KEY_ID},
+        )
+
+    async def _delay(self, upstream: str):
+        self.requests[upstream] += 1
+        if self.latency.get(upstream):
+            await asyncio.sleep(self.latency[upstream])
+
+    async def _postgrest(self, request: Request):
+        await self._delay("supabase")
+        table = request.path_params["table"]
+        params = parse_qsl(request.url.query, keep_blank_values=True)
+
+        if request.method == "GET":
+            rows = self.db.select(table, params)
+            total = len(rows)
+            # Pagination as sent by postgrest's range()
+            if request.headers.get("range"):
+                first, last = request.headers["range"].split("-")
+                if int(first) > 0 and int(first) >= total:
+                    return JSONResponse({"code": "PGRST103", "message": "Requested range not satisfiable"}, status_code=416)
+                rows = rows[int(first):int(last) + 1]
+            headers = {}
+            if "count=exact" in request.headers.get("prefer", ""):
+                headers["Content-Range"] = f"0-{max(len(rows) - 1, 0)}/{total}"
+            return JSONResponse(rows, headers=headers)
+        if request.method == "DELETE":
+            return JSONResponse(self.db.delete(table, params))
+
+        body = json.loads(await request.body() or b"[]")
+        if request.method == "PATCH":
+            return JSONResponse(self.db.update(table, params, body))
+        rows = body if isinstance(body, list) else [body]
+        on_conflict = dict(params).get("on_conflict")
+        ignore_duplicates = "resolution=ignore-duplicates" in request.headers.get("prefer", "")
+        return JSONResponse(self.db.upsert(table, rows, on_conflict, ignore_duplicates), status_code=201)
+
+    async def _rpc(self, request: Request):
+        await self._delay("supabase")
+        function = getattr(self.db, request.path_params["function"], None)
+        if function is None:
+            return JSONResponse({"message": "function not found"}, status_code=404)
+        return JSONResponse(function(**json.loads(await request.body() or b"{}")))
+
+    async def _storage_upload(self, request: Request):
+        await self._delay("storage")
+        # Count the upload without holding it in memory
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        self.stored_bytes += size
+        self.objects[request.path_params["path"]] = size
+        return JSONResponse({"Key": f"{request.path_params['bucket']}/{request.path_params['path']}"})
+
+    async def _storage_sign_upload(self, request: Request):
+        await self._delay("storage")
+        path = f"{request.path_params['bucket']}/{request.path_params['path']}"
+        if request.method == "POST":
+            return JSONResponse({"url": f"/object/upload/sign/{path}?token=benchmark"})
+        # An upload to the signed URL
+        return await self._storage_upload(request)
+
+    async def _storage_download(self, request: Request):
+        await self._delay("storage")
+        size = self.objects.get(request.path_params["path"])
+        if size is None:
+            return JSONResponse({"error": "not_found"}, status_code=404)
+        start = 0
+        range_header = request.headers.get("range")
+        if range_header:
+            start = int(range_header.split("=")[1].split("-")[0])
+
+        async def body():
+            # Generated on the fly, so large objects take no memory
+            chunk = bytes(range(256)) * 256
+            position = start
+            while position < size:
+                piece = chunk[position % len(chunk):][:size - position]
+                position += len(piece)
+                yield piece
+
+        status = 206 if range_header else 200
+        return StreamingResponse(body(), status_code=status, headers={"Content-Length": str(size - start)})
+
+    async def _storage_remove(self, request: Request):
+        await self._delay("storage")
+        body = json.loads(await request.body() or b"{}")
+        removed = [{"name": path} for path in body.get("prefixes", []) if self.objects.pop(path, None) is not None]
+        return JSONResponse(removed)
+
+    async def _storage_list(self, request: Request):
+        await self._delay("storage")
+        body = json.loads(await request.body() or b"{}")
+        prefix = body.get("prefix", "").strip("/")
+        entries = {}
+        for path, size in self.objects.items():
+            if prefix and not path.startswith(prefix + "/"):
+                continue
+            name, _, rest = path[len(prefix) + 1 if prefix else 0:].partition("/")
+            if not name.startswith(body.get("search", "")):
+                continue
+            # Folders are listed without an id, like the real API does
+            entries[name] = {"name": name, "id": None, "metadata": None} if rest else {"name": name, "id": path, "metadata": {"size": size}}
+        offset, limit = body.get("offset", 0), body.get("limit", 100)
+        return JSONResponse([entries[name] for name in sorted(entries)][offset:offset + limit])
+
+    async def _clerk_user(self, request: Request):
+        await self._delay("clerk")
+        user_id = request.path_params["user_id"]
+        if user_id in self.deleted_clerk_users:
+            return JSONResponse({"errors": [{"code": "resource_not_found"}]}, status_code=404)
+        return JSONResponse({"id": user_id, "object": "user"})
+
+    async def _clerk_jwks(self, request: Request):
+        self.requests["clerk"] += 1
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self._private_key.public_key()))
+        jwk.update({"kid": FAKE_KEY_ID, "use": "sig", "alg": "RS256"})
+        return JSONResponse({"keys": [jwk]})
+
+    async def _openrouter(self, request: Request):
+        await self._delay("openrouter")
+        await request.body()
+        return JSONResponse({
+            "id": "gen-benchmark",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": self.completion}}],
+        })
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/rest/v1/rpc/{function}", self._rpc, methods=["POST"]),
+            Route("/rest/v1/{table}", self._postgrest, methods=["GET", "POST", "PATCH", "DELETE"]),
+            Route("/storage/v1/object/list/{bucket}", self._storage_list, methods=["POST"]),
+            Route("/storage/v1/object/upload/sign/{bucket}/{path:path}", self._storage_sign_upload, methods=["POST", "PUT"]),
+            Route("/storage/v1/object/{bucket}", self._storage_remove, methods=["DELETE"]),
+            Route("/storage/v1/object/{bucket}/{path:path}", self._storage_upload, methods=["POST", "PUT"]),
+            Route("/storage/v1/object/{bucket}/{path:path}", self._storage_download, methods=["GET"]),
+            Route("/clerk/v1/jwks", self._clerk_jwks, methods=["GET"]),
+            Route("/clerk/v1/users/{user_id}", self._clerk_user, methods=["GET"]),
+            Route("/openrouter/api/v1/chat/completions", self._openrouter, methods=["POST"]),
+        ])
+
+    def start(self):
+        """Serve the fakes on a free local port from a background thread."""
+        self._server = LocalServer(self.app(), name="fake-upstreams").start()
+        self.port = self._server.port
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the MyCorner backend.
+
+Runs the app under uvicorn against in-process fakes of Supabase, Clerk,
+OpenRouter and SMTP (see fakes.py) and drives repeatable scenarios:
+
+- upload: concurrent large uploads through POST /recordings/upload
+- reminders: one reminder tick over a large user_settings table, with the
+  queued jobs run by a job worker in this process
+- sync: perform_user_sync over a large users table
+- prompts: POST /prompts/generate at a fixed request rate
+- export: a streamed ZIP export of many large recordings, downloaded whole
+  and again in two resumed halves
+
+Results are written as JSON so they can be compared across commits. The
+app's lifespan is not run, so the scheduler and background workers stay
+off unless a scenario starts one, and only the scenario's own work is
+measured.
+
+Run from the backend directory with:
+python -m tests.benchmarks.load > load.json
+python -m tests.benchmarks.load --scenarios prompts --prompt-rps 50 --prompt-duration 5
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+import httpx
+
+from .fakes import FakeSMTP, FakeUpstreams, LocalServer
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+SCENARIOS = ("upload", "reminders", "sync", "prompts", "export")
+PROMPT_TYPES = (
+    "gratitude-focused questions",
+    "self-reflection questions",
+    "goal-setting questions",
+    "memory questions",
+    "mindfulness questions",
+)
+
+
+def latency_summary(latencies: List[float]) -> Dict:
+    """Summarize latencies in seconds as milliseconds."""
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+        "p50_ms": percentile(0.50),
+        "p90_ms": percentile(0.90),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def wait_for(condition, timeout: float) -> bool:
+    """Poll `condition` until it is true or `timeout` seconds have passed."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+
+async def scenario_upload(app_url: str, fakes: FakeUpstreams, args) -> Dict:
+    """Upload `upload_concurrency` files of `upload_size_mb` at the same time."""
+    users = [{"user_id": f"upload_user_{i}", "email": f"upload_user_{i}@example.com"} for i in range(args.upload_concurrency)]
+    fakes.db.seed("users", users)
+    fakes.db.seed("recordings", [])
+    stored_before = fakes.stored_bytes
+    content = os.urandom(1024 * 1024) * args.upload_size_mb
+
+    async def upload(client: httpx.AsyncClient, user_id: str):
+        started = time.perf_counter()
+        response = await client.post(
+            f"{app_url}/recordings/upload",
+            headers={"Authorization": f"Bearer {fakes.session_token(user_id)}"},
+            files={"file": ("recording.webm", content, "audio/webm")},
+            data={"file_type": "audio", "note": "benchmark", "tags": "[]"},
+        )
+        return response.status_code, time.perf_counter() - started
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=None) as client:
+        results = await asyncio.gather(*(upload(client, user["user_id"]) for user in users))
+    elapsed = time.perf_counter() - started
+
+    total_mb = args.upload_size_mb * len(users)
+    return {
+        "uploads": len(users),
+        "size_mb": args.upload_size_mb,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_mb_s": round(total_mb / elapsed, 1),
+        "statuses": dict(Counter(str(status) for status, _ in results)),
+        "latency": latency_summary([latency for _, latency in results]),
+        "stored_mb": round((fakes.stored_bytes - stored_before) / (1024 * 1024), 1),
+        "recordings_rows": len(fakes.db.tables["recordings"]),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def scenario_reminders(app_url: str, fakes: FakeUpstreams, args) -> Dict:
+    """Run one reminder tick over `reminder_rows` user_settings rows."""
+    import pytz
+    from app.jobs import create_worker
+
+    # The reminder check treats reminder times as America/New_York local time
+    local_now = datetime.now(pytz.timezone("America/New_York"))
+    due_time = local_now.strftime("%H:%M:00")
+    other_time = (local_now + timedelta(hours=12)).strftime("%H:%M:00")
+    long_ago = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+    recently = datetime.now(timezone.utc).isoformat()
+
+    rng = random.Random(args.seed)
+    rows = []
+    for i in range(args.reminder_rows):
+        rows.append({
+            "user_id": f"reminder_user_{i}",
+            "reminder_time": due_time if rng.random() < args.reminder_due_fraction else other_time,
+            "enable_weekly_reminder": rng.random() < 0.5,
+            # Stored the way the app selects it: user_settings joined with users
+            "users": {
+                "email": f"reminder_user_{i}@example.com",
+                "last_sign_in": long_ago if rng.random() < args.reminder_inactive_fraction else recently,
+            },
+        })
+    fakes.db.seed("user_settings", rows)
+    FakeSMTP.reset()
+    expected = sum(row["reminder_time"] == due_time for row in rows)
+    expected += sum(row["enable_weekly_reminder"] and row["users"]["last_sign_in"] == long_ago for row in rows)
+
+    # The endpoint only queues the check; the worker finds the users and sends the emails
+    worker = create_worker()
+    worker.start()
+    try:
+        async with httpx.AsyncClient(timeout=None) as client:
+            started = time.perf_counter()
+            response = await client.post(f"{app_url}/reminder/check-reminders")
+            endpoint_elapsed = time.perf_counter() - started
+
+        completed = await wait_for(lambda: len(FakeSMTP.sent) >= expected, timeout=args.timeout)
+        total_elapsed = time.perf_counter() - started
+    finally:
+        await worker.stop()
+
+    return {
+        "rows": len(rows),
+        "status": response.status_code,
+        "endpoint_s": round(endpoint_elapsed, 3),
+        "reminders_due": expected,
+        "emails_sent": len(FakeSMTP.sent),
+        "all_sent": completed,
+        "total_s": round(total_elapsed, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def scenario_sync(app_url: str, fakes: FakeUpstreams, args) -> Dict:
+    """Run perform_user_sync over `sync_users` users, a fraction of which were deleted in Clerk."""
+    from app.routes.sync import perform_user_sync
+
+    rng = random.Random(args.seed)
+    users = [{"user_id": f"sync_user_{i}"} for i in range(args.sync_users)]
+    fakes.db.seed("users", users)
+    fakes.deleted_clerk_users = {user["user_id"] for user in users if rng.random() < args.sync_deleted_fraction}
+    requests_before = Counter(fakes.requests)
+
+    started = time.perf_counter()
+    await perform_user_sync()
+    elapsed = time.perf_counter() - started
+
+    remaining = {user["user_id"] for user in fakes.db.tables["users"]}
+    requests = {upstream: fakes.requests[upstream] - requests_before[upstream] for upstream in ("supabase", "clerk")}
+    return {
+        "users": len(users),
+        "deleted_in_clerk": len(fakes.deleted_clerk_users),
+        "deleted_in_supabase": len(users) - len(remaining),
+        "stale_users_left": len(fakes.deleted_clerk_users & remaining),
+        "elapsed_s": round(elapsed, 3),
+        "users_per_s": round(len(users) / elapsed, 1),
+        "upstream_requests": requests,
+    }
+
+
+async def scenario_prompts(app_url: str, fakes: FakeUpstreams, args) -> Dict:
+    """Send POST /prompts/generate at `prompt_rps` for `prompt_duration` seconds (open loop)."""
+    total = int(args.prompt_rps * args.prompt_duration)
+    openrouter_before = fakes.requests["openrouter"]
+    results = []
+
+    async def generate(client: httpx.AsyncClient, prompt_type: str):
+        started = time.perf_counter()
+        try:
+            response = await client.post(f"{app_url}/prompts/generate", json={"promptType": prompt_type})
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        results.append((status, time.perf_counter() - started))
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        tasks = []
+        for i in range(total):
+            # Requests are sent on schedule whether or not earlier ones have finished
+            delay = started + i / args.prompt_rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(generate(client, PROMPT_TYPES[i % len(PROMPT_TYPES)])))
+        send_elapsed = time.perf_counter() - started
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "target_rps": args.prompt_rps,
+        "requests": total,
+        "sent_rps": round(total / send_elapsed, 1),
+        "completed_rps": round(total / elapsed, 1),
+        "statuses": dict(Counter(status for status, _ in results)),
+        "latency": latency_summary([latency for _, latency in results]),
+        "openrouter_requests": fakes.requests["openrouter"] - openrouter_before,
+    }
+
+
+async def scenario_export(app_url: str, fakes: FakeUpstreams, args) -> Dict:
+    """Download an export of `export_recordings` recordings of `export_size_mb` each, then resume one from the middle."""
+    user_id = "export_user"
+    size = args.export_size_mb * 1024 * 1024
+    fakes.db.seed("users", [{"user_id": user_id, "email": f"{user_id}@example.com"}])
+    rows = []
+    for i in range(args.export_recordings):
+        path = f"{user_id}/{i}.webm"
+        fakes.objects[path] = size
+        rows.append({
+            "user_id": user_id,
+            "created_at": (datetime(2024, 1, 1) + timedelta(days=i)).isoformat(),
+            "file_url": f"{fakes.url}/storage/v1/object/public/recordings/{path}",
+            "file_type": "audio",
+            "size_bytes": size,
+            "note": f"Entry {i}",
+            "tags": ["benchmark"],
+        })
+    fakes.db.seed("recordings", rows)
+    headers = {"Authorization": f"Bearer {fakes.session_token(user_id)}"}
+
+    async def download(client: httpx.AsyncClient, extra_headers: Dict, digest) -> tuple:
+        received = 0
+        async with client.stream("GET", f"{app_url}/export/recordings", headers={**headers, **extra_headers}) as response:
+            async for chunk in response.aiter_bytes():
+                received += len(chunk)
+                digest.update(chunk)
+            return response, received
+
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        started = time.perf_counter()
+        full = hashlib.sha256()
+        response, total = await download(client, {}, full)
+        elapsed = time.perf_counter() - started
+
+        # Resume from the middle of a file, as after an interrupted download
+        etag = response.headers.get("etag", "")
+        middle = total // 2
+        resumed = hashlib.sha256()
+        started = time.perf_counter()
+        first, first_bytes = await download(client, {"Range": f"bytes=0-{middle - 1}"}, resumed)
+        second, second_bytes = await download(client, {"Range": f"bytes={middle}-", "If-Range": etag}, resumed)
+        resume_elapsed = time.perf_counter() - started
+
+    return {
+        "recordings": len(rows),
+        "archive_mb": round(total / (1024 * 1024), 1),
+        "status": response.status_code,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_mb_s": round(total / (1024 * 1024) / elapsed, 1),
+        "resume_statuses": [first.status_code, second.status_code],
+        "resumed_matches_full": first_bytes + second_bytes == total and resumed.hexdigest() == full.hexdigest(),
+        "resume_elapsed_s": round(resume_elapsed, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def run_scenarios(app_url: str, fakes: FakeUpstreams, args) -> Dict:
+    runners = {
+        "upload": scenario_upload,
+        "reminders": scenario_reminders,
+        "sync": scenario_sync,
+        "prompts": scenario_prompts,
+        "export": scenario_export,
+    }
+    results = {}
+    for name in args.scenarios:
+        print(f"Running scenario: {name}", file=sys.stderr)
+        results[name] = await runners[name](app_url, fakes, args)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test against in-process fakes of every upstream")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--upload-concurrency", type=int, default=4, help="Uploads sent at the same time")
+    parser.add_argument("--upload-size-mb", type=int, default=100)
+    parser.add_argument("--reminder-rows", type=int, default=100_000, help="Rows in user_settings")
+    parser.add_argument("--reminder-due-fraction", type=float, default=0.01, help="Share of users whose daily reminder is due")
+    parser.add_argument("--reminder-inactive-fraction", type=float, default=0.05, help="Share of users inactive for over a week")
+    parser.add_argument("--sync-users", type=int, default=50_000, help="Rows in users for the sync")
+    parser.add_argument("--sync-deleted-fraction", type=float, default=0.01, help="Share of users deleted in Clerk")
+    parser.add_argument("--prompt-rps", type=float, default=200)
+    parser.add_argument("--prompt-duration", type=float, default=10, help="Seconds to send prompt requests for")
+    parser.add_argument("--export-recordings", type=int, default=20, help="Recordings in the exported archive")
+    parser.add_argument("--export-size-mb", type=int, default=50, help="Size of each exported recording")
+    parser.add_argument("--openrouter-latency-ms", type=float, default=500, help="Simulated OpenRouter response time")
+    parser.add_argument("--supabase-latency-ms", type=float, default=2, help="Simulated PostgREST and storage response time")
+    parser.add_argument("--clerk-latency-ms", type=float, default=5, help="Simulated Clerk API response time")
+    parser.add_argument("--smtp-latency-ms", type=float, default=20, help="Simulated time to send one email")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for a request or background work")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="WARNING", help="Log level of the app while benchmarking")
+    args = parser.parse_args()
+
+    fakes = FakeUpstreams(latency={
+        "supabase": args.supabase_latency_ms / 1000,
+        "storage": args.supabase_latency_ms / 1000,
+        "clerk": args.clerk_latency_ms / 1000,
+        "openrouter": args.openrouter_latency_ms / 1000,
+    }).start()
+    FakeSMTP.latency = args.smtp_latency_ms / 1000
+
+    # Point the app at the fakes before it is imported
+    os.environ.update(fakes.env())
+    os.environ["FAST_STARTUP"] = "true"
+    os.environ["CLERK_SYNC_DELAY"] = "0"
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="mycorner-benchmark-")
+    # The prompt scenario sends everything from one client; measure capacity, not the per-client limits
+    os.environ["RATE_LIMITS"] = ""
+
+    import logging
+    from app.main import app
+    from app.utils import email
+
+    logging.getLogger().setLevel(args.log_level)
+    email.smtplib.SMTP = FakeSMTP
+
+    server = LocalServer(app, name="app", lifespan="off").start()
+    try:
+        scenarios = asyncio.run(run_scenarios(server.url, fakes, args))
+    finally:
+        server.stop()
+        fakes.stop()
+
+    results = {
+        "benchmark": "load",
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "parameters": {name: value for name, value in vars(args).items() if name != "scenarios"},
+        "scenarios": scenarios,
+    }
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Logging overhead benchmark.
+
+Measures how long logging calls take on the calling thread (in the app,
+the event loop) with the old synchronous setup (`logging.basicConfig`) and
+with the queue-backed pipeline from app.utils.structured_logging, for
+plain INFO lines, records with exceptions and a rate-limited burst like
+the per-user lines of the reminder check. Results are printed as JSON.
+
+Run from the backend directory with:
+python -m tests.benchmarks.logging_overhead --records 50000
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+
+from app.utils.structured_logging import configure_logging, stop_logging
+
+
+class SlowStream:
+    """File wrapper that stalls on every write, like a backed-up pipe or log collector."""
+
+    def __init__(self, stream, delay: float):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, data: str):
+        time.sleep(self.delay)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def reset_logging():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def log_records(logger: logging.Logger, kind: str, count: int) -> float:
+    """Emit `count` records and return the time spent on this thread in seconds."""
+    started = time.perf_counter()
+    if kind == "info":
+        for i in range(count):
+            logger.info(f"User user_{i} local reminder time: 09:30:00, UTC: 13:30")
+    elif kind == "exception":
+        for i in range(count):
+            try:
+                raise ValueError(f"bad reminder time for user_{i}")
+            except ValueError:
+                logger.exception("Error processing reminder time")
+    return time.perf_counter() - started
+
+
+def measure(setup: str, sink: str, kind: str, count: int, runs: int, logger_name: str, rate_limit: float, slow_write: float) -> dict:
+    timings = []
+    for _ in range(runs):
+        reset_logging()
+        with tempfile.NamedTemporaryFile("w", suffix=".log") as log_file:
+            output = SlowStream(log_file, slow_write) if sink == "slow" else log_file
+            listener = None
+            if setup == "sync":
+                logging.basicConfig(level=logging.INFO, stream=output)
+            else:
+                rate_limits = {logger_name: rate_limit} if setup == "queue_rate_limited" else {}
+                listener = configure_logging(level="INFO", json_format=True, rate_limits=rate_limits, stream=output)
+
+            elapsed = log_records(logging.getLogger(logger_name), kind, count)
+            if listener is not None:
+                # Wait for the writer thread; this time is not on the caller's path
+                stop_logging(listener)
+            timings.append(elapsed)
+
+    median = statistics.median(timings)
+    return {
+        "setup": setup,
+        "sink": sink,
+        "records": kind,
+        "count": count,
+        "caller_total_ms": round(median * 1000, 2),
+        "caller_us_per_record": round(median / count * 1_000_000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure logging time on the calling thread")
+    parser.add_argument("--records", type=int, default=50_000, help="Records per run")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--rate-limit", type=float, default=20, help="Records per second for the rate-limited setup")
+    parser.add_argument("--slow-write-us", type=float, default=100, help="Stall per write of the slow sink")
+    args = parser.parse_args()
+
+    logger_name = "app.routes.reminder"
+    results = []
+    # A local file is the best case for synchronous logging; the slow sink is a stalled stderr pipe
+    for sink in ("file", "slow"):
+        for kind in ("info", "exception"):
+            count = args.records if kind == "info" else args.records // 10
+            for setup in ("sync", "queue", "queue_rate_limited"):
+                results.append(measure(setup, sink, kind, count, args.runs, logger_name, args.rate_limit, args.slow_write_us / 1_000_000))
+    reset_logging()
+
+    baseline = {(result["sink"], result["records"]): result["caller_us_per_record"] for result in results if result["setup"] == "sync"}
+    for result in results:
+        result["saved_vs_sync_pct"] = round(100 * (1 - result["caller_us_per_record"] / baseline[result["sink"], result["records"]]), 1)
+
+    json.dump({"benchmark": "logging_overhead", "python": sys.version.split()[0], "results": results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Media header parsing benchmark.
+
+Generates recordings the way browsers and encoders lay them out, without
+keeping them in memory, and feeds them through app.utils.media_probe in
+upload-sized chunks:
+
+- webm_recorder: MediaRecorder WebM (VP8 + Opus, unknown-size segment and
+  clusters, no duration in the header), so every block header is read
+- webm_muxed: WebM with the duration in its header, parsing stops early
+- mp4_moov_end: MP4 with the moov box after the media data
+- mp4_fragmented: fragmented MP4, one moof per second
+
+Reports the parse time per GB uploaded next to the time to copy the same
+bytes once (what the upload already does), and checks that the parsed
+duration, codecs and dimensions match what was generated. Results are
+printed as JSON.
+
+Run from the backend directory with:
+python -m tests.benchmarks.media_probe --gb 1
+"""
+
+import argparse
+import json
+import os
+import statistics
+import struct
+import sys
+import time
+from typing import Dict, Iterator, List
+
+from app.utils.media_probe import MediaProbe
+
+FPS = 30
+AUDIO_FRAME_MS = 20
+WIDTH, HEIGHT = 1280, 720
+
+
+def vint_size(size: int) -> bytes:
+    """EBML size, in 8 bytes like most muxers write it."""
+    return (size | (1 << 56)).to_bytes(8, "big")
+
+
+def ebml(element_id: int, payload: bytes = b"", unknown_size: bool = False) -> bytes:
+    id_bytes = element_id.to_bytes((element_id.bit_length() + 7) // 8, "big")
+    size = b"\x01\xff\xff\xff\xff\xff\xff\xff" if unknown_size else vint_size(len(payload))
+    return id_bytes + size + payload
+
+
+def ebml_uint(element_id: int, value: int) -> bytes:
+    return ebml(element_id, value.to_bytes(max((value.bit_length() + 7) // 8, 1), "big"))
+
+
+def box(box_type: bytes, payload: bytes = b"") -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type: bytes, version: int, flags: int, payload: bytes) -> bytes:
+    return box(box_type, bytes([version]) + flags.to_bytes(3, "big") + payload)
+
+
+def webm(seconds: int, video_frame: bytes, audio_frame: bytes, with_duration: bool) -> Iterator[bytes]:
+    info = ebml_uint(0x2AD7B1, 1_000_000) + ebml(0x4D80, b"benchmark")
+    if with_duration:
+        info += ebml(0x4489, struct.pack(">d", seconds * 1000.0))
+    tracks = ebml(0x1654AE6B, ebml(0xAE, ebml_uint(0xD7, 1) + ebml_uint(0x83, 2) + ebml(0x86, b"A_OPUS") + ebml(0xE1, ebml(0xB5, struct.pack(">f", 48000.0)) + ebml_uint(0x9F, 2)))
+                              + ebml(0xAE, ebml_uint(0xD7, 2) + ebml_uint(0x83, 1) + ebml(0x86, b"V_VP8") + ebml(0xE0, ebml_uint(0xB0, WIDTH) + ebml_uint(0xBA, HEIGHT))))
+    yield ebml(0x1A45DFA3, ebml(0x4282, b"webm")) + ebml(0x18538067, unknown_size=True)[:12] + ebml(0x1549A966, info) + tracks
+
+    for second in range(seconds):
+        blocks = []
+        for frame in range(FPS):
+            blocks.append(ebml(0xA3, b"\x82" + struct.pack(">hB", frame * 1000 // FPS, 0x80) + video_frame))
+        for frame in range(1000 // AUDIO_FRAME_MS):
+            blocks.append(ebml(0xA3, b"\x81" + struct.pack(">hB", frame * AUDIO_FRAME_MS, 0x80) + audio_frame))
+        # A cluster per second, as MediaRecorder writes them
+        yield ebml(0x1F43B675, unknown_size=True)[:12] + ebml_uint(0xE7, second * 1000) + b"".join(blocks)
+
+
+def mp4_track(track_id: int, handler: bytes, timescale: int, duration: int, entry: bytes) -> bytes:
+    tkhd = struct.pack(">IIIII", 0, 0, track_id, 0, duration) + bytes(8 + 8) + bytes(36)
+    tkhd += struct.pack(">II", WIDTH << 16, HEIGHT << 16) if handler == b"vide" else bytes(8)
+    mdhd = struct.pack(">IIII", 0, 0, timescale, duration) + bytes(4)
+    hdlr = struct.pack(">I4s", 0, handler) + bytes(12) + b"\x00"
+    stsd = full_box(b"stsd", 0, 0, struct.pack(">I", 1) + entry)
+    return box(b"trak", full_box(b"tkhd", 0, 3, tkhd) + box(b"mdia", full_box(b"mdhd", 0, 0, mdhd) + full_box(b"hdlr", 0, 0, hdlr) + box(b"minf", box(b"stbl", stsd))))
+
+
+def mp4_movie(seconds: int, fragmented: bool) -> bytes:
+    """Movie box; video is timed in frames and audio in milliseconds. Fragmented movies have no durations."""
+    video_entry = box(b"avc1", bytes(6) + struct.pack(">H", 1) + bytes(16) + struct.pack(">HH", WIDTH, HEIGHT) + bytes(50))
+    audio_entry = box(b"mp4a", bytes(6) + struct.pack(">H", 1) + bytes(8) + struct.pack(">HHHHI", 2, 16, 0, 0, 48000 << 16))
+    seconds = 0 if fragmented else seconds
+    mvhd = struct.pack(">IIII", 0, 0, 1000, seconds * 1000) + bytes(80)
+    movie = full_box(b"mvhd", 0, 0, mvhd)
+    movie += mp4_track(1, b"vide", FPS, seconds * FPS, video_entry) + mp4_track(2, b"soun", 1000, seconds * 1000, audio_entry)
+    if fragmented:
+        movie += box(b"mvex", full_box(b"trex", 0, 0, struct.pack(">IIIII", 1, 1, 1, 0, 0)) + full_box(b"trex", 0, 0, struct.pack(">IIIII", 2, 1, AUDIO_FRAME_MS, 0, 0)))
+    return box(b"moov", movie)
+
+
+def mp4(seconds: int, video_frame: bytes, audio_frame: bytes, fragmented: bool) -> Iterator[bytes]:
+    second_size = FPS * len(video_frame) + (1000 // AUDIO_FRAME_MS) * len(audio_frame)
+    ftyp = box(b"ftyp", b"isom" + struct.pack(">I", 512) + b"isomiso2avc1mp41")
+    if not fragmented:
+        yield ftyp + struct.pack(">I4sQ", 1, b"mdat", 16 + seconds * second_size)
+        for _ in range(seconds):
+            yield video_frame * FPS + audio_frame * (1000 // AUDIO_FRAME_MS)
+        yield mp4_movie(seconds, fragmented=False)
+        return
+
+    yield ftyp + mp4_movie(seconds, fragmented=True)
+    for second in range(seconds):
+        trafs = b""
+        # (track, samples per second, sample duration in the track's timescale)
+        for track_id, count, sample_duration in ((1, FPS, 1), (2, 1000 // AUDIO_FRAME_MS, AUDIO_FRAME_MS)):
+            tfhd = full_box(b"tfhd", 0, 0x020000, struct.pack(">I", track_id))
+            tfdt = full_box(b"tfdt", 1, 0, struct.pack(">Q", second * count * sample_duration))
+            trun = full_box(b"trun", 0, 0x300, struct.pack(">I", count) + struct.pack(">II", sample_duration, 0) * count)
+            trafs += box(b"traf", tfhd + tfdt + trun)
+        yield box(b"moof", full_box(b"mfhd", 0, 0, struct.pack(">I", second + 1)) + trafs)
+        yield struct.pack(">I4s", 8 + second_size, b"mdat") + video_frame * FPS + audio_frame * (1000 // AUDIO_FRAME_MS)
+
+
+def rechunk(parts: Iterator[bytes], chunk_size: int) -> Iterator[bytes]:
+    """Split generated data at arbitrary offsets, like reads of an upload."""
+    pending = b""
+    for part in parts:
+        pending += part
+        while len(pending) >= chunk_size:
+            yield pending[:chunk_size]
+            pending = pending[chunk_size:]
+    if pending:
+        yield pending
+
+
+def run(name: str, parts: Iterator[bytes], chunk_size: int, expected: Dict) -> Dict:
+    probe = MediaProbe()
+    parse_time = copy_time = 0.0
+    for chunk in rechunk(parts, chunk_size):
+        started = time.perf_counter()
+        bytearray(chunk)
+        copy_time += time.perf_counter() - started
+
+        started = time.perf_counter()
+        probe.feed(chunk)
+        parse_time += time.perf_counter() - started
+
+    result = probe.result()
+    gb = probe.size / 1e9
+    # Durations read from block timecodes are accurate to a frame
+    mismatches = {
+        key: result[key] for key, value in expected.items()
+        if (abs((result[key] or 0) - value) > 0.05 if key == "duration_seconds" else result[key] != value)
+    }
+    return {
+        "format": name,
+        "bytes": probe.size,
+        "parse_ms_per_gb": round(parse_time / gb * 1000, 2),
+        "parse_mb_per_s": round(probe.size / 1e6 / parse_time, 1) if parse_time else None,
+        "copy_ms_per_gb": round(copy_time / gb * 1000, 2),
+        "result": result,
+        "correct": not mismatches,
+        "mismatches": mismatches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure media header parsing time per GB uploaded")
+    parser.add_argument("--gb", type=float, default=1.0, help="Size of each generated recording")
+    parser.add_argument("--video-kbps", type=int, default=2500)
+    parser.add_argument("--audio-kbps", type=int, default=48)
+    parser.add_argument("--chunk-kb", type=int, default=1024, help="Size of the chunks fed to the parser")
+    parser.add_argument("--runs", type=int, default=1)
+    args = parser.parse_args()
+
+    video_frame = os.urandom(args.video_kbps * 1000 // 8 // FPS)
+    audio_frame = os.urandom(args.audio_kbps * 1000 // 8 * AUDIO_FRAME_MS // 1000)
+    second_size = FPS * len(video_frame) + (1000 // AUDIO_FRAME_MS) * len(audio_frame)
+    seconds = max(int(args.gb * 1e9 / second_size), 1)
+
+    expected = {"duration_seconds": float(seconds), "width": WIDTH, "height": HEIGHT}
+    formats = {
+        "webm_recorder": (lambda: webm(seconds, video_frame, audio_frame, with_duration=False), {"container": "webm", "video_codec": "vp8", "audio_codec": "opus"}),
+        "webm_muxed": (lambda: webm(seconds, video_frame, audio_frame, with_duration=True), {"container": "webm", "video_codec": "vp8", "audio_codec": "opus"}),
+        "mp4_moov_end": (lambda: mp4(seconds, video_frame, audio_frame, fragmented=False), {"container": "mp4", "video_codec": "h264", "audio_codec": "aac"}),
+        "mp4_fragmented": (lambda: mp4(seconds, video_frame, audio_frame, fragmented=True), {"container": "mp4", "video_codec": "h264", "audio_codec": "aac"}),
+    }
+
+    results = []
+    for name, (generate, codecs) in formats.items():
+        runs: List[Dict] = [run(name, generate(), args.chunk_kb * 1024, {**expected, **codecs}) for _ in range(args.runs)]
+        result = runs[0]
+        result["parse_ms_per_gb"] = statistics.median(r["parse_ms_per_gb"] for r in runs)
+        results.append(result)
+
+    json.dump({
+        "benchmark": "media_probe",
+        "python": sys.version.split()[0],
+        "recording_seconds": seconds,
+        "video_kbps": args.video_kbps,
+        "audio_kbps": args.audio_kbps,
+        "chunk_kb": args.chunk_kb,
+        "results": results,
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the MyCorner backend.
+
+Imports app.main in fresh interpreters, in the default and the fast startup
+mode, and reports wall-clock import time plus an import-time breakdown per
+module (from `python -X importtime`) as JSON, so cold-start regressions can
+be compared across commits.
+
+Run from the backend directory with:
+python -m tests.benchmarks.startup --runs 5 > startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+
+# Placeholder configuration so the app imports without a .env file; nothing connects to it
+BENCHMARK_ENV = {
+    "SUPABASE_URL": "http://127.0.0.1:9",
+    "SUPABASE_KEY": "eyJhbGciOiJIUzI1NiJ9.e30.benchmark",
+    "CLERK_SECRET_KEY": "sk_test_benchmark",
+}
+
+
+def run_import(fast_startup: bool, data_dir: str):
+    """Import app.main in a new interpreter and return (wall time in ms, importtime output)."""
+    env = dict(os.environ)
+    for name, value in BENCHMARK_ENV.items():
+        env.setdefault(name, value)
+    env["FAST_STARTUP"] = "true" if fast_startup else "false"
+    env["DATA_DIR"] = data_dir
+
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing app.main failed:\n{result.stderr[-2000:]}")
+    return elapsed_ms, result.stderr
+
+
+def parse_importtime(output: str):
+    """
+    Parse `-X importtime` output.
+
+    Returns:
+        dict: Per module, its self and cumulative import time in ms
+    """
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules[name.strip()] = {"self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000}
+    return modules
+
+
+def summarize(modules: dict, top: int):
+    """Group import time by top-level package and pick out the app's own modules."""
+    packages = defaultdict(float)
+    for name, timing in modules.items():
+        packages[name.split(".")[0]] += timing["self_ms"]
+
+    app_modules = {
+        name: round(timing["cumulative_ms"], 2)
+        for name, timing in modules.items()
+        if name == "app" or name.startswith("app.")
+    }
+
+    slowest = sorted(modules.items(), key=lambda item: item[1]["self_ms"], reverse=True)[:top]
+
+    return {
+        "packages_self_ms": {name: round(ms, 2) for name, ms in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]},
+        "app_modules_cumulative_ms": dict(sorted(app_modules.items(), key=lambda item: item[1], reverse=True)),
+        "slowest_modules_self_ms": {name: round(timing["self_ms"], 2) for name, timing in slowest},
+    }
+
+
+def benchmark_mode(fast_startup: bool, runs: int, top: int, data_dir: str):
+    wall_times = []
+    breakdown = None
+    for _ in range(runs):
+        elapsed_ms, output = run_import(fast_startup, data_dir)
+        wall_times.append(elapsed_ms)
+        # Keep the breakdown of the last run, when file system caches are warm
+        breakdown = summarize(parse_importtime(output), top)
+
+    return {
+        "fast_startup": fast_startup,
+        "runs": runs,
+        "wall_ms": {
+            "min": round(min(wall_times), 2),
+            "median": round(statistics.median(wall_times), 2),
+            "max": round(max(wall_times), 2),
+        },
+        **breakdown,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backend cold start")
+    parser.add_argument("--runs", type=int, default=5, help="Interpreter starts per mode")
+    parser.add_argument("--top", type=int, default=15, help="Number of packages and modules to list")
+    parser.add_argument("--data-dir", default=os.path.join(BACKEND_DIR, "data", "benchmark"))
+    args = parser.parse_args()
+
+    results = {
+        "benchmark": "startup",
+        "python": sys.version.split()[0],
+        "modes": [benchmark_mode(fast_startup, args.runs, args.top, args.data_dir) for fast_startup in (False, True)],
+    }
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+
+# app.config.settings refuses to load without Supabase settings; tests never reach these
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.test")
+os.environ.setdefault("FAST_STARTUP", "1")
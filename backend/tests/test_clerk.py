@@ -0,0 +1,178 @@
+"""
+Tests for Clerk session token verification, with locally generated keys.
+
+Tokens are signed with RSA keys made for each test, and the JWKS fetch is
+injected, so no test talks to Clerk.
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+
+from app.utils import auth, clerk
+from app.utils.clerk import ClaimsCache, ClerkTokenVerifier, JWKSCache, get_clerk_user_data
+
+ISSUER = "https://clerk.example.test"
+
+
+class KeySet:
+    """RSA signing keys by kid, served as a JWKS through `fetch`, which counts its calls."""
+
+    def __init__(self, *kids: str):
+        self.keys = {kid: rsa.generate_private_key(public_exponent=65537, key_size=2048) for kid in kids}
+        self.fetches = 0
+        self.fetch_threads = []
+
+    def add(self, kid: str):
+        self.keys[kid] = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def fetch(self):
+        self.fetches += 1
+        self.fetch_threads.append(threading.current_thread())
+        jwks = []
+        for kid, key in self.keys.items():
+            jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+            jwks.append({**jwk, "kid": kid, "use": "sig"})
+        return {"keys": jwks}
+
+    def token(self, kid: str, ttl: float = 300, **claims) -> str:
+        now = int(time.time())
+        payload = {"sub": "user_1", "iss": ISSUER, "iat": now, "nbf": now, "exp": now + ttl, **claims}
+        return jwt.encode(payload, self.keys[kid], algorithm="RS256", headers={"kid": kid})
+
+
+@pytest.fixture
+def keys():
+    return KeySet("key_1")
+
+
+def make_verifier(keys: KeySet, min_refresh_interval: float = 60.0, **kwargs) -> ClerkTokenVerifier:
+    return ClerkTokenVerifier(JWKSCache(keys.fetch, min_refresh_interval=min_refresh_interval), issuer=ISSUER, leeway=0, **kwargs)
+
+
+def test_valid_token(keys):
+    claims = make_verifier(keys).verify(keys.token("key_1"))
+    assert claims["sub"] == "user_1"
+    assert keys.fetches == 1
+
+
+def test_expired_token(keys):
+    with pytest.raises(jwt.ExpiredSignatureError):
+        make_verifier(keys).verify(keys.token("key_1", ttl=-10))
+
+
+def test_unknown_kid_refreshes_keys(keys):
+    verifier = make_verifier(keys, min_refresh_interval=0)
+    verifier.verify(keys.token("key_1"))
+
+    # Clerk rotated its keys since the set was fetched
+    keys.add("key_2")
+    assert verifier.verify(keys.token("key_2"))["sub"] == "user_1"
+    assert keys.fetches == 2
+
+
+def test_unknown_kid_refreshes_at_most_once_per_interval(keys):
+    verifier = make_verifier(keys)
+    verifier.verify(keys.token("key_1"))
+
+    keys.add("made_up")
+    forged = keys.token("made_up")
+    del keys.keys["made_up"]
+    with pytest.raises(jwt.InvalidKeyError):
+        verifier.verify(forged)
+    assert keys.fetches == 1
+
+    # Past the interval, one more refresh for however many unknown key ids
+    verifier.jwks._attempted_at -= 60
+    for _ in range(3):
+        with pytest.raises(jwt.InvalidKeyError):
+            verifier.verify(forged)
+    assert keys.fetches == 2
+
+
+def test_wrong_algorithm(keys):
+    token = jwt.encode({"sub": "user_1", "iss": ISSUER, "exp": int(time.time()) + 300, "iat": int(time.time())},
+                       "shared-secret-of-at-least-32-bytes!", algorithm="HS256", headers={"kid": "key_1"})
+    with pytest.raises(jwt.InvalidAlgorithmError):
+        make_verifier(keys).verify(token)
+    assert keys.fetches == 0
+
+
+def test_bad_issuer(keys):
+    with pytest.raises(jwt.InvalidIssuerError):
+        make_verifier(keys).verify(keys.token("key_1", iss="https://attacker.example.test"))
+
+
+def test_unauthorized_party(keys):
+    verifier = make_verifier(keys, authorized_parties=["https://app.example.test"])
+    assert verifier.verify(keys.token("key_1", azp="https://app.example.test"))["sub"] == "user_1"
+    with pytest.raises(jwt.InvalidTokenError):
+        verifier.verify(keys.token("key_1", azp="https://attacker.example.test"))
+
+
+def test_claims_cache_hit_skips_verification(keys):
+    verifier = make_verifier(keys)
+    token = keys.token("key_1")
+    verifier.verify(token)
+
+    def no_keys(kid):
+        raise AssertionError("A cached token was verified again")
+
+    verifier.jwks.get_key = no_keys
+    assert verifier.verify(token)["sub"] == "user_1"
+
+
+def test_claims_cache_expiry():
+    cache = ClaimsCache()
+    cache.put("token", {"sub": "user_1", "exp": time.time() + 60})
+    assert cache.get("token")["sub"] == "user_1"
+
+    cache.put("token", {"sub": "user_1", "exp": time.time() - 1})
+    assert cache.get("token") is None
+
+
+def test_claims_cache_is_bounded():
+    cache = ClaimsCache(max_size=2)
+    for name in ("a", "b", "c"):
+        cache.put(name, {"sub": name, "exp": time.time() + 60})
+    assert cache.get("a") is None
+    assert cache.get("c")["sub"] == "c"
+
+
+def test_invalid_tokens_are_401(keys):
+    verifier = make_verifier(keys)
+    # Signed with a key Clerk never published
+    unknown_kid = KeySet("key_unknown").token("key_unknown")
+    for authorization in ("Token abc", f"Bearer {keys.token('key_1', ttl=-10)}", "Bearer not-a-jwt", f"Bearer {unknown_kid}"):
+        with pytest.raises(HTTPException) as error:
+            get_clerk_user_data(authorization, verifier)
+        assert error.value.status_code == 401
+
+
+def test_malformed_jwks_is_401(keys):
+    verifier = ClerkTokenVerifier(JWKSCache(lambda: {"keys": [{"kid": "key_1", "kty": "RSA", "n": "?", "e": "?"}]}), issuer=ISSUER)
+    with pytest.raises(HTTPException) as error:
+        get_clerk_user_data(f"Bearer {keys.token('key_1')}", verifier)
+    assert error.value.status_code == 401
+
+
+def test_current_user_verifies_off_the_event_loop(keys, monkeypatch):
+    monkeypatch.setattr(clerk, "clerk_token_verifier", make_verifier(keys))
+
+    async def row_id(user_id):
+        return 1
+
+    monkeypatch.setattr(auth, "resolve_user_row_id", row_id)
+
+    async def current_user():
+        return threading.current_thread(), await auth.get_current_user(f"Bearer {keys.token('key_1')}")
+
+    loop_thread, user = asyncio.run(current_user())
+    assert user["user_id"] == "user_1"
+    assert keys.fetch_threads and keys.fetch_threads[0] is not loop_thread
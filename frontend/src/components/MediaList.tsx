@@ -4,8 +4,9 @@ import { toZonedTime } from "date-fns-tz";
 import { Card, CardTitle } from "./ui/card";
 import { Loader2, Tag, X } from "lucide-react";
 import { createClient } from "@supabase/supabase-js";
-import { useUser } from "@clerk/clerk-react";
+import { useAuth, useUser } from "@clerk/clerk-react";
 import MediaLayout from "./layouts/MediaLayout";
+import { API_BASE_URL } from "../api/config";
 
 const supabase = createClient(
   import.meta.env.VITE_SUPABASE_URL,
@@ -30,6 +31,7 @@ export default function MediaList() {
 
   const [isLoading, setIsLoading] = useState(true);
   const { user, isLoaded } = useUser();
+  const { getToken } = useAuth();
 
   useEffect(() => {
     if (isLoaded && user) {
@@ -100,23 +102,19 @@ export default function MediaList() {
 
   const handleDeleteRecording = async (recording: Recording) => {
     try {
-      // Delete from storage
-      const filePath = recording.file_url.split("/").pop();
-      if (filePath) {
-        const { error: storageError } = await supabase.storage
-          .from("recordings")
-          .remove([filePath]);
-
-        if (storageError) throw storageError;
-      }
-
-      // Delete from database
-      const { error: dbError } = await supabase
-        .from("recordings")
-        .delete()
-        .eq("id", recording.id);
+      // The API removes the stored file and the row, and updates the usage counters and search index
+      const token = await getToken();
+      const response = await fetch(`${API_BASE_URL}/recordings/${recording.id}`, {
+        method: "DELETE",
+        headers: { Authorization: `Bearer ${token}` },
+      });
 
-      if (dbError) throw dbError;
+      if (!response.ok) {
+        const errorData = await response.json().catch(() => null);
+        throw new Error(
+          errorData?.detail || `Failed to delete recording: ${response.status}`
+        );
+      }
 
       // Update local state
       setRecordings((prev) => prev.filter((r) => r.id !== recording.id));
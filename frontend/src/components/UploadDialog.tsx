@@ -9,7 +9,7 @@ import {
   DialogTitle,
   DialogFooter,
 } from "./ui/dialog";
-import { useUser } from "@clerk/clerk-react";
+import { useAuth, useUser } from "@clerk/clerk-react";
 import { Progress } from "./ui/progress"; 
 import OPTIONS from "./../lib/options";
 
@@ -47,6 +47,7 @@ export default function UploadDialog({
   const [uploadProgress, setUploadProgress] = useState(0);
   const [selectedTags, setSelectedTags] = useState<Option[]>([]);
   const { user } = useUser();
+  const { getToken } = useAuth();
   const typeToSend = fileType;
 
   const handleUpload = async () => {
@@ -58,7 +59,6 @@ export default function UploadDialog({
     const formData = new FormData();
     formData.append("file", file);
     formData.append("file_type", typeToSend);
-    formData.append("user_id", user.id);
     if (note) {
       formData.append("note", note);
     }
@@ -95,7 +95,10 @@ export default function UploadDialog({
       // Show error to user here
     };
 
+    const token = await getToken();
+
     xhr.open("POST", "http://localhost:8000/recordings/upload");
+    xhr.setRequestHeader("Authorization", `Bearer ${token}`);
     xhr.send(formData);
   };
 
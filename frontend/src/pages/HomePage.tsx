@@ -11,6 +11,10 @@ export default function HomePage() {
     async function syncUserData() {
       if (!user) return;
 
+      // Profile changes reach the backend through Clerk webhooks, so one sync per browser session is enough
+      const syncKey = `user-synced:${user.id}`;
+      if (sessionStorage.getItem(syncKey)) return;
+
       try {
         // Get user data from Clerk
         const userData = {
@@ -34,6 +38,7 @@ export default function HomePage() {
           }
         );
         console.log("User data synced:", response.data);
+        sessionStorage.setItem(syncKey, "1");
       } catch (error) {
         console.error("Failed to sync user data:", error);
       }